@@ -0,0 +1,12 @@
+from cryfs.e2etest.bench.bench_app import BenchApplication
+import sys
+
+
+def main() -> None:
+    app = BenchApplication()
+    app.start()
+    sys.exit(app.exit_code)
+
+
+if __name__ == '__main__':
+    main()
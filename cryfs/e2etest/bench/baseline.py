@@ -0,0 +1,216 @@
+from typing import Any, Dict, List, Optional
+import attr
+import hashlib
+import json
+import os
+import platform
+import re
+import sys
+import time
+from cryfs.e2etest.bench.regression import MetricComparison, compare_metric
+from cryfs.e2etest.utils.async_subprocess import check_call_subprocess
+
+
+BASELINE_SCHEMA_VERSION = 1
+# Number of samples kept per metric. Saving more samples drops the oldest ones.
+MAX_SAMPLES = 30
+# File system operation latencies are only compared if there were at least this many operations, p99 of fewer is noise
+MIN_FS_OPS = 100
+
+
+@attr.s(auto_attribs=True)
+class Metric(object):
+    higher_is_better: bool
+    samples: List[float] = attr.Factory(list)
+
+
+async def cryfs_version(cryfs_executable: str) -> str:
+    out = await check_call_subprocess(cryfs_executable, "--version", env={"CRYFS_NO_UPDATE_CHECK": "true"}, throw_on_error=False)
+    match = re.search(r'CryFS Version ([^\s]+)', out.stdout.decode('UTF-8', errors='replace'))
+    if match is None:
+        return "unknown"
+    return match.group(1)
+
+
+def _read_first_match(path: str, pattern: str) -> Optional[str]:
+    try:
+        with open(path, 'r') as file:
+            match = re.search(pattern, file.read(), re.MULTILINE)
+    except OSError:
+        return None
+    return match.group(1).strip() if match is not None else None
+
+
+# Describes the machine benchmarks ran on. Baselines are only compared on the same kind of machine.
+def host_fingerprint() -> Dict[str, Any]:
+    return {
+        "system": platform.system(),
+        "machine": platform.machine(),
+        "cpu_model": _read_first_match("/proc/cpuinfo", r'^model name\s*:(.*)$'),
+        "cpu_count": os.cpu_count(),
+        "memory": _read_first_match("/proc/meminfo", r'^MemTotal:(.*)$'),
+    }
+
+
+def host_id(fingerprint: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode('UTF-8')).hexdigest()[:16]
+
+
+# Converts the JSON output of `cryfs-e2etest-bench run` into metrics
+def metrics_from_bench_results(results: Dict[str, Any]) -> Dict[str, Metric]:
+    metrics: Dict[str, Metric] = {}
+
+    def add(name: str, higher_is_better: bool, value: float) -> None:
+        metrics.setdefault(name, Metric(higher_is_better=higher_is_better)).samples.append(value)
+    for result in results["results"]:
+        if result["bytes"] > 0:
+            add(result["name"] + ".mb_per_s", True, result["mb_per_s"])
+        add(result["name"] + ".ops_per_s", True, result["ops_per_s"])
+        if "p99" in result["latency"]:
+            add(result["name"] + ".latency_p99", False, result["latency"]["p99"])
+    return metrics
+
+
+# Converts the JSON report of `cryfs-e2etest --json-report` into metrics. Failed test cases are skipped, their timings aren't
+# meaningful, and so are cached ones, their timings are from an earlier run.
+def metrics_from_test_report(report: Dict[str, Any]) -> Dict[str, Metric]:
+    metrics: Dict[str, Metric] = {}
+    for result in report["results"]:
+        if result["status"] != "SUCCESS" or result.get("cached", False):
+            continue
+        metrics[result["name"] + ".duration"] = Metric(higher_is_better=False, samples=[result["metrics"]["duration"]])
+        for phase, duration in result["metrics"]["phases"].items():
+            if duration > 0:
+                metrics[result["name"] + "." + phase] = Metric(higher_is_better=False, samples=[duration])
+        daemon = result["metrics"].get("daemon", [])
+        if len(daemon) > 0:
+            metrics[result["name"] + ".daemon_peak_rss_mb"] = Metric(
+                higher_is_better=False, samples=[max(usage["peak_rss_bytes"] for usage in daemon) / 1024 / 1024])
+            metrics[result["name"] + ".daemon_cpu_time"] = Metric(
+                higher_is_better=False, samples=[sum(usage["user_time"] + usage["system_time"] for usage in daemon)])
+        for name, value in result["metrics"].get("throughput", {}).items():
+            metrics[result["name"] + "." + name] = Metric(higher_is_better=True, samples=[value])
+        for fs_op in result["metrics"].get("fs_ops", []):
+            if fs_op["latency"]["count"] >= MIN_FS_OPS:
+                metrics["%s.%s.%s.p99" % (result["name"], fs_op["op"], fs_op["size"])] = Metric(
+                    higher_is_better=False, samples=[fs_op["latency"]["p99"]])
+    return metrics
+
+
+def metrics_from_json(data: Dict[str, Any]) -> Dict[str, Metric]:
+    if "results" in data and len(data["results"]) > 0 and "metrics" in data["results"][0]:
+        return metrics_from_test_report(data)
+    return metrics_from_bench_results(data)
+
+
+# Stores metric samples as versioned JSON files in `<baseline_dir>/<host id>/<kind>/<cryfs version>.json`,
+# where kind is e.g. "bench" or "phases".
+class BaselineStore(object):
+    def __init__(self, baseline_dir: str) -> None:
+        self._baseline_dir = baseline_dir
+        self._fingerprint = host_fingerprint()
+
+    def _path(self, kind: str, version: str) -> str:
+        filename = re.sub(r'[^A-Za-z0-9._+-]+', '_', version) + ".json"
+        return os.path.join(self._baseline_dir, host_id(self._fingerprint), kind, filename)
+
+    def load(self, kind: str, version: str) -> Optional[Dict[str, Metric]]:
+        path = self._path(kind, version)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as file:
+            data = json.load(file)
+        if data.get("schema_version") != BASELINE_SCHEMA_VERSION:
+            return None
+        return {name: Metric(higher_is_better=metric["higher_is_better"], samples=metric["samples"])
+                for name, metric in data["metrics"].items()}
+
+    # Adds the samples to the baseline of this version, keeping the most recent MAX_SAMPLES samples per metric
+    def save(self, kind: str, version: str, metrics: Dict[str, Metric]) -> str:
+        existing = self.load(kind, version) or {}
+        for name, metric in metrics.items():
+            merged = existing.setdefault(name, Metric(higher_is_better=metric.higher_is_better))
+            merged.samples = (merged.samples + metric.samples)[-MAX_SAMPLES:]
+        path = self._path(kind, version)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({
+                "schema_version": BASELINE_SCHEMA_VERSION,
+                "cryfs_version": version,
+                "host": self._fingerprint,
+                "updated": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "metrics": {name: attr.asdict(metric) for name, metric in sorted(existing.items())},
+            }, file, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+    # Versions that have a baseline on this host, most recently updated first
+    def versions(self, kind: str) -> List[str]:
+        dir = os.path.dirname(self._path(kind, "x"))
+        if not os.path.isdir(dir):
+            return []
+        files = [os.path.join(dir, name) for name in os.listdir(dir) if name.endswith(".json")]
+        result = []
+        for path in sorted(files, key=os.path.getmtime, reverse=True):
+            with open(path, 'r') as file:
+                result.append(str(json.load(file).get("cryfs_version")))
+        return result
+
+
+def compare_metrics(baseline: Dict[str, Metric], current: Dict[str, Metric]) -> List[MetricComparison]:
+    result = []
+    for name in sorted(current.keys()):
+        if name in baseline:
+            comparison = compare_metric(name, current[name].higher_is_better, baseline[name].samples, current[name].samples)
+            if comparison is not None:
+                result.append(comparison)
+    return result
+
+
+# Prints the comparison to stderr (stdout can be the JSON results) and returns True iff there is a significant slowdown above the threshold
+def report_regressions(comparisons: List[MetricComparison], threshold_percent: float) -> bool:
+    regressions = [comparison for comparison in comparisons if comparison.is_regression(threshold_percent)]
+    print("-------------------------", file=sys.stderr)
+    print("Performance compared to baseline (threshold: %.1f%%)" % threshold_percent, file=sys.stderr)
+    print("-------------------------", file=sys.stderr)
+    for comparison in comparisons:
+        marker = "REGRESSION" if comparison.is_regression(threshold_percent) else "ok"
+        print("[%s] %s" % (marker, comparison.to_string()), file=sys.stderr)
+    print(file=sys.stderr)
+    print("%d of %d metrics regressed" % (len(regressions), len(comparisons)), file=sys.stderr)
+    return len(regressions) > 0
+
+
+# The baseline to compare against: the requested version, or else the most recently updated baseline of another version,
+# or else earlier runs of the same version.
+def select_baseline_version(store: BaselineStore, kind: str, current_version: str, requested_version: Optional[str]) -> Optional[str]:
+    if requested_version is not None:
+        return requested_version
+    versions = store.versions(kind)
+    others = [version for version in versions if version != current_version]
+    if len(others) > 0:
+        return others[0]
+    if current_version in versions:
+        return current_version
+    return None
+
+
+# Compares the metrics against the stored baseline (if there is one) and then adds them to the baseline of the current version.
+# Returns True iff there is a significant slowdown above the threshold.
+def check_and_save_baseline(baseline_dir: str, kind: str, current_version: str, metrics: Dict[str, Metric],
+                            compare: bool, save: bool, requested_version: Optional[str], threshold_percent: float) -> bool:
+    store = BaselineStore(baseline_dir)
+    regressed = False
+    if compare:
+        baseline_version = select_baseline_version(store, kind, current_version, requested_version)
+        baseline = store.load(kind, baseline_version) if baseline_version is not None else None
+        if baseline is None:
+            print("No %s baseline found in %s, nothing to compare against" % (kind, baseline_dir), file=sys.stderr)
+        else:
+            print("Comparing CryFS %s against baseline of CryFS %s" % (current_version, baseline_version), file=sys.stderr)
+            regressed = report_regressions(compare_metrics(baseline, metrics), threshold_percent)
+    if save:
+        path = store.save(kind, current_version, metrics)
+        print("Saved %s baseline to %s" % (kind, path), file=sys.stderr)
+    return regressed
@@ -0,0 +1,286 @@
+from typing import Any, Dict, List, Optional
+import argparse
+import json
+import os
+import re
+import sys
+from cryfs.e2etest.bench.baseline import check_and_save_baseline, cryfs_version, metrics_from_json
+from cryfs.e2etest.bench.cache import CacheResult, CacheVariant, format_cache_results, run_cache_benchmark
+from cryfs.e2etest.bench.mount_profile import format_summary, profile_fixture, profile_new_filesystem, summarize
+from cryfs.e2etest.bench.replay import REPLAY_MODES, replay_on_mount
+from cryfs.e2etest.bench.runner import run_workloads
+from cryfs.e2etest.bench.storage import format_reports, measure_storage
+from cryfs.e2etest.compatibility_test import fixtures
+from cryfs.e2etest.readwrite_test import fixtures as readwrite_fixtures
+from cryfs.e2etest.bench.workloads import IWorkload, Metadata, RandomReadWrite, Readdir, SequentialReadWrite
+from cryfs.e2etest.fsmounter import CryfsMounter
+from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.utils.async_app import AsyncApp
+from cryfs.e2etest.utils.fs_trace import TRACE_SUFFIX, load_trace
+from cryfs.e2etest.utils.sizes import parse_size
+from cryfs.e2etest.utils.synthetic import DatasetShape
+
+
+WORKLOADS = ['sequential', 'random', 'metadata', 'readdir']
+
+
+class BenchApplication(AsyncApp):
+    def __init__(self) -> None:
+        self.args = self._parse_args()
+        self.exit_code = 0
+
+    def _parse_args(self) -> argparse.Namespace:
+        parser = argparse.ArgumentParser(description='Benchmark CryFS throughput and latency.')
+        subparsers = parser.add_subparsers(dest='command')
+        subparsers.required = True
+
+        run = subparsers.add_parser('run', help='Run benchmark workloads on a fresh CryFS file system and print the results as JSON.')
+        run.add_argument('--cryfs-executable', default='/usr/bin/cryfs')
+        run.add_argument('--workloads', default=','.join(WORKLOADS),
+                         help='Comma separated list of workloads to run. Available: %s' % ', '.join(WORKLOADS))
+        run.add_argument('--file-sizes', default='4K,1M,64M',
+                         help='Comma separated file sizes for the sequential workload.')
+        run.add_argument('--random-file-size', default='64M', help='File size for the random 4K workload.')
+        run.add_argument('--random-ops', type=int, default=2000, help='Number of reads and writes for the random 4K workload.')
+        run.add_argument('--metadata-files', type=int, default=1000, help='Number of small files for the metadata workload.')
+        run.add_argument('--readdir-entries', default='1000,10000',
+                         help='Comma separated directory sizes for the readdir workload.')
+        run.add_argument('--repetitions', type=int, default=1,
+                         help='Run all workloads this many times. More repetitions give tighter confidence intervals when comparing against baselines.')
+        run.add_argument('--output', default=None, help='Write the JSON results to this file instead of stdout.')
+        _add_baseline_args(run)
+
+        mount_profile = subparsers.add_parser('mount-profile',
+                                              help='Measure mount and unmount latency of the compatibility fixtures, broken down by phase.')
+        mount_profile.add_argument('--cryfs-executable', default='/usr/bin/cryfs')
+        mount_profile.add_argument('--cycles', type=int, default=10, help='Number of mount/unmount cycles per fixture.')
+        mount_profile.add_argument('--fixtures', default=None,
+                                   help='Only profile fixtures whose name matches this regular expression. Default: all fixtures.')
+        mount_profile.add_argument('--skip-new-filesystem', action='store_true',
+                                   help='Don\'t profile creating a new file system.')
+        mount_profile.add_argument('--output', default=None, help='Write the JSON results to this file instead of stdout.')
+
+        storage = subparsers.add_parser('storage',
+                                        help='Measure disk space overhead and write amplification of CryFS for each data fixture.')
+        storage.add_argument('--cryfs-executable', action='append', required=True,
+                             help='CryFS executable to measure. Can be given multiple times to compare versions.')
+        storage.add_argument('--blocksizes', default=None,
+                             help='Comma separated block sizes (in bytes) to create the file systems with. Default: the CryFS default.')
+        storage.add_argument('--output', default=None, help='Write the JSON results to this file instead of stdout.')
+
+        replay = subparsers.add_parser('replay', help='Replay file system operation traces (see "cryfs-e2etest --record-traces") '
+                                                      'on a fresh CryFS file system and print throughput and latency as JSON.')
+        replay.add_argument('traces', nargs='+', help='Trace files to replay')
+        replay.add_argument('--cryfs-executable', default='/usr/bin/cryfs')
+        replay.add_argument('--mode', choices=REPLAY_MODES, default='fast',
+                            help='"fast" runs the operations back to back, "timed" keeps the timing of the trace.')
+        replay.add_argument('--parallel', type=int, default=1,
+                            help='Replay this many copies of each trace at the same time, each in its own directory.')
+        replay.add_argument('--repetitions', type=int, default=1, help='Replay each trace this many times, each time on a fresh file system.')
+        replay.add_argument('--output', default=None, help='Write the JSON results to this file instead of stdout.')
+        _add_baseline_args(replay)
+
+        cache = subparsers.add_parser('cache', help='Write a generated dataset, then remount and time reading it with cold and with warm '
+                                                    'CryFS caches, and print the results as JSON.')
+        cache.add_argument('--cryfs-executable', default='/usr/bin/cryfs')
+        cache.add_argument('--shape', default='files=1000,depth=2,fanout=10,sizes=lognormal:64K:1.5:16M,seed=1',
+                           help='Shape of the generated dataset, see cryfs-e2etest --synthetic.')
+        cache.add_argument('--cycles', type=int, default=5, help='Number of remounts, each with a cold and a warm read.')
+        cache.add_argument('--variant', action='append', default=None,
+                           help='Run with these CryFS options, e.g. "small-blocks=--blocksize 4096" or "name=CRYFS_VARIABLE=value". '
+                                'NAME=value words are set as environment variables. Can be given multiple times. Default: no extra options.')
+        cache.add_argument('--drop-page-cache', action='store_true',
+                           help='Evict each file from the kernel page cache before reading it, so warm reads measure the CryFS caches only.')
+        cache.add_argument('--output', default=None, help='Write the JSON results to this file instead of stdout.')
+        _add_baseline_args(cache)
+
+        compare = subparsers.add_parser('compare', help='Compare the JSON output of "run" or of "cryfs-e2etest --json-report" against a baseline.')
+        compare.add_argument('results', help='JSON file with the results to compare')
+        compare.add_argument('--cryfs-version', required=True, help='CryFS version the results were measured with')
+        compare.add_argument('--baseline-dir', required=True)
+        compare.add_argument('--baseline-version', default=None,
+                             help='CryFS version to compare against. Default: the most recently stored baseline of another version.')
+        compare.add_argument('--threshold', type=float, default=5.0,
+                             help='Fail if a metric got significantly slower by more than this many percent.')
+        compare.add_argument('--save', action='store_true', help='Also add the results to the baseline of --cryfs-version')
+        return parser.parse_args()
+
+    async def main(self) -> None:
+        if self.args.command == 'run':
+            await self._run()
+        elif self.args.command == 'mount-profile':
+            await self._mount_profile()
+        elif self.args.command == 'storage':
+            await self._storage()
+        elif self.args.command == 'replay':
+            await self._replay()
+        elif self.args.command == 'cache':
+            await self._cache()
+        elif self.args.command == 'compare':
+            self._compare()
+
+    def _workloads(self) -> List[IWorkload]:
+        selected = [name.strip() for name in self.args.workloads.split(',') if name.strip() != '']
+        for name in selected:
+            if name not in WORKLOADS:
+                raise ValueError("Unknown workload: %s" % name)
+        result: List[IWorkload] = []
+        if 'sequential' in selected:
+            result += [SequentialReadWrite(file_size=parse_size(size)) for size in self.args.file_sizes.split(',')]
+        if 'random' in selected:
+            result.append(RandomReadWrite(file_size=parse_size(self.args.random_file_size), num_ops=self.args.random_ops))
+        if 'metadata' in selected:
+            result.append(Metadata(num_files=self.args.metadata_files))
+        if 'readdir' in selected:
+            result += [Readdir(num_entries=int(num_entries)) for num_entries in self.args.readdir_entries.split(',')]
+        return result
+
+    async def _run(self) -> None:
+        logger = Logger()
+        mounter = CryfsMounter(self.args.cryfs_executable)
+        results: List[Dict[str, Any]] = []
+        for repetition in range(self.args.repetitions):
+            for result in await run_workloads(mounter, self._workloads(), logger):
+                print(result.to_string(), file=sys.stderr)
+                results.append(dict(result.to_json(), repetition=repetition))
+        if logger.contains_entry_with_level(LogLevel.ERROR) or logger.contains_entry_with_level(LogLevel.FATAL):
+            print(logger.to_string(), file=sys.stderr)
+            self.exit_code = 1
+        data = {
+            "cryfs_executable": self.args.cryfs_executable,
+            "cryfs_version": await cryfs_version(self.args.cryfs_executable),
+            "repetitions": self.args.repetitions,
+            "results": results,
+        }
+        self._output(data)
+        if self.args.baseline_dir is not None:
+            if check_and_save_baseline(self.args.baseline_dir, "bench", data["cryfs_version"], metrics_from_json(data),
+                                       compare=self.args.compare_baseline, save=self.args.save_baseline,
+                                       requested_version=self.args.baseline_version, threshold_percent=self.args.threshold):
+                self.exit_code = 1
+
+    async def _mount_profile(self) -> None:
+        logger = Logger()
+        mounter = CryfsMounter(self.args.cryfs_executable)
+        summaries = []
+        if not self.args.skip_new_filesystem:
+            summaries.append(summarize("new file system", await profile_new_filesystem(mounter, self.args.cycles, logger)))
+        for fixture in fixtures:
+            if self.args.fixtures is None or re.search(self.args.fixtures, fixture.name()) is not None:
+                summaries.append(summarize(fixture.name(), await profile_fixture(mounter, fixture, self.args.cycles, logger)))
+        if logger.contains_entry_with_level(LogLevel.ERROR) or logger.contains_entry_with_level(LogLevel.FATAL):
+            print(logger.to_string(), file=sys.stderr)
+            self.exit_code = 1
+        print(format_summary(summaries), file=sys.stderr)
+        self._output({
+            "cryfs_executable": self.args.cryfs_executable,
+            "cryfs_version": await cryfs_version(self.args.cryfs_executable),
+            "mount_profiles": summaries,
+        })
+
+    async def _storage(self) -> None:
+        logger = Logger()
+        blocksizes: List[Optional[int]] = [None]
+        if self.args.blocksizes is not None:
+            blocksizes = [int(blocksize) for blocksize in self.args.blocksizes.split(',')]
+        results = []
+        for executable in self.args.cryfs_executable:
+            version = await cryfs_version(executable)
+            for blocksize in blocksizes:
+                mounter = CryfsMounter(executable, extra_args=["--blocksize", str(blocksize)] if blocksize is not None else [])
+                for fixture in readwrite_fixtures:
+                    report = await measure_storage(mounter, fixture, logger)
+                    results.append(dict(report.to_json(), cryfs_executable=executable, cryfs_version=version,
+                                        blocksize=blocksize, fixture=fixture.name()))
+        if logger.contains_entry_with_level(LogLevel.ERROR) or logger.contains_entry_with_level(LogLevel.FATAL):
+            print(logger.to_string(), file=sys.stderr)
+            self.exit_code = 1
+        print(format_reports(results), file=sys.stderr)
+        self._output({"storage": results})
+
+    async def _replay(self) -> None:
+        logger = Logger()
+        mounter = CryfsMounter(self.args.cryfs_executable)
+        results: List[Dict[str, Any]] = []
+        for trace_path in self.args.traces:
+            events = load_trace(trace_path)
+            trace_name = os.path.basename(trace_path)
+            if trace_name.endswith(TRACE_SUFFIX):
+                trace_name = trace_name[:-len(TRACE_SUFFIX)]
+            name = "replay_%s_%s_x%d" % (trace_name, self.args.mode, self.args.parallel)
+            for repetition in range(self.args.repetitions):
+                result = await replay_on_mount(mounter, events, name, self.args.mode, self.args.parallel, logger)
+                print(result.to_string(), file=sys.stderr)
+                if result.num_errors > 0:
+                    self.exit_code = 1
+                results.append(dict(result.to_json(), trace=trace_path, repetition=repetition))
+        if logger.contains_entry_with_level(LogLevel.ERROR) or logger.contains_entry_with_level(LogLevel.FATAL):
+            print(logger.to_string(), file=sys.stderr)
+            self.exit_code = 1
+        data = {
+            "cryfs_executable": self.args.cryfs_executable,
+            "cryfs_version": await cryfs_version(self.args.cryfs_executable),
+            "repetitions": self.args.repetitions,
+            "results": results,
+        }
+        self._output(data)
+        if self.args.baseline_dir is not None:
+            if check_and_save_baseline(self.args.baseline_dir, "bench", data["cryfs_version"], metrics_from_json(data),
+                                       compare=self.args.compare_baseline, save=self.args.save_baseline,
+                                       requested_version=self.args.baseline_version, threshold_percent=self.args.threshold):
+                self.exit_code = 1
+
+    async def _cache(self) -> None:
+        logger = Logger()
+        shape = DatasetShape.parse(self.args.shape)
+        variants = [CacheVariant.parse(spec) for spec in self.args.variant] if self.args.variant is not None else [CacheVariant(name="default")]
+        results: List[CacheResult] = []
+        for variant in variants:
+            mounter = CryfsMounter(self.args.cryfs_executable, extra_args=variant.extra_args, extra_env=variant.extra_env)
+            results.append(await run_cache_benchmark(mounter, variant, shape, self.args.cycles, self.args.drop_page_cache, logger))
+        if logger.contains_entry_with_level(LogLevel.ERROR) or logger.contains_entry_with_level(LogLevel.FATAL):
+            print(logger.to_string(), file=sys.stderr)
+            self.exit_code = 1
+        print(format_cache_results(results), file=sys.stderr)
+        data = {
+            "cryfs_executable": self.args.cryfs_executable,
+            "cryfs_version": await cryfs_version(self.args.cryfs_executable),
+            "shape": shape.to_string(),
+            "cycles": self.args.cycles,
+            "cache": [result.to_json() for result in results],
+            "results": [bench_result for result in results for bench_result in result.bench_results()],
+        }
+        self._output(data)
+        if self.args.baseline_dir is not None:
+            if check_and_save_baseline(self.args.baseline_dir, "bench", data["cryfs_version"], metrics_from_json(data),
+                                       compare=self.args.compare_baseline, save=self.args.save_baseline,
+                                       requested_version=self.args.baseline_version, threshold_percent=self.args.threshold):
+                self.exit_code = 1
+
+    def _compare(self) -> None:
+        with open(self.args.results, 'r') as file:
+            data = json.load(file)
+        kind = "bench" if "cryfs_executable" in data else "phases"
+        if check_and_save_baseline(self.args.baseline_dir, kind, self.args.cryfs_version, metrics_from_json(data),
+                                   compare=True, save=self.args.save,
+                                   requested_version=self.args.baseline_version, threshold_percent=self.args.threshold):
+            self.exit_code = 1
+
+    def _output(self, data: Dict[str, Any]) -> None:
+        if self.args.output is not None:
+            with open(self.args.output, 'w') as file:
+                json.dump(data, file, indent=2)
+        else:
+            json.dump(data, sys.stdout, indent=2)
+            print()
+
+
+def _add_baseline_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--baseline-dir', default=None, help='Directory with stored baselines.')
+    parser.add_argument('--save-baseline', action='store_true', help='Add the results to the baseline of this CryFS version in --baseline-dir.')
+    parser.add_argument('--compare-baseline', action='store_true',
+                        help='Compare the results against a baseline in --baseline-dir and exit with an error on significant slowdowns.')
+    parser.add_argument('--baseline-version', default=None,
+                        help='CryFS version to compare against. Default: the most recently stored baseline of another version.')
+    parser.add_argument('--threshold', type=float, default=5.0,
+                        help='Fail if a metric got significantly slower by more than this many percent.')
@@ -0,0 +1,193 @@
+from typing import Any, Dict, List, Optional
+import attr
+import os
+import re
+import shlex
+import statistics
+import time
+from cryfs.e2etest.bench.runner import BENCHMARK_PASSWORD
+from cryfs.e2etest.bench.workloads import drop_page_cache
+from cryfs.e2etest.fsmounter import IFsMounter
+from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.utils.executor import AsyncTemporaryDirectory, run_blocking, run_in_thread
+from cryfs.e2etest.utils.histogram import LatencyHistogram, format_latency
+from cryfs.e2etest.utils.synthetic import DatasetShape, verify_dataset, write_dataset
+
+
+# Size of the read() calls of a read pass
+READ_BLOCK_SIZE = 1024 * 1024
+_ENV_ASSIGNMENT = re.compile(r'^[A-Z_][A-Z0-9_]*=')
+
+
+# A set of CryFS options to run the benchmark with
+@attr.s(auto_attribs=True)
+class CacheVariant(object):
+    name: str
+    extra_args: List[str] = attr.Factory(list)
+    extra_env: Dict[str, str] = attr.Factory(dict)
+
+    # Parses "name=ARGS", e.g. "small-blocks=--blocksize 4096" or "myvariant=CRYFS_SOMETHING=1 --some-flag".
+    # Words that look like NAME=value with an upper case NAME are environment variables, the others are arguments.
+    @staticmethod
+    def parse(spec: str) -> 'CacheVariant':
+        name, _, options = spec.partition('=')
+        if name.strip() == '':
+            raise ValueError("Invalid variant %s, expected name=ARGS" % spec)
+        variant = CacheVariant(name=name.strip())
+        for word in shlex.split(options):
+            if _ENV_ASSIGNMENT.match(word):
+                key, _, value = word.partition('=')
+                variant.extra_env[key] = value
+            else:
+                variant.extra_args.append(word)
+        return variant
+
+
+# Timings of reading all files of the dataset once
+@attr.s(auto_attribs=True)
+class ReadPass(object):
+    num_files: int = 0
+    num_bytes: int = 0
+    duration: float = 0.0
+    # Time from the start of the pass until the first byte of the first file arrived
+    first_byte: float = 0.0
+    # Time from opening each file until its first byte arrived
+    ttfb: LatencyHistogram = attr.Factory(LatencyHistogram)
+
+    def mb_per_s(self) -> float:
+        return self.num_bytes / self.duration / 1024 / 1024 if self.duration > 0 else 0.0
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "files": self.num_files,
+            "bytes": self.num_bytes,
+            "duration": self.duration,
+            "mb_per_s": self.mb_per_s(),
+            "first_byte": self.first_byte,
+            "ttfb": self.ttfb.summary(),
+        }
+
+
+@attr.s(auto_attribs=True)
+class CacheCycle(object):
+    # First read after mounting, the CryFS caches are empty
+    cold: ReadPass
+    # Second read in the same mount
+    warm: ReadPass
+
+    def speedup(self) -> float:
+        return self.cold.duration / self.warm.duration if self.warm.duration > 0 else float('inf')
+
+
+# Reads all regular files below `dir` completely, in sorted order. With drop_kernel_cache, each file is evicted
+# from the kernel page cache first, so the reads reach CryFS even if it was read before.
+def read_pass(dir: str, drop_kernel_cache: bool = False) -> ReadPass:
+    result = ReadPass()
+    start = time.perf_counter()
+    for dirpath, dirnames, filenames in os.walk(dir):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path):
+                continue
+            if drop_kernel_cache:
+                drop_page_cache(path)
+            open_start = time.perf_counter()
+            with open(path, 'rb', buffering=0) as file:
+                block = file.read(READ_BLOCK_SIZE)
+                first_byte = time.perf_counter()
+                result.ttfb.record(first_byte - open_start)
+                if result.num_files == 0:
+                    result.first_byte = first_byte - start
+                while block:
+                    result.num_bytes += len(block)
+                    block = file.read(READ_BLOCK_SIZE)
+            result.num_files += 1
+    result.duration = time.perf_counter() - start
+    return result
+
+
+@attr.s(auto_attribs=True)
+class CacheResult(object):
+    variant: CacheVariant
+    cycles: List[CacheCycle] = attr.Factory(list)
+
+    def _ttfb(self, cold: bool) -> LatencyHistogram:
+        result = LatencyHistogram()
+        for cycle in self.cycles:
+            result.merge(cycle.cold.ttfb if cold else cycle.warm.ttfb)
+        return result
+
+    def summary(self) -> Dict[str, Any]:
+        if len(self.cycles) == 0:
+            return {}
+        return {
+            "cold_duration": statistics.median(cycle.cold.duration for cycle in self.cycles),
+            "warm_duration": statistics.median(cycle.warm.duration for cycle in self.cycles),
+            "speedup": statistics.median(cycle.speedup() for cycle in self.cycles),
+            "cold_first_byte": statistics.median(cycle.cold.first_byte for cycle in self.cycles),
+            "warm_first_byte": statistics.median(cycle.warm.first_byte for cycle in self.cycles),
+            "cold_ttfb": self._ttfb(cold=True).summary(),
+            "warm_ttfb": self._ttfb(cold=False).summary(),
+        }
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "variant": attr.asdict(self.variant),
+            "cycles": [{"cold": cycle.cold.to_json(), "warm": cycle.warm.to_json(), "speedup": cycle.speedup()} for cycle in self.cycles],
+            "summary": self.summary(),
+        }
+
+    # One entry per read pass, in the format of WorkloadResult.to_json(), so the results work with baselines
+    def bench_results(self) -> List[Dict[str, Any]]:
+        results = []
+        for cycle in self.cycles:
+            for kind, read in [("cold", cycle.cold), ("warm", cycle.warm)]:
+                results.append({
+                    "name": "cache_%s_read_%s" % (kind, self.variant.name),
+                    "ops": read.num_files,
+                    "bytes": read.num_bytes,
+                    "duration": read.duration,
+                    "mb_per_s": read.mb_per_s(),
+                    "ops_per_s": read.num_files / read.duration if read.duration > 0 else 0.0,
+                    "latency": read.ttfb.summary(),
+                })
+        return results
+
+
+# Writes the dataset with the variant's options, then `cycles` times remounts and reads it twice
+async def run_cache_benchmark(mounter: IFsMounter, variant: CacheVariant, shape: DatasetShape, cycles: int,
+                              drop_kernel_cache: bool, logger: Logger) -> CacheResult:
+    result = CacheResult(variant=variant)
+    async with AsyncTemporaryDirectory() as basedir:
+        async with mounter.mount(basedir, BENCHMARK_PASSWORD, logger) as mountdir:
+            await run_blocking(write_dataset, shape, mountdir)
+        for cycle in range(cycles):
+            async with mounter.mount(basedir, BENCHMARK_PASSWORD, logger) as mountdir:
+                cold = await run_in_thread(read_pass, mountdir, drop_kernel_cache)
+                warm = await run_in_thread(read_pass, mountdir, drop_kernel_cache)
+                if cycle == cycles - 1:
+                    # Check the data only at the end, so checking doesn't warm up the caches of the measured reads
+                    for error in await run_blocking(verify_dataset, shape, mountdir):
+                        logger.log(LogLevel.ERROR, error)
+            result.cycles.append(CacheCycle(cold=cold, warm=warm))
+    return result
+
+
+def format_cache_results(results: List[CacheResult]) -> str:
+    lines = ["%-20s %10s %10s %8s %12s %12s %12s %12s" % (
+        "variant", "cold read", "warm read", "speedup", "cold ttfb50", "warm ttfb50", "cold ttfb99", "warm ttfb99")]
+    for result in results:
+        summary = result.summary()
+        if len(summary) == 0:
+            continue
+        lines.append("%-20s %9.3fs %9.3fs %7.2fx %12s %12s %12s %12s" % (
+            result.variant.name, summary["cold_duration"], summary["warm_duration"], summary["speedup"],
+            _format_percentile(summary["cold_ttfb"], "p50"), _format_percentile(summary["warm_ttfb"], "p50"),
+            _format_percentile(summary["cold_ttfb"], "p99"), _format_percentile(summary["warm_ttfb"], "p99")))
+    return "\n".join(lines) + "\n"
+
+
+def _format_percentile(summary: Dict[str, float], name: str) -> str:
+    value: Optional[float] = summary.get(name)
+    return format_latency(value)
@@ -0,0 +1,61 @@
+from typing import Any, Dict, List
+import tempfile
+from cryfs.e2etest.bench.runner import BENCHMARK_PASSWORD
+from cryfs.e2etest.compatibility_test import Fixture
+from cryfs.e2etest.fsmounter import IFsMounter
+from cryfs.e2etest.test_framework.logger import Logger
+from cryfs.e2etest.test_framework.metrics import TestMetrics
+from cryfs.e2etest.utils.cryfs_log import MountProfile
+from cryfs.e2etest.utils.histogram import LatencyHistogram
+
+
+# Mounts and unmounts a snapshot of the fixture's encoded file system `cycles` times.
+# Each cycle gets a fresh snapshot, so file system upgrades are measured in every cycle and not only in the first one.
+async def profile_fixture(mounter: IFsMounter, fixture: Fixture, cycles: int, logger: Logger) -> List[MountProfile]:
+    metrics = TestMetrics()
+    for _ in range(cycles):
+        async with fixture.unpack_encoded(snapshot=True, logger=logger) as basedir:
+            async with mounter.mount(basedir, fixture.password(), logger, metrics):
+                pass
+    return metrics.mount_profiles
+
+
+# Like profile_fixture, but each cycle creates a new file system, i.e. measures creating the config and deriving a new key
+async def profile_new_filesystem(mounter: IFsMounter, cycles: int, logger: Logger) -> List[MountProfile]:
+    metrics = TestMetrics()
+    for _ in range(cycles):
+        with tempfile.TemporaryDirectory() as basedir:
+            async with mounter.mount(basedir, BENCHMARK_PASSWORD, logger, metrics):
+                pass
+    return metrics.mount_profiles
+
+
+def _latency_summary(durations: List[float]) -> Dict[str, float]:
+    histogram = LatencyHistogram()
+    for duration in durations:
+        histogram.record(duration)
+    return histogram.summary()
+
+
+def summarize(name: str, profiles: List[MountProfile]) -> Dict[str, Any]:
+    phase_names = sorted({phase for profile in profiles for phase in profile.phases.keys()})
+    return {
+        "name": name,
+        "cycles": len(profiles),
+        "invocation": _latency_summary([profile.invocation for profile in profiles]),
+        "mount": _latency_summary([profile.mount for profile in profiles]),
+        "unmount": _latency_summary([profile.unmount for profile in profiles]),
+        # A phase missing in the log of a cycle counts as 0 for that cycle
+        "phases": {phase: _latency_summary([profile.phases.get(phase, 0.0) for profile in profiles]) for phase in phase_names},
+    }
+
+
+def format_summary(summaries: List[Dict[str, Any]]) -> str:
+    lines = ["%-70s %10s %10s %10s  %s" % ("fixture", "mount p50", "mount p99", "unmount p50", "phases (p50)")]
+    for summary in summaries:
+        if summary["cycles"] == 0:
+            continue
+        phases = ", ".join("%s %.3fs" % (phase, stats["p50"]) for phase, stats in summary["phases"].items())
+        lines.append("%-70s %9.3fs %9.3fs %10.3fs  %s" % (
+            summary["name"], summary["mount"]["p50"], summary["mount"]["p99"], summary["unmount"]["p50"], phases))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,106 @@
+from typing import List, Optional
+import attr
+import math
+
+
+# Two-sided 95% quantiles of Student's t-distribution, indexed by degrees of freedom
+_T_95 = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+    11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131, 16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093, 20: 2.086,
+    21: 2.080, 22: 2.074, 23: 2.069, 24: 2.064, 25: 2.060, 26: 2.056, 27: 2.052, 28: 2.048, 29: 2.045, 30: 2.042,
+    40: 2.021, 60: 2.000, 120: 1.980,
+}
+
+
+def t_quantile_95(degrees_of_freedom: float) -> float:
+    # Rounding the degrees of freedom down gives a slightly larger, i.e. more conservative, quantile
+    df = int(math.floor(degrees_of_freedom))
+    if df < 1:
+        return float('inf')
+    if df > 120:
+        return 1.960
+    return _T_95[max(key for key in _T_95.keys() if key <= df)]
+
+
+def mean(samples: List[float]) -> float:
+    return sum(samples) / len(samples)
+
+
+def variance(samples: List[float]) -> float:
+    if len(samples) < 2:
+        return 0.0
+    sample_mean = mean(samples)
+    return sum((sample - sample_mean) ** 2 for sample in samples) / (len(samples) - 1)
+
+
+# Half width of the 95% confidence interval of the mean
+def confidence_interval(samples: List[float]) -> float:
+    if len(samples) < 2:
+        return float('inf')
+    return t_quantile_95(len(samples) - 1) * math.sqrt(variance(samples) / len(samples))
+
+
+@attr.s(auto_attribs=True)
+class MetricComparison(object):
+    name: str
+    higher_is_better: bool
+    baseline_mean: float
+    baseline_ci: float
+    current_mean: float
+    current_ci: float
+    # Relative change of the mean in percent. Positive means worse, i.e. slower.
+    slowdown_percent: float
+    # False if there aren't enough samples to tell whether the change is significant
+    enough_samples: bool
+    significant: bool
+
+    def is_regression(self, threshold_percent: float) -> bool:
+        return self.significant and self.slowdown_percent > threshold_percent
+
+    def to_string(self) -> str:
+        return "%s: %.6g (+-%.3g) -> %.6g (+-%.3g), %+.1f%% slower%s" % (
+            self.name, self.baseline_mean, self.baseline_ci, self.current_mean, self.current_ci, self.slowdown_percent,
+            " (significant)" if self.significant else (" (not enough samples)" if not self.enough_samples else ""))
+
+
+# Compares the samples of one metric against its baseline samples.
+# With at least two samples on each side, this uses Welch's t-test: the slowdown is significant if the whole
+# 95% confidence interval of the difference of means is on the slower side.
+# With only one current sample, it is significant if it is outside the 95% prediction interval of the baseline samples.
+def compare_metric(name: str, higher_is_better: bool, baseline: List[float], current: List[float]) -> Optional[MetricComparison]:
+    if len(baseline) == 0 or len(current) == 0:
+        return None
+    baseline_mean = mean(baseline)
+    current_mean = mean(current)
+    # Positive difference means slower
+    difference = (baseline_mean - current_mean) if higher_is_better else (current_mean - baseline_mean)
+    if baseline_mean != 0:
+        slowdown_percent = 100 * difference / abs(baseline_mean)
+    else:
+        slowdown_percent = 0.0 if difference == 0 else math.copysign(float('inf'), difference)
+
+    if len(baseline) >= 2 and len(current) >= 2:
+        baseline_var = variance(baseline) / len(baseline)
+        current_var = variance(current) / len(current)
+        standard_error = math.sqrt(baseline_var + current_var)
+        if standard_error == 0:
+            significant = difference > 0
+        else:
+            df = (baseline_var + current_var) ** 2 / (
+                baseline_var ** 2 / (len(baseline) - 1) + current_var ** 2 / (len(current) - 1))
+            significant = difference - t_quantile_95(df) * standard_error > 0
+        enough_samples = True
+    elif len(baseline) >= 2:
+        prediction_interval = t_quantile_95(len(baseline) - 1) * math.sqrt(variance(baseline) * (1 + 1 / len(baseline)))
+        significant = difference > prediction_interval
+        enough_samples = True
+    else:
+        significant = False
+        enough_samples = False
+
+    return MetricComparison(
+        name=name, higher_is_better=higher_is_better,
+        baseline_mean=baseline_mean, baseline_ci=confidence_interval(baseline),
+        current_mean=current_mean, current_ci=confidence_interval(current),
+        slowdown_percent=slowdown_percent, enough_samples=enough_samples, significant=significant,
+    )
@@ -0,0 +1,211 @@
+from typing import Any, Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import attr
+import errno
+import os
+import threading
+import time
+from cryfs.e2etest.bench.runner import BENCHMARK_PASSWORD
+from cryfs.e2etest.fsmounter import IFsMounter
+from cryfs.e2etest.test_framework.logger import Logger
+from cryfs.e2etest.utils.executor import AsyncTemporaryDirectory, run_in_thread
+from cryfs.e2etest.utils.fs_trace import TraceEvent
+from cryfs.e2etest.utils.histogram import LatencyHistogram
+from cryfs.e2etest.utils.instrumented_fs import Fs, FsOpStats, InstrumentedFs
+
+
+REPLAY_MODES = ['fast', 'timed']
+# Only this many mismatches are listed, the others are only counted
+_MAX_LISTED_ERRORS = 20
+
+
+@attr.s(auto_attribs=True)
+class ReplayResult(object):
+    name: str
+    mode: str
+    parallel: int
+    num_ops: int = 0
+    # Bytes read and written
+    num_bytes: int = 0
+    # Wall-clock time of the whole replay
+    duration: float = 0.0
+    # In timed mode, how much later than in the trace an operation started, at most. A high lag means
+    # the file system couldn't keep up with the original timing.
+    max_schedule_lag: float = 0.0
+    # Operations that failed while they succeeded in the trace, or the other way round
+    num_errors: int = 0
+    errors: List[str] = attr.Factory(list)
+    fs_ops: FsOpStats = attr.Factory(FsOpStats)
+
+    def ops_per_s(self) -> float:
+        return self.num_ops / self.duration if self.duration > 0 else 0.0
+
+    def mb_per_s(self) -> float:
+        return self.num_bytes / self.duration / 1024 / 1024 if self.duration > 0 else 0.0
+
+    def latency(self) -> LatencyHistogram:
+        result = LatencyHistogram()
+        for histogram in self.fs_ops.histograms.values():
+            result.merge(histogram)
+        return result
+
+    # Same fields as WorkloadResult.to_json(), so replays work with baselines, plus the latencies by operation
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "mode": self.mode,
+            "parallel": self.parallel,
+            "ops": self.num_ops,
+            "bytes": self.num_bytes,
+            "duration": self.duration,
+            "mb_per_s": self.mb_per_s(),
+            "ops_per_s": self.ops_per_s(),
+            "latency": self.latency().summary(),
+            "max_schedule_lag": self.max_schedule_lag,
+            "num_errors": self.num_errors,
+            "errors": self.errors,
+            "fs_ops": self.fs_ops.to_json(),
+        }
+
+    def to_string(self) -> str:
+        return "%s (%s, %d parallel): %d ops in %.3fs, %.1f ops/s, %.2f MB/s, %d errors, latency %s" % (
+            self.name, self.mode, self.parallel, self.num_ops, self.duration, self.ops_per_s(), self.mb_per_s(),
+            self.num_errors, self.latency().to_string())
+
+
+# Replays the operations of one lane of the trace in one copy of the trace's directory tree
+class _LaneReplayer(object):
+    def __init__(self, root: str, fs: Fs, handles: Dict[int, int], data: bytes, result: ReplayResult, lock: threading.Lock) -> None:
+        self._root = root
+        self._fs = fs
+        # Trace handles to file descriptors, shared by the lanes of a copy
+        self._handles = handles
+        self._data = data
+        self._result = result
+        self._lock = lock
+
+    def run(self, events: List[TraceEvent], start: float, timed: bool) -> None:
+        num_bytes = 0
+        max_lag = 0.0
+        for event in events:
+            if timed:
+                delay = start + event.time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    max_lag = max(max_lag, -delay)
+            num_bytes += self._replay(event)
+        with self._lock:
+            self._result.num_bytes += num_bytes
+            self._result.max_schedule_lag = max(self._result.max_schedule_lag, max_lag)
+
+    def _replay(self, event: TraceEvent) -> int:
+        try:
+            num_bytes = self._apply(event)
+        except OSError as e:
+            error = errno.errorcode.get(e.errno or 0, str(e.errno))
+            if error != event.error:
+                self._error("%s %s failed with %s, but %s in the trace" % (
+                    event.op, event.path, error, "with " + event.error if event.error != '' else "succeeded"))
+            return 0
+        except KeyError:
+            self._error("%s %s uses file handle %d, which isn't open" % (event.op, event.path, event.handle))
+            return 0
+        if event.error != '':
+            self._error("%s %s succeeded, but failed with %s in the trace" % (event.op, event.path, event.error))
+        return num_bytes
+
+    def _error(self, message: str) -> None:
+        with self._lock:
+            self._result.num_errors += 1
+            if len(self._result.errors) < _MAX_LISTED_ERRORS:
+                self._result.errors.append(message)
+
+    def _path(self, relative: str) -> str:
+        return os.path.normpath(os.path.join(self._root, relative))
+
+    # Does the operation and returns the number of bytes read or written
+    def _apply(self, event: TraceEvent) -> int:
+        fs = self._fs
+        path = self._path(event.path)
+        if event.op == "open":
+            fd = fs.open(path, event.flags, event.mode)
+            with self._lock:
+                self._handles[event.handle] = fd
+        elif event.op == "close":
+            with self._lock:
+                fd = self._handles.pop(event.handle)
+            fs.close(fd)
+        elif event.op == "read":
+            return len(fs.read(self._handles[event.handle], event.size))
+        elif event.op == "pread":
+            return len(fs.pread(self._handles[event.handle], event.size, event.offset))
+        elif event.op == "write":
+            return fs.write(self._handles[event.handle], self._data[:event.size])
+        elif event.op == "pwrite":
+            return fs.pwrite(self._handles[event.handle], self._data[:event.size], event.offset)
+        elif event.op == "fsync":
+            fs.fsync(self._handles[event.handle])
+        elif event.op == "stat":
+            fs.stat(path, event.follow_symlinks)
+        elif event.op == "listdir":
+            fs.listdir(path)
+        elif event.op == "rename":
+            fs.rename(path, self._path(event.target))
+        elif event.op == "link":
+            fs.link(path, self._path(event.target))
+        elif event.op == "unlink":
+            fs.unlink(path)
+        elif event.op == "mkdir":
+            fs.mkdir(path, event.mode)
+        elif event.op == "symlink":
+            fs.symlink(event.target, path)
+        elif event.op == "chmod":
+            fs.chmod(path, event.mode)
+        elif event.op == "utime":
+            fs.utime(path, (event.atime_ns, event.mtime_ns), event.follow_symlinks)
+        elif event.op == "lchown":
+            fs.lchown(path, event.uid, event.gid)
+        else:
+            raise ValueError("Unknown operation in trace: %s" % event.op)
+        return 0
+
+
+def _lanes(events: List[TraceEvent]) -> List[List[TraceEvent]]:
+    lanes: Dict[int, List[TraceEvent]] = {}
+    for event in events:
+        lanes.setdefault(event.lane, []).append(event)
+    return [lanes[lane] for lane in sorted(lanes.keys())]
+
+
+# Replays the trace in `dir`. With parallel > 1, that many copies of the trace run at the same time, each in its own
+# subdirectory. Within a copy, each lane runs in its own thread. In 'fast' mode, each lane runs its operations back to back,
+# in 'timed' mode each operation starts at the same time (relative to the start) as in the trace.
+def replay_trace(events: List[TraceEvent], dir: str, name: str, mode: str = 'fast', parallel: int = 1) -> ReplayResult:
+    if mode not in REPLAY_MODES:
+        raise ValueError("Unknown replay mode %s. Supported: %s" % (mode, ", ".join(REPLAY_MODES)))
+    result = ReplayResult(name=name, mode=mode, parallel=parallel, num_ops=len(events) * parallel)
+    fs = InstrumentedFs(result.fs_ops)
+    lock = threading.Lock()
+    data = os.urandom(max([event.size for event in events if event.op in ("write", "pwrite")], default=0))
+    lanes = _lanes(events)
+    jobs: List[Tuple[_LaneReplayer, List[TraceEvent]]] = []
+    for copy in range(parallel):
+        root = os.path.join(dir, "copy%d" % copy)
+        os.mkdir(root)
+        handles: Dict[int, int] = {}
+        jobs += [(_LaneReplayer(root, fs, handles, data, result, lock), lane) for lane in lanes]
+    with ThreadPoolExecutor(max_workers=max(1, len(jobs))) as executor:
+        start = time.perf_counter()
+        futures = [executor.submit(replayer.run, lane, start, mode == 'timed') for replayer, lane in jobs]
+        for future in futures:
+            future.result()
+        result.duration = time.perf_counter() - start
+    return result
+
+
+# Replays the trace on a fresh CryFS file system
+async def replay_on_mount(mounter: IFsMounter, events: List[TraceEvent], name: str, mode: str, parallel: int, logger: Logger) -> ReplayResult:
+    async with AsyncTemporaryDirectory() as basedir:
+        async with mounter.mount(basedir, BENCHMARK_PASSWORD, logger) as mountdir:
+            return await run_in_thread(replay_trace, events, mountdir, name, mode, parallel)
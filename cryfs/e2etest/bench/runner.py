@@ -0,0 +1,19 @@
+from typing import List
+import tempfile
+from cryfs.e2etest.bench.workloads import IWorkload, WorkloadResult
+from cryfs.e2etest.fsmounter import IFsMounter
+from cryfs.e2etest.test_framework.logger import Logger
+from cryfs.e2etest.utils.executor import run_blocking
+
+
+BENCHMARK_PASSWORD = b"benchmark-password"
+
+
+# Runs each workload on a freshly created CryFS file system
+async def run_workloads(mounter: IFsMounter, workloads: List[IWorkload], logger: Logger) -> List[WorkloadResult]:
+    results: List[WorkloadResult] = []
+    for workload in workloads:
+        with tempfile.TemporaryDirectory() as basedir:
+            async with mounter.mount(basedir, BENCHMARK_PASSWORD, logger) as mountdir:
+                results += await run_blocking(workload.run, mountdir)
+    return results
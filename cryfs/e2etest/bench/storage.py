@@ -0,0 +1,31 @@
+from typing import Any, Dict, List
+import tempfile
+from cryfs.e2etest.bench.runner import BENCHMARK_PASSWORD
+from cryfs.e2etest.fsmounter import IFsMounter
+from cryfs.e2etest.readwrite_test import Fixture
+from cryfs.e2etest.test_framework.logger import Logger
+from cryfs.e2etest.test_framework.metrics import TestMetrics
+from cryfs.e2etest.utils.executor import run_blocking
+from cryfs.e2etest.utils.storage import StorageReport, scan_basedir
+
+
+# Extracts the data fixture into a new file system and reports the disk space it takes after unmounting
+async def measure_storage(mounter: IFsMounter, fixture: Fixture, logger: Logger) -> StorageReport:
+    with tempfile.TemporaryDirectory() as basedir:
+        metrics = TestMetrics()
+        async with mounter.mount(basedir, BENCHMARK_PASSWORD, logger, metrics) as mountdir:
+            await fixture.unpack_data_to(mountdir)
+        usages = metrics.daemon_usages
+        daemon_write_bytes = sum(usage.write_bytes for usage in usages) if len(usages) > 0 else None
+        return await run_blocking(scan_basedir, basedir, (await fixture.data_manifest()).total_file_size(), daemon_write_bytes)
+
+
+def format_reports(results: List[Dict[str, Any]]) -> str:
+    lines = ["%-12s %-10s %-32s %8s %10s %7s %10s" % ("version", "blocksize", "fixture", "blocks", "on disk", "ratio", "write amp")]
+    for result in results:
+        write_amplification = result.get("write_amplification")
+        lines.append("%-12s %-10s %-32s %8d %8.1fMB %7.2f %10s" % (
+            result["cryfs_version"], result["blocksize"] or "default", result["fixture"], result["num_blocks"],
+            result["bytes_on_disk"] / 1024 / 1024, result["overhead_ratio"],
+            "%.2f" % write_amplification if write_amplification is not None else "-"))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,220 @@
+from abc import ABCMeta, abstractmethod
+from typing import Any, Dict, List
+import attr
+import os
+import random
+from cryfs.e2etest.utils.histogram import LatencyHistogram
+from cryfs.e2etest.utils.instrumented_fs import Fs, FsOpStats, InstrumentedFs
+from cryfs.e2etest.utils.sizes import format_size
+
+
+# The file system operations of a workload go through fs(), which records their latencies into `fs_ops`.
+# `num_ops` counts the operations of the workload, e.g. files created, which can take several file system operations each.
+@attr.s(auto_attribs=True)
+class WorkloadResult(object):
+    name: str
+    num_ops: int = 0
+    num_bytes: int = 0
+    fs_ops: FsOpStats = attr.Factory(FsOpStats)
+
+    def fs(self) -> InstrumentedFs:
+        return InstrumentedFs(self.fs_ops)
+
+    def record(self, num_bytes: int) -> None:
+        self.num_ops += 1
+        self.num_bytes += num_bytes
+
+    # Time spent in file system operations, in seconds
+    def duration(self) -> float:
+        return sum(histogram.total for histogram in self.fs_ops.histograms.values()) / 1e9
+
+    def mb_per_s(self) -> float:
+        duration = self.duration()
+        return self.num_bytes / duration / 1024 / 1024 if duration > 0 else 0.0
+
+    def ops_per_s(self) -> float:
+        duration = self.duration()
+        return self.num_ops / duration if duration > 0 else 0.0
+
+    def latency(self) -> LatencyHistogram:
+        result = LatencyHistogram()
+        for histogram in self.fs_ops.histograms.values():
+            result.merge(histogram)
+        return result
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "ops": self.num_ops,
+            "bytes": self.num_bytes,
+            "duration": self.duration(),
+            "mb_per_s": self.mb_per_s(),
+            "ops_per_s": self.ops_per_s(),
+            "latency": self.latency().summary(),
+            "fs_ops": self.fs_ops.to_json(),
+        }
+
+    def to_string(self) -> str:
+        return "%s: %d ops in %.3fs, %.1f ops/s, %.2f MB/s\n%s" % (
+            self.name, self.num_ops, self.duration(), self.ops_per_s(), self.mb_per_s(), self.fs_ops.to_string())
+
+
+def _write_all(fs: Fs, fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while len(view) > 0:
+        view = view[fs.write(fd, view):]
+
+
+def drop_page_cache(path: str) -> None:
+    # Make sure reads go to CryFS and aren't answered from the kernel page cache
+    fadvise = getattr(os, 'posix_fadvise', None)
+    if fadvise is not None:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+class IWorkload(object, metaclass=ABCMeta):
+    @abstractmethod
+    def name(self) -> str: ...
+
+    # Runs the workload in the given (empty) directory on a CryFS mount. Blocking, run it on an executor.
+    @abstractmethod
+    def run(self, dir: str) -> List[WorkloadResult]: ...
+
+
+class SequentialReadWrite(IWorkload):
+    def __init__(self, file_size: int, block_size: int = 1024 * 1024) -> None:
+        self._file_size = file_size
+        self._block_size = block_size
+
+    def name(self) -> str:
+        return "sequential_%s" % format_size(self._file_size)
+
+    def run(self, dir: str) -> List[WorkloadResult]:
+        path = os.path.join(dir, "file")
+        block = os.urandom(min(self._block_size, self._file_size))
+        write = WorkloadResult(name="sequential_write_%s" % format_size(self._file_size))
+        fs = write.fs()
+        fd = fs.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            remaining = self._file_size
+            while remaining > 0:
+                data = block[:remaining]
+                _write_all(fs, fd, data)
+                write.record(len(data))
+                remaining -= len(data)
+            fs.fsync(fd)
+            write.record(0)
+        finally:
+            fs.close(fd)
+        drop_page_cache(path)
+        read = WorkloadResult(name="sequential_read_%s" % format_size(self._file_size))
+        fs = read.fs()
+        fd = fs.open(path, os.O_RDONLY)
+        try:
+            while True:
+                data = fs.read(fd, self._block_size)
+                if not data:
+                    break
+                read.record(len(data))
+        finally:
+            fs.close(fd)
+        return [write, read]
+
+
+class RandomReadWrite(IWorkload):
+    def __init__(self, file_size: int, num_ops: int, block_size: int = 4096, seed: int = 0) -> None:
+        self._file_size = file_size
+        self._num_ops = num_ops
+        self._block_size = block_size
+        self._seed = seed
+
+    def name(self) -> str:
+        return "random_%s" % format_size(self._block_size)
+
+    def run(self, dir: str) -> List[WorkloadResult]:
+        path = os.path.join(dir, "file")
+        with open(path, 'wb') as file:
+            file.truncate(self._file_size)
+        rand = random.Random(self._seed)
+        # Files smaller than a block are accessed as a single, smaller block
+        num_blocks = max(1, self._file_size // self._block_size)
+        block = os.urandom(min(self._block_size, self._file_size))
+        write = WorkloadResult(name="random_write_%s" % format_size(self._block_size))
+        read = WorkloadResult(name="random_read_%s" % format_size(self._block_size))
+        fs = write.fs()
+        fd = fs.open(path, os.O_RDWR)
+        try:
+            for _ in range(self._num_ops):
+                offset = rand.randrange(num_blocks) * self._block_size
+                write.record(fs.pwrite(fd, block, offset))
+            fs.fsync(fd)
+            write.record(0)
+        finally:
+            fs.close(fd)
+        drop_page_cache(path)
+        fs = read.fs()
+        fd = fs.open(path, os.O_RDONLY)
+        try:
+            for _ in range(self._num_ops):
+                offset = rand.randrange(num_blocks) * self._block_size
+                read.record(len(fs.pread(fd, len(block), offset)))
+        finally:
+            fs.close(fd)
+        return [write, read]
+
+
+class Metadata(IWorkload):
+    def __init__(self, num_files: int, file_size: int = 0) -> None:
+        self._num_files = num_files
+        self._file_size = file_size
+
+    def name(self) -> str:
+        return "metadata"
+
+    def run(self, dir: str) -> List[WorkloadResult]:
+        content = os.urandom(self._file_size)
+        paths = [os.path.join(dir, "file%d" % i) for i in range(self._num_files)]
+        create = WorkloadResult(name="metadata_create")
+        stat = WorkloadResult(name="metadata_stat")
+        unlink = WorkloadResult(name="metadata_unlink")
+        fs = create.fs()
+        for path in paths:
+            fd = fs.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                _write_all(fs, fd, content)
+            finally:
+                fs.close(fd)
+            create.record(len(content))
+        fs = stat.fs()
+        for path in paths:
+            fs.stat(path)
+            stat.record(0)
+        fs = unlink.fs()
+        for path in paths:
+            fs.unlink(path)
+            unlink.record(0)
+        return [create, stat, unlink]
+
+
+class Readdir(IWorkload):
+    def __init__(self, num_entries: int, repetitions: int = 10) -> None:
+        self._num_entries = num_entries
+        self._repetitions = repetitions
+
+    def name(self) -> str:
+        return "readdir_%d" % self._num_entries
+
+    def run(self, dir: str) -> List[WorkloadResult]:
+        for i in range(self._num_entries):
+            with open(os.path.join(dir, "entry%d" % i), 'wb'):
+                pass
+        readdir = WorkloadResult(name="readdir_%d" % self._num_entries)
+        fs = readdir.fs()
+        for _ in range(self._repetitions):
+            fs.listdir(dir)
+            readdir.record(0)
+        return [readdir]
@@ -1,29 +1,51 @@
 # Test that the current version of CryFS can still load old versions
 
-from typing import List
+from typing import List, Optional, Union
+import os
 import pkg_resources
-from cryfs.e2etest.test_framework.dircomp import expect_dir_equals
+from cryfs.e2etest.test_framework.dircomp import expect_dir_matches_manifest_async
 from cryfs.e2etest.fsmounter import IFsMounter
 from cryfs.e2etest.test_framework.logger import Logger
+from cryfs.e2etest.test_framework.metrics import TestMetrics
+from cryfs.e2etest.utils.executor import run_blocking
+from cryfs.e2etest.utils.manifest import Manifest, load_or_create_manifest
+from cryfs.e2etest.utils.fixture_cache import CachedTarUnpacker, get_fixture_cache
+from cryfs.e2etest.utils.fixture_registry import FixtureRegistry, default_registry_path
+from cryfs.e2etest.utils.snapshot import SnapshotUnpacker
 from cryfs.e2etest.utils.tar import TarFile, TarUnpacker
 from cryfs.e2etest.test_framework.test_case import ITestSuite, ITestCase
 
 
 class Fixture(object):
+    # `data` and `encoded` are the tar files, relative paths are relative to this package
     def __init__(self, data: str, encoded: str, password: bytes) -> None:
-        data_file = pkg_resources.resource_filename(__name__, data)
-        encoded_file = pkg_resources.resource_filename(__name__, encoded)
+        data_file = data if os.path.isabs(data) else pkg_resources.resource_filename(__name__, data)
+        encoded_file = encoded if os.path.isabs(encoded) else pkg_resources.resource_filename(__name__, encoded)
         self._data = data
         self._encoded = encoded
         self._data_tar = TarFile(data_file)
         self._encoded_tar = TarFile(encoded_file)
         self._password = password
+        self._manifest: Optional[Manifest] = None
 
-    def unpack_data(self) -> TarUnpacker:
-        return TarUnpacker(self._data_tar)
+    # The returned directory is shared with other test cases and must not be modified
+    def unpack_data(self, metrics: Optional[TestMetrics] = None) -> CachedTarUnpacker:
+        return get_fixture_cache().unpack(self._data_tar, metrics)
 
-    def unpack_encoded(self) -> TarUnpacker:
-        return TarUnpacker(self._encoded_tar)
+    async def data_manifest(self) -> Manifest:
+        if self._manifest is None:
+            self._manifest = await run_blocking(load_or_create_manifest, self._data_tar.tar_path)
+        return self._manifest
+
+    # With snapshot=True, the encoded tar file is only extracted once and each caller gets a copy-on-write snapshot of it
+    def unpack_encoded(self, snapshot: bool = False, logger: Optional[Logger] = None,
+                       metrics: Optional[TestMetrics] = None) -> Union[TarUnpacker, SnapshotUnpacker]:
+        if snapshot:
+            return SnapshotUnpacker(self._encoded_tar, metrics)
+        return TarUnpacker(self._encoded_tar, logger, metrics)
+
+    def tar_files(self) -> List[str]:
+        return [self._data_tar.tar_path, self._encoded_tar.tar_path]
 
     def password(self) -> bytes:
         return self._password
@@ -32,65 +54,50 @@ class Fixture(object):
         return self._data + " : " + self._encoded
 
 
-fixtures = [Fixture(
-    data="fixtures/scrypt_data.tar",
-    encoded="fixtures/scrypt_cryfs0.9.6_encoded.tar",
-    password=b"mypassword",
-), Fixture(
-    data="fixtures/scrypt_data.tar",
-    encoded="fixtures/scrypt_cryfs0.9.7_encoded.tar",
-    password=b"mypassword",
-), Fixture(
-    data="fixtures/scrypt_data.tar",
-    encoded="fixtures/scrypt_cryfs0.9.8_encoded.tar",
-    password=b"mypassword",
-), Fixture(
-    data="fixtures/scrypt_data.tar",
-    encoded="fixtures/scrypt_cryfs0.9.9_encoded.tar",
-    password=b"mypassword",
-), Fixture(
-    data="fixtures/scrypt_data.tar",
-    encoded="fixtures/scrypt_cryfs0.10-m2+188.gfc71242e_encoded.tar",
-    password=b"mypassword",
-), Fixture(
-    data="fixtures/constructed_data.tar",
-    encoded="fixtures/constructed_cryfs0.9.6_encoded.tar",
-    password=b"mypassword",
-), Fixture(
-    data="fixtures/constructed_data.tar",
-    encoded="fixtures/constructed_cryfs0.9.7_encoded.tar",
-    password=b"mypassword",
-), Fixture(
-    data="fixtures/constructed_data.tar",
-    encoded="fixtures/constructed_cryfs0.9.8_encoded.tar",
-    password=b"mypassword",
-), Fixture(
-    data="fixtures/constructed_data.tar",
-    encoded="fixtures/constructed_cryfs0.9.9_encoded.tar",
-    password=b"mypassword",
-), Fixture(
-    data="fixtures/constructed_data.tar",
-    encoded="fixtures/constructed_cryfs0.10-m2+194.gb0077e7a_encoded.tar",
-    password=b"mypassword",
-)]
+# Paths inside this package are made relative to it, so the test case names don't depend on where the package is installed
+def _package_relative(path: str) -> str:
+    relative = os.path.relpath(path, os.path.dirname(os.path.abspath(__file__)))
+    return path if relative.split(os.sep)[0] == os.pardir else relative
+
+
+# The encoded fixtures are listed in fixtures/registry.json, see cryfs-e2etest-create-encoded-tars.
+# The registry lists the tar files relative to the directory containing it.
+def load_fixtures(registry_path: Optional[str] = None) -> List[Fixture]:
+    if registry_path is None:
+        registry_path = default_registry_path()
+    registry = FixtureRegistry.load(registry_path)
+    registry_dir = os.path.dirname(os.path.abspath(registry_path))
+    return [Fixture(
+        data=_package_relative(os.path.normpath(os.path.join(registry_dir, entry.data))),
+        encoded=_package_relative(os.path.normpath(os.path.join(registry_dir, entry.encoded))),
+        password=entry.password.encode('UTF-8'),
+    ) for entry in registry.entries]
+
+
+fixtures = load_fixtures()
 
 
 class CompatibilityTests(ITestSuite):
-    def __init__(self, mounter: IFsMounter) -> None:
+    def __init__(self, mounter: IFsMounter, snapshot_encoded_fixtures: bool = False) -> None:
         self.mounter = mounter
+        self.snapshot_encoded_fixtures = snapshot_encoded_fixtures
 
     class _CompatibilityTest(ITestCase):
-        def __init__(self, fixture: Fixture, mounter: IFsMounter) -> None:
+        def __init__(self, fixture: Fixture, mounter: IFsMounter, snapshot_encoded_fixture: bool) -> None:
             self.fixture = fixture
             self.mounter = mounter
+            self.snapshot_encoded_fixture = snapshot_encoded_fixture
 
-        async def run(self, logger: Logger) -> None:
-            async with self.fixture.unpack_encoded() as basedir, self.fixture.unpack_data() as datadir:
-                async with self.mounter.mount(basedir, self.fixture.password(), logger) as mountdir:
-                    expect_dir_equals(datadir, mountdir, logger)
+        async def run(self, logger: Logger, metrics: TestMetrics) -> None:
+            async with self.fixture.unpack_encoded(snapshot=self.snapshot_encoded_fixture, logger=logger, metrics=metrics) as basedir:
+                async with self.mounter.mount(basedir, self.fixture.password(), logger, metrics) as mountdir:
+                    await expect_dir_matches_manifest_async(await self.fixture.data_manifest(), mountdir, logger, metrics=metrics)
 
         def name(self) -> str:
             return "CompatibilityTest: %s" % self.fixture.name()
 
+        def input_files(self) -> List[str]:
+            return self.fixture.tar_files()
+
     def test_cases(self) -> List[ITestCase]:
-        return [self._CompatibilityTest(fixture, self.mounter) for fixture in fixtures]
+        return [self._CompatibilityTest(fixture, self.mounter, self.snapshot_encoded_fixtures) for fixture in fixtures]
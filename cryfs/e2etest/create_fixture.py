@@ -1,8 +1,17 @@
 import click
 import asyncio
+import os
+import sys
 import tempfile
-from cryfs.e2etest.utils.tar import TarFile
+import time
+from typing import List, Optional, Tuple
+from cryfs.e2etest.utils.tar import COMPRESSIONS, TarFile
+from cryfs.e2etest.bench.baseline import cryfs_version
 from cryfs.e2etest.fsmounter import CryfsMounter
+from cryfs.e2etest.utils.fixture_registry import FixtureRegistry, RegistryEntry, default_registry_path, encoded_tar_name
+from cryfs.e2etest.utils.manifest import create_manifest as _create_manifest, file_sha256, manifest_path_for
+from cryfs.e2etest.utils.tar_index import create_tar_index as _create_tar_index, tar_index_path_for
+from cryfs.e2etest.utils.synthetic import DatasetShape, verify_dataset, write_dataset
 
 
 @click.command()
@@ -33,8 +42,134 @@ def create_encoded_tar(source_data_tar: str, target_encoded_tar: str, cryfs_exec
         event_loop.close()
 
 
-async def _create_encoded_tar(source_data_tar: str, target_encoded_tar: str, cryfs_executable: str, password: str) -> None:
+async def _create_encoded_tar(source_data_tar: str, target_encoded_tar: str, cryfs_executable: str, password: str, compression: Optional[str] = None) -> None:
     with tempfile.TemporaryDirectory() as basedir:
         async with CryfsMounter(cryfs_executable).mount(basedir=basedir, password=password.encode('UTF-8')) as mountdir:
             await TarFile(source_data_tar).unpack(mountdir)
-        await TarFile(target_encoded_tar).pack(basedir)
+        # Write to a temporary file first so an interrupted run doesn't leave an incomplete tar file that looks up to date
+        tmp_tar = "%s.%d.tmp" % (target_encoded_tar, os.getpid())
+        try:
+            await TarFile(tmp_tar).pack(basedir, compress=compression is not None, compression=compression or 'xz')
+            os.replace(tmp_tar, target_encoded_tar)
+        finally:
+            if os.path.exists(tmp_tar):
+                os.remove(tmp_tar)
+
+
+@click.command()
+@click.argument('source_data_tars', nargs=-1, required=True)
+@click.option('--cryfs-executable', 'cryfs_executables', multiple=True, required=True,
+              help='CryFS executable to create encoded tar files with. Can be given multiple times.')
+@click.option('--output-dir', default=None, help='Where to put the encoded tar files. Default: the fixtures directory of this package.')
+@click.option('--registry', default=None, help='Fixture registry to add the encoded tar files to. Default: registry.json in the output directory.')
+@click.option('--jobs', default=os.cpu_count() or 1, help='Number of encoded tar files to create concurrently.')
+@click.option('--compression', type=click.Choice(['none'] + COMPRESSIONS), default='none',
+              help='Compress the encoded tar files. Encrypted blocks barely compress, this mostly saves the tar padding.')
+@click.option('--password', default='mypassword')
+@click.option('--force', is_flag=True, help='Recreate encoded tar files even if they are up to date.')
+def create_encoded_tars(source_data_tars: Tuple[str, ...], cryfs_executables: Tuple[str, ...], output_dir: Optional[str], registry: Optional[str],
+                        jobs: int, compression: str, password: str, force: bool) -> None:
+    if output_dir is None:
+        output_dir = os.path.dirname(default_registry_path())
+    if registry is None:
+        registry = os.path.join(output_dir, "registry.json")
+    event_loop = asyncio.get_event_loop()
+    try:
+        success = event_loop.run_until_complete(_create_encoded_tars(
+            source_data_tars=list(source_data_tars), cryfs_executables=list(cryfs_executables), output_dir=output_dir, registry_path=registry,
+            jobs=jobs, compression=compression if compression != 'none' else None, password=password, force=force))
+    finally:
+        event_loop.close()
+    if not success:
+        sys.exit(1)
+
+
+# Creates an encoded tar file for each combination of data tar file and CryFS executable, skipping the ones that are up to date,
+# and adds them to the fixture registry. Returns False if creating any of them failed.
+async def _create_encoded_tars(source_data_tars: List[str], cryfs_executables: List[str], output_dir: str, registry_path: str,
+                               jobs: int, compression: Optional[str], password: str, force: bool) -> bool:
+    registry = FixtureRegistry.load(registry_path) if os.path.exists(registry_path) else FixtureRegistry()
+    registry_dir = os.path.dirname(os.path.abspath(registry_path))
+    versions = await asyncio.gather(*[cryfs_version(executable) for executable in cryfs_executables])
+    executable_hashes = [file_sha256(executable) for executable in cryfs_executables]
+    data_hashes = [file_sha256(data_tar) for data_tar in source_data_tars]
+
+    jobs_to_run: List[Tuple[str, str, RegistryEntry]] = []
+    for data_tar, data_hash in zip(source_data_tars, data_hashes):
+        for executable, version, executable_hash in zip(cryfs_executables, versions, executable_hashes):
+            target = os.path.join(output_dir, encoded_tar_name(data_tar, version, compression))
+            entry = RegistryEntry(data=os.path.relpath(data_tar, registry_dir), encoded=os.path.relpath(target, registry_dir), password=password,
+                                  cryfs_version=version, data_sha256=data_hash, cryfs_sha256=executable_hash)
+            if any(other.encoded == entry.encoded for _, _, other in jobs_to_run):
+                raise click.UsageError("Several CryFS executables report version %s, they would write the same encoded tar file" % version)
+            jobs_to_run.append((data_tar, executable, entry))
+
+    semaphore = asyncio.Semaphore(jobs)
+
+    async def create(data_tar: str, executable: str, entry: RegistryEntry) -> bool:
+        target = os.path.join(registry_dir, entry.encoded)
+        existing = registry.find(entry.encoded)
+        if not force and os.path.exists(target) and existing is not None and existing.is_up_to_date(entry):
+            print("Up to date: %s" % entry.encoded)
+            return True
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await _create_encoded_tar(data_tar, target, executable, password, compression)
+            except Exception as e:
+                print("Failed to create %s with %s: %s" % (entry.encoded, executable, str(e)))
+                return False
+            print("Created %s in %.1fs" % (entry.encoded, time.perf_counter() - start))
+        registry.upsert(entry)
+        return True
+
+    results = await asyncio.gather(*[create(data_tar, executable, entry) for data_tar, executable, entry in jobs_to_run])
+    registry.save(registry_path)
+    return all(results)
+
+
+@click.command()
+@click.argument('source_data_tar')
+@click.option('--output', default=None, help='Where to write the manifest. Default: next to the data tar file.')
+def create_manifest(source_data_tar: str, output: Optional[str]) -> None:
+    if output is None:
+        output = manifest_path_for(source_data_tar)
+    _create_manifest(source_data_tar).save(output)
+
+
+@click.command()
+@click.argument('tar_file')
+@click.option('--output', default=None, help='Where to write the index. Default: next to the tar file.')
+def create_tar_index(tar_file: str, output: Optional[str]) -> None:
+    if output is None:
+        output = tar_index_path_for(tar_file)
+    index = _create_tar_index(tar_file)
+    index.save(output)
+    print("Indexed %d members of %s" % (len(index.entries), tar_file))
+
+
+_SHAPE_HELP = 'Shape of the dataset, e.g. "files=100000,depth=4,fanout=8,sizes=lognormal:16K:1.5:1G,symlinks=0.05,seed=1". ' \
+              'Files go into random directories of a tree with the given depth and fanout, only directories containing files are created. ' \
+              'Sizes can be "fixed:SIZE", "uniform:MIN:MAX" or "lognormal:MEDIAN:SIGMA[:MAX]". Missing keys use defaults.'
+
+
+@click.command()
+@click.argument('target_dir')
+@click.option('--shape', default='', help=_SHAPE_HELP)
+def create_synthetic_data(target_dir: str, shape: str) -> None:
+    dataset_shape = DatasetShape.parse(shape)
+    os.makedirs(target_dir, exist_ok=True)
+    stats = write_dataset(dataset_shape, target_dir)
+    print("Created %s: %s" % (dataset_shape.to_string(), stats.to_string()))
+
+
+@click.command()
+@click.argument('dir')
+@click.option('--shape', default='', help=_SHAPE_HELP)
+def verify_synthetic_data(dir: str, shape: str) -> None:
+    errors = verify_dataset(DatasetShape.parse(shape), dir)
+    for error in errors:
+        print(error)
+    if len(errors) > 0:
+        sys.exit(1)
+    print("Dataset matches")
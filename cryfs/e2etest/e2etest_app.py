@@ -1,15 +1,36 @@
 import sys
 import traceback as _traceback
 from typing import List, Type, TypeVar, Optional
-import asyncio
 import argparse
+import asyncio
+import os
+import re
+import shutil
+import time
 from types import TracebackType
-from cryfs.e2etest.fsmounter import CryfsMounter
+from cryfs.e2etest.bench.baseline import check_and_save_baseline, cryfs_version, metrics_from_test_report
+from cryfs.e2etest.fsmounter import CryfsMounter, DEFAULT_SAMPLE_INTERVAL
 from cryfs.e2etest.utils.async_app import AsyncApp
+from cryfs.e2etest.utils.executor import EXECUTOR_KINDS, BlockingExecutor, set_blocking_executor
+from cryfs.e2etest.utils.fixture_cache import FixtureCache, set_fixture_cache
+from cryfs.e2etest.utils.fs_trace import set_trace_dir
+from cryfs.e2etest.utils.loop_lag import LoopLagMonitor
+from cryfs.e2etest.utils.paths import default_cache_dir
+from cryfs.e2etest.utils.resource_limits import ResourceLimits, set_resource_limits
+from cryfs.e2etest.utils.sizes import parse_size
+from cryfs.e2etest.test_framework.limits import DaemonLimits
+from cryfs.e2etest.test_framework.metrics import TestMetrics
 from cryfs.e2etest.test_framework.result import TestStatus, TestResult, TestResults
 from cryfs.e2etest.test_framework.test_case import ITestCase, ITestSuite
+from cryfs.e2etest.test_framework.scheduler import DurationHistory, TestScheduler, parse_shard, partition
+from cryfs.e2etest.test_framework.workers import run_workers
+from cryfs.e2etest.test_framework.result_cache import ResultCache, executable_key
 from cryfs.e2etest.compatibility_test import CompatibilityTests
+from cryfs.e2etest.matrix_test import MatrixTests, MatrixVersion
 from cryfs.e2etest.readwrite_test import ReadWriteTests
+from cryfs.e2etest.stress_test import DEFAULT_OPS_PER_WORKER, StressTests
+from cryfs.e2etest.synthetic_test import SyntheticTests
+from cryfs.e2etest.utils.synthetic import DatasetShape
 from cryfs.e2etest.test_framework.logger import Logger, LogLevel
 
 
@@ -19,10 +40,86 @@ T = TypeVar('T')
 class Application(AsyncApp):
     def __init__(self) -> None:
         self.args = self._parse_args()
+        self._result_cache: Optional[ResultCache] = None
+        self._loop_lag: Optional[LoopLagMonitor] = None
 
     def _parse_args(self) -> argparse.Namespace:
         parser = argparse.ArgumentParser()
-        parser.add_argument('--cryfs-executable', default='/usr/bin/cryfs')
+        parser.add_argument('--cryfs-executable', action='append', default=None,
+                            help='CryFS executable to test. Default: /usr/bin/cryfs. Can be given multiple times, oldest version first, '
+                                 'to also test that file systems written by each version can be read by it and all newer versions. '
+                                 'The other tests use the last one.')
+        parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                            help='Maximal number of test cases running at the same time. Default: number of cores.')
+        parser.add_argument('--max-mounts', type=int, default=None,
+                            help='Maximal number of CryFS file systems mounted at the same time. Default: same as --jobs.')
+        parser.add_argument('--max-extractions', type=int, default=None,
+                            help='Maximal number of tar files extracted at the same time. Default: same as --jobs.')
+        parser.add_argument('--max-comparisons', type=int, default=None,
+                            help='Maximal number of directory comparisons running at the same time. Default: same as --jobs.')
+        parser.add_argument('--blocking-executor', choices=EXECUTOR_KINDS, default='thread',
+                            help='Run blocking file system work like copying and removing directories in a thread pool or a process pool. '
+                                 'Comparisons always use threads, because they log to the test case.')
+        parser.add_argument('--blocking-workers', type=int, default=None,
+                            help='Number of threads or processes for blocking file system work. Default: twice --jobs.')
+        parser.add_argument('--durations-file', default=os.path.join(default_cache_dir(), 'durations.json'),
+                            help='File storing test durations from earlier runs. Used to start the longest tests first.')
+        parser.add_argument('--fixture-cache-dir', default=None,
+                            help='Keep extracted fixtures in this directory between runs. Default: extract them for each run.')
+        parser.add_argument('--snapshot-encoded-fixtures', action='store_true',
+                            help='Extract each encoded fixture only once and give each test a copy-on-write snapshot (reflink) '
+                                 'or, if the file system doesn\'t support reflinks, a parallel copy of it.')
+        parser.add_argument('--slowest', type=int, default=10,
+                            help='Number of slowest test cases to show in the summary.')
+        parser.add_argument('--json-report', default=None,
+                            help='Write test results and per-phase timings as JSON to this file.')
+        parser.add_argument('--log-dir', default=None,
+                            help='Write the full log of each test case (including the CryFS logs) to a file in this directory. '
+                                 'Without it, only the most recent log entries are kept and large logs are truncated.')
+        parser.add_argument('--daemon-sample-interval', type=float, default=DEFAULT_SAMPLE_INTERVAL,
+                            help='Interval in seconds at which CPU, memory and IO usage of the CryFS daemon are sampled.')
+        parser.add_argument('--max-daemon-rss', default=None,
+                            help='Fail test cases in which the peak RSS of the CryFS daemon exceeds this size, e.g. 512M.')
+        parser.add_argument('--max-daemon-cpu-time', type=float, default=None,
+                            help='Fail test cases in which the CryFS daemon uses more than this many seconds of CPU time.')
+        parser.add_argument('--synthetic', action='append', default=[],
+                            help='Also run a test writing and reading a generated dataset of this shape, e.g. '
+                                 '"files=100000,depth=4,fanout=8,sizes=lognormal:16K:1.5:1G,symlinks=0.05,seed=1". Can be given multiple times.')
+        parser.add_argument('--stress', default=None,
+                            help='Also run a test with this many processes writing to the same mount at the same time, e.g. "1,2,4,8". '
+                                 'Each number is a round in the same mount, so the report shows how throughput scales.')
+        parser.add_argument('--stress-ops', type=int, default=DEFAULT_OPS_PER_WORKER,
+                            help='Number of operations each process of the --stress test does per round.')
+        parser.add_argument('--shard', default=None,
+                            help='Only run one shard of the test cases, e.g. "2/4" for the second of four shards. Shards are balanced by '
+                                 'the durations in --durations-file, so all shards must use the same durations file.')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Run the test cases in this many processes, each running one shard with its share of --jobs. '
+                                 'Resource limits like --max-mounts apply per worker.')
+        parser.add_argument('--no-save-durations', action='store_true',
+                            help='Don\'t update --durations-file with the durations of this run.')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Skip test cases that already passed with the same CryFS executable (or --cryfs-version) and fixtures.')
+        parser.add_argument('--force', action='store_true',
+                            help='With --incremental, run all test cases anyway and update the result cache.')
+        parser.add_argument('--result-cache-dir', default=os.path.join(default_cache_dir(), 'results'),
+                            help='Where --incremental stores the results of passed test cases.')
+        parser.add_argument('--cryfs-version', default=None,
+                            help='With --incremental, identify the CryFS build by this string instead of by a hash of the executable. '
+                                 'Useful if the executable is rebuilt without changes.')
+        parser.add_argument('--record-traces', default=None,
+                            help='Record the file system operations of the ReadWrite workloads into one trace file per test case in this directory. '
+                                 'Replay them with "cryfs-e2etest-bench replay". Test cases skipped by --incremental don\'t record a trace.')
+        parser.add_argument('--baseline-dir', default=None,
+                            help='Directory with stored per-phase timings of earlier runs, see --save-baseline and --compare-baseline.')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Add the per-phase timings of this run to the baseline of this CryFS version in --baseline-dir.')
+        parser.add_argument('--compare-baseline', action='store_true',
+                            help='Compare the per-phase timings against a baseline in --baseline-dir and fail on significant slowdowns.')
+        parser.add_argument('--baseline-version', default=None,
+                            help='CryFS version to compare against. Default: the most recently stored baseline of another version.')
+        parser.add_argument('--regression-threshold', type=float, default=5.0,
+                            help='Fail if a test case or phase got significantly slower by more than this many percent.')
         return parser.parse_args()
 
     # TODO Auto-call this in run()
@@ -30,25 +127,154 @@ class Application(AsyncApp):
         sys.excepthook = self._onUncaughtException
 
     async def main(self) -> None:
-        mounter = CryfsMounter(self.args.cryfs_executable)
-        suites = [CompatibilityTests(mounter), ReadWriteTests(mounter)]
-        test_cases = self._test_cases_from_suites(suites)
-        results = await asyncio.gather(*[self._run_case(case) for case in test_cases])
+        if self.args.workers > 1:
+            results = await self._run_in_workers()
+        else:
+            results = await self._run_in_process()
         result = TestResults(results)
-        result.print()
-        if result.status() != TestStatus.SUCCESS:
+        result.print(num_slowest=self.args.slowest)
+        if self.args.json_report is not None:
+            result.export_json(self.args.json_report)
+        regressed = False
+        if self.args.baseline_dir is not None:
+            regressed = check_and_save_baseline(
+                self.args.baseline_dir, "phases", await cryfs_version(self._cryfs_executable()), metrics_from_test_report(result.to_json()),
+                compare=self.args.compare_baseline, save=self.args.save_baseline,
+                requested_version=self.args.baseline_version, threshold_percent=self.args.regression_threshold)
+        if result.status() != TestStatus.SUCCESS or regressed:
             exit(1)
 
+    async def _run_in_process(self) -> List[TestResult]:
+        set_resource_limits(ResourceLimits(
+            max_mounts=self._limit_or_jobs(self.args.max_mounts),
+            max_extractions=self._limit_or_jobs(self.args.max_extractions),
+            max_comparisons=self._limit_or_jobs(self.args.max_comparisons),
+        ))
+        set_fixture_cache(FixtureCache(persistent_dir=self.args.fixture_cache_dir))
+        executor = BlockingExecutor(kind=self.args.blocking_executor,
+                                    max_workers=self.args.blocking_workers if self.args.blocking_workers is not None else 2 * self.args.jobs)
+        set_blocking_executor(executor)
+        if self.args.record_traces is not None:
+            set_trace_dir(os.path.abspath(self.args.record_traces))
+        mounter = CryfsMounter(self._cryfs_executable(), sample_interval=self.args.daemon_sample_interval)
+        suites = [CompatibilityTests(mounter, snapshot_encoded_fixtures=self.args.snapshot_encoded_fixtures), ReadWriteTests(mounter),
+                  SyntheticTests(mounter, [DatasetShape.parse(shape) for shape in self.args.synthetic]),
+                  StressTests(mounter, self._stress_worker_counts(), ops_per_worker=self.args.stress_ops)]
+        if len(self._cryfs_executables()) > 1:
+            suites.append(MatrixTests(await self._matrix_versions()))
+        test_cases = self._test_cases_from_suites(suites)
+        history = DurationHistory(self.args.durations_file)
+        if self.args.shard is not None:
+            shard_index, num_shards = parse_shard(self.args.shard)
+            test_cases = partition(test_cases, num_shards, history)[shard_index]
+        if self.args.incremental:
+            cryfs_key = self.args.cryfs_version if self.args.cryfs_version is not None else await executable_key(
+                shutil.which(self._cryfs_executable()) or self._cryfs_executable())
+            self._result_cache = ResultCache(self.args.result_cache_dir, cryfs_key)
+        self._loop_lag = LoopLagMonitor()
+        self._loop_lag.start()
+        try:
+            try:
+                results = await TestScheduler(jobs=self.args.jobs, history=history).run(test_cases, self._run_case)
+            finally:
+                for suite in suites:
+                    await suite.cleanup()
+        finally:
+            await self._loop_lag.stop()
+            executor.shutdown()
+        if not self.args.no_save_durations:
+            history.save()
+        if self._result_cache is not None:
+            self._result_cache.save()
+        return results
+
+    async def _run_in_workers(self) -> List[TestResult]:
+        results = await run_workers(sys.argv[1:], num_workers=self.args.workers,
+                                    jobs_per_worker=max(1, self.args.jobs // self.args.workers))
+        if not self.args.no_save_durations:
+            history = DurationHistory(self.args.durations_file)
+            for result in results:
+                if not result.cached:
+                    history.record(result.test_case_name, result.metrics.duration)
+            history.save()
+        return results
+
+    def _stress_worker_counts(self) -> List[int]:
+        if self.args.stress is None:
+            return []
+        return [int(count) for count in self.args.stress.split(',') if count.strip() != '']
+
+    def _cryfs_executables(self) -> List[str]:
+        if self.args.cryfs_executable is None:
+            return ['/usr/bin/cryfs']
+        return list(self.args.cryfs_executable)
+
+    # The newest CryFS version, which all tests except for the matrix tests run with
+    def _cryfs_executable(self) -> str:
+        return self._cryfs_executables()[-1]
+
+    async def _matrix_versions(self) -> List[MatrixVersion]:
+        executables = self._cryfs_executables()
+        labels = list(await asyncio.gather(*[cryfs_version(executable) for executable in executables]))
+        # Test case names must be unique
+        if len(set(labels)) != len(labels) or "unknown" in labels:
+            labels = executables if len(set(executables)) == len(executables) else ["%d:%s" % (index + 1, executable) for index, executable in enumerate(executables)]
+        return [MatrixVersion(label=label, executable=executable,
+                              mounter=CryfsMounter(executable, sample_interval=self.args.daemon_sample_interval))
+                for label, executable in zip(labels, executables)]
+
+    def _log_file_for(self, case: ITestCase) -> Optional[str]:
+        if self.args.log_dir is None:
+            return None
+        os.makedirs(self.args.log_dir, exist_ok=True)
+        filename = re.sub(r'[^A-Za-z0-9._+-]+', '_', case.name()) + ".log"
+        path = os.path.join(self.args.log_dir, filename)
+        if os.path.exists(path):
+            os.remove(path)
+        return path
+
+    def _daemon_limits(self) -> DaemonLimits:
+        return DaemonLimits(
+            max_peak_rss_bytes=parse_size(self.args.max_daemon_rss) if self.args.max_daemon_rss is not None else None,
+            max_cpu_time=self.args.max_daemon_cpu_time,
+        )
+
+    def _limit_or_jobs(self, limit: Optional[int]) -> int:
+        if limit is None:
+            return int(self.args.jobs)
+        return limit
+
     def _test_cases_from_suites(self, suites: List[ITestSuite]) -> List[ITestCase]:
         return [case for suite in suites for case in suite.test_cases()]
 
     async def _run_case(self, case: ITestCase) -> TestResult:
-        logger = Logger()
+        if self._result_cache is not None and not self.args.force:
+            cached = await self._result_cache.lookup(case)
+            if cached is not None:
+                return cached
+        result = await self._run_case_uncached(case)
+        if self._result_cache is not None:
+            await self._result_cache.store(case, result)
+        return result
+
+    async def _run_case_uncached(self, case: ITestCase) -> TestResult:
+        logger = Logger(log_file=self._log_file_for(case))
+        metrics = TestMetrics()
+        start = time.perf_counter()
         try:
-            await case.run(logger)
-        except Exception as e:
-            logger.log(LogLevel.FATAL, "Exception: " + _traceback.format_exc())
-        return TestResult(test_case_name=case.name(), log=logger)
+            try:
+                await case.run(logger, metrics)
+            except Exception as e:
+                logger.log(LogLevel.FATAL, "Exception: " + _traceback.format_exc())
+            metrics.duration = time.perf_counter() - start
+            if self._loop_lag is not None:
+                metrics.loop_lag = self._loop_lag.lag_between(start, start + metrics.duration)
+                logger.log(LogLevel.INFO, "Event loop lag while this test case ran: %s" % metrics.loop_lag.to_string())
+            for violation in case.daemon_limits(self._daemon_limits()).check(metrics):
+                logger.log(LogLevel.ERROR, violation)
+        finally:
+            logger.close()
+        return TestResult(test_case_name=case.name(), log=logger, metrics=metrics)
 
 
     def _onUncaughtException(self, type_: Type[BaseException], value: BaseException, traceback: TracebackType) -> None:
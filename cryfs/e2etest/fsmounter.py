@@ -1,10 +1,18 @@
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 import tempfile
 from abc import ABCMeta, abstractmethod
 from types import TracebackType
 from cryfs.e2etest.utils.async_subprocess import check_call_subprocess
+from cryfs.e2etest.utils.cryfs_log import MountProfile, profile_mount
+from cryfs.e2etest.utils.executor import run_blocking, run_in_thread
+from cryfs.e2etest.utils.resource_limits import get_resource_limits
+from cryfs.e2etest.utils.mountinfo import mountinfo_supported, wait_until_unmounted
+from cryfs.e2etest.utils.proc import ProcessMonitor, find_processes_with_argument, wait_for_process_exit
+from cryfs.e2etest.utils.subreaper import release_daemon, subreaper_command
 from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.test_framework.metrics import Phase, TestMetrics, span
 import asyncio
+import time
 
 
 class _IMounterContext(object, metaclass=ABCMeta):
@@ -13,56 +21,145 @@ class _IMounterContext(object, metaclass=ABCMeta):
 
 
 class IFsMounter(object, metaclass=ABCMeta):
+    # The time mounting and unmounting take, the mount profile and the resource usage of the daemon are recorded in `metrics`, if given
     @abstractmethod
-    def mount(self, basedir: str, password: bytes, logger: Optional[Logger] = None) -> _IMounterContext: ...
+    def mount(self, basedir: str, password: bytes, logger: Optional[Logger] = None, metrics: Optional[TestMetrics] = None) -> _IMounterContext: ...
+
+
+# Interval in seconds at which the resource usage of the CryFS daemon is sampled while it is mounted
+DEFAULT_SAMPLE_INTERVAL = 0.1
 
 
 class _CryfsMounterContext(_IMounterContext):
-    def __init__(self, cryfs_binary: str, basedir: str, password: bytes, logger: Optional[Logger] = None) -> None:
+    def __init__(self, cryfs_binary: str, basedir: str, password: bytes, logger: Optional[Logger] = None,
+                 metrics: Optional[TestMetrics] = None, sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+                 extra_args: Optional[List[str]] = None, extra_env: Optional[Dict[str, str]] = None) -> None:
         self.cryfs_binary = cryfs_binary
+        self.extra_args = extra_args or []
+        self.extra_env = extra_env or {}
         self.basedir = basedir
         self.password = password
         self.logger = logger
+        self.metrics = metrics
+        self.sample_interval = sample_interval
+        self.monitor: Optional[ProcessMonitor] = None
+        self.profile = MountProfile()
+        self.invocation_start = 0.0
+        self.invocation_end = 0.0
+        # Output of cryfs with the time it arrived, to find the mount phases in it
+        self.output_chunks: List[Tuple[float, bytes]] = []
 
     async def __aenter__(self) -> str:
+        self.mount_slot = get_resource_limits().mount()
+        await self.mount_slot.__aenter__()
+        try:
+            start = time.perf_counter()
+            with span(self.metrics, Phase.MOUNT):
+                mountdir = await self._mount()
+            self.profile.mount = time.perf_counter() - start
+            return mountdir
+        except BaseException:
+            await self.mount_slot.__aexit__(None, None, None)
+            raise
+
+    async def _mount(self) -> str:
         self.temp_local_state_dir = tempfile.TemporaryDirectory()
         self.temp_basedir = tempfile.TemporaryDirectory()
         self.logfile = tempfile.NamedTemporaryFile()
-        out = await check_call_subprocess(self.cryfs_binary, self.basedir, self.temp_basedir.name,
-                                          "--allow-filesystem-upgrade", "--logfile", self.logfile.name,
-                                          input=self.password, env={
+        # Under the helper, the daemon stays a zombie after unmounting until we release it, so the monitor can take its last
+        # sample after the daemon flushed its caches and exited
+        command, env = subreaper_command([self.cryfs_binary, self.basedir, self.temp_basedir.name,
+                                          "--allow-filesystem-upgrade", "--logfile", self.logfile.name, *self.extra_args], dict({
             "CRYFS_FRONTEND": "noninteractive",
             "CRYFS_NO_UPDATE_CHECK": "true",
             "CRYFS_LOCAL_STATE_DIR": self.temp_local_state_dir.name,
-        })
+        }, **self.extra_env))
+        # Wall clock time, to compare it with the timestamps in the CryFS log and of its output
+        self.invocation_start = time.time()
+        invocation_start = time.perf_counter()
+        out = await check_call_subprocess(*command, input=self.password, output_chunks=self.output_chunks, env=env)
+        self.profile.invocation = time.perf_counter() - invocation_start
+        self.invocation_end = self.invocation_start + self.profile.invocation
         if self.logger is not None:
-            self.logger.log(LogLevel.INFO, "CryFS stdout:\n%s" % out.stdout.decode('UTF-8'))
-            self.logger.log(LogLevel.INFO, "CryFS stderr:\n%s" % out.stderr.decode('UTF-8'))
+            self.logger.log_payload(LogLevel.INFO, "CryFS stdout", out.stdout.decode('UTF-8'))
+            self.logger.log_payload(LogLevel.INFO, "CryFS stderr", out.stderr.decode('UTF-8'))
+
+        # CryFS daemonizes after mounting. Remember the daemon so we can wait for it to exit when unmounting.
+        # The mount directory is a fresh temporary directory, so it identifies the daemon uniquely.
+        daemon_pids = find_processes_with_argument(self.temp_basedir.name)
+        self.daemon_pid = daemon_pids[0] if len(daemon_pids) == 1 else None
+        if self.daemon_pid is None and self.logger is not None:
+            self.logger.log(LogLevel.WARNING, "Couldn't find CryFS daemon process for %s. Found: %s" % (self.temp_basedir.name, daemon_pids))
+        if self.daemon_pid is not None:
+            self.monitor = ProcessMonitor(self.daemon_pid, self.sample_interval)
+            self.monitor.start()
 
         return self.temp_basedir.name
 
     async def __aexit__(self, exc_type: Optional[type], exc: Optional[BaseException], tb: Optional[TracebackType]) -> None:
-        await check_call_subprocess("/bin/fusermount", "-u", self.temp_basedir.name, logger=self.logger, throw_on_error=False)
-        await _wait_until_unmounted(self.temp_basedir.name)
-        if self.logger is not None:
-            with open(self.logfile.name, 'r') as logfile:
-                self.logger.log(LogLevel.INFO, "CryFS log:\n%s" % logfile.read())
-        self.temp_basedir.cleanup()
-        self.temp_local_state_dir.cleanup()
-        self.logfile.close()
+        try:
+            await self._unmount()
+        finally:
+            await self.mount_slot.__aexit__(exc_type, exc, tb)
+
+    async def _unmount(self) -> None:
+        try:
+            start = time.perf_counter()
+            with span(self.metrics, Phase.UNMOUNT):
+                await check_call_subprocess("/bin/fusermount", "-u", self.temp_basedir.name, logger=self.logger, throw_on_error=False)
+                await _wait_until_unmounted(self.temp_basedir.name, self.daemon_pid)
+            self.profile.unmount = time.perf_counter() - start
+        finally:
+            await self._stop_monitor()
+            if self.daemon_pid is not None:
+                release_daemon(self.daemon_pid)
+        with span(self.metrics, Phase.CLEANUP):
+            if self.metrics is not None:
+                self.profile.phases = await run_blocking(profile_mount, self.logfile.name, self.output_chunks, self.invocation_start, self.invocation_end)
+                self.metrics.add_mount_profile(self.profile)
+            if self.logger is not None:
+                await run_in_thread(self.logger.log_file_contents, LogLevel.INFO, "CryFS log", self.logfile.name)
+            self.temp_basedir.cleanup()
+            self.temp_local_state_dir.cleanup()
+            self.logfile.close()
+
+    async def _stop_monitor(self) -> None:
+        if self.monitor is None:
+            return
+        usage = await self.monitor.stop()
+        if usage is not None and self.metrics is not None:
+            self.metrics.add_daemon_usage(usage)
+        if usage is not None and self.logger is not None:
+            self.logger.log(LogLevel.INFO, "CryFS daemon: peak RSS %.1f MB, CPU time %.2fs, %d context switches, read %.1f MB, wrote %.1f MB" % (
+                usage.peak_rss_bytes / 1024 / 1024, usage.cpu_time(),
+                usage.voluntary_context_switches + usage.involuntary_context_switches,
+                usage.read_bytes / 1024 / 1024, usage.write_bytes / 1024 / 1024))
 
 
+# `extra_args` are passed to cryfs when mounting, e.g. ["--blocksize", "16384"] to create file systems with a different block size.
+# `extra_env` is added to the environment cryfs runs with, for settings that are environment variables instead of arguments.
 class CryfsMounter(IFsMounter):
-    def __init__(self, cryfs_binary: str) -> None:
+    def __init__(self, cryfs_binary: str, sample_interval: float = DEFAULT_SAMPLE_INTERVAL, extra_args: Optional[List[str]] = None,
+                 extra_env: Optional[Dict[str, str]] = None) -> None:
         self.cryfs_binary = cryfs_binary
+        self.sample_interval = sample_interval
+        self.extra_args = extra_args or []
+        self.extra_env = extra_env or {}
 
-    def mount(self, basedir: str, password: bytes, logger: Optional[Logger] = None) -> _CryfsMounterContext:
-        return _CryfsMounterContext(cryfs_binary=self.cryfs_binary, basedir=basedir, password=password, logger=logger)
+    def mount(self, basedir: str, password: bytes, logger: Optional[Logger] = None, metrics: Optional[TestMetrics] = None) -> _CryfsMounterContext:
+        return _CryfsMounterContext(cryfs_binary=self.cryfs_binary, basedir=basedir, password=password, logger=logger, metrics=metrics,
+                                    sample_interval=self.sample_interval, extra_args=self.extra_args, extra_env=self.extra_env)
 
 
-async def _wait_until_unmounted(dir: str) -> None:
-    mounted_dirs = await check_call_subprocess("mount")
-    while dir.encode("UTF-8") in mounted_dirs.stdout:
-        await asyncio.sleep(0.001)
-    # Give the cryfs process some more time to exit and finish writing to the basedir
-    await asyncio.sleep(5)
+async def _wait_until_unmounted(dir: str, daemon_pid: Optional[int]) -> None:
+    if mountinfo_supported():
+        await wait_until_unmounted(dir)
+    else:
+        while dir.encode("UTF-8") in (await check_call_subprocess("mount")).stdout:
+            await asyncio.sleep(0.01)
+    if daemon_pid is not None:
+        # The cryfs process has finished writing to the basedir once it exited
+        await wait_for_process_exit(daemon_pid)
+    else:
+        # We don't know the cryfs process. Give it some more time to exit and finish writing to the basedir
+        await asyncio.sleep(5)
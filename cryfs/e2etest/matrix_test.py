@@ -0,0 +1,126 @@
+# Test that file systems written by one CryFS version can be read by the same and by newer versions
+
+import asyncio
+import attr
+import os
+import shutil
+from typing import List, Optional
+from cryfs.e2etest.fsmounter import IFsMounter
+from cryfs.e2etest.readwrite_test import Fixture, fixtures
+from cryfs.e2etest.test_framework.dircomp import expect_dir_matches_manifest_async
+from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.test_framework.metrics import Phase, TestMetrics
+from cryfs.e2etest.test_framework.test_case import ITestSuite, ITestCase
+from cryfs.e2etest.utils.executor import AsyncTemporaryDirectory, run_blocking
+from cryfs.e2etest.utils.resource_limits import get_resource_limits
+from cryfs.e2etest.utils.snapshot import clone_tree
+
+
+_PASSWORD = b"mypassword"
+
+
+@attr.s(auto_attribs=True)
+class MatrixVersion(object):
+    # Shown in the test case names, e.g. the CryFS version
+    label: str
+    executable: str
+    mounter: IFsMounter
+
+
+# Writes a data fixture with one CryFS version. This only happens once, no matter how many versions read the file system.
+# The first reader starts the write, the others wait for it. Each reader gets its own copy of the base directory,
+# because mounting can modify it (e.g. upgrade the file system). The base directory is removed after the last reader is done,
+# or by cleanup() if some readers didn't run.
+class _SharedWrite(object):
+    def __init__(self, writer: MatrixVersion, fixture: Fixture, num_readers: int) -> None:
+        self._writer = writer
+        self._fixture = fixture
+        self._remaining_readers = num_readers
+        self._tempdir: Optional[AsyncTemporaryDirectory] = None
+        self._write: Optional['asyncio.Future[str]'] = None
+
+    # The write is logged and measured in the test case that starts it
+    async def acquire(self, logger: Logger, metrics: TestMetrics) -> str:
+        if self._write is None:
+            self._write = asyncio.ensure_future(self._run_write(logger, metrics))
+        else:
+            logger.log(LogLevel.INFO, "Reusing the file system written by CryFS %s in another test case" % self._writer.label)
+        return await asyncio.shield(self._write)
+
+    async def release(self) -> None:
+        self._remaining_readers -= 1
+        if self._remaining_readers == 0:
+            await self.cleanup()
+
+    async def cleanup(self) -> None:
+        if self._tempdir is not None:
+            tempdir, self._tempdir = self._tempdir, None
+            await tempdir.cleanup()
+
+    async def _run_write(self, logger: Logger, metrics: TestMetrics) -> str:
+        self._tempdir = AsyncTemporaryDirectory()
+        basedir = os.path.join(self._tempdir.name, "basedir")
+        os.mkdir(basedir)
+        logger.log(LogLevel.INFO, "Writing %s with CryFS %s" % (self._fixture.name(), self._writer.label))
+        async with self._writer.mounter.mount(basedir, _PASSWORD, logger, metrics) as mountdir:
+            with metrics.span(Phase.WORKLOAD):
+                await self._fixture.unpack_data_to(mountdir)
+        return basedir
+
+
+class MatrixTests(ITestSuite):
+    # `versions` must be ordered oldest first. Each version reads the file systems written by itself and by all older versions.
+    def __init__(self, versions: List[MatrixVersion], data_fixtures: Optional[List[Fixture]] = None) -> None:
+        self.versions = versions
+        self.data_fixtures = data_fixtures if data_fixtures is not None else fixtures
+        self._writes: List[_SharedWrite] = []
+
+    class _WriteReadTest(ITestCase):
+        def __init__(self, write: _SharedWrite, writer: MatrixVersion, reader: MatrixVersion, fixture: Fixture) -> None:
+            self.write = write
+            self.writer = writer
+            self.reader = reader
+            self.fixture = fixture
+
+        async def run(self, logger: Logger, metrics: TestMetrics) -> None:
+            basedir = await self.write.acquire(logger, metrics)
+            try:
+                async with AsyncTemporaryDirectory() as tempdir:
+                    snapshot = os.path.join(tempdir, "basedir")
+                    with metrics.span(Phase.FIXTURE_UNPACK):
+                        async with get_resource_limits().extraction():
+                            await run_blocking(clone_tree, basedir, snapshot)
+                    async with self.reader.mounter.mount(snapshot, _PASSWORD, logger, metrics) as mountdir:
+                        await expect_dir_matches_manifest_async(await self.fixture.data_manifest(), mountdir, logger, metrics=metrics)
+            finally:
+                await self.write.release()
+
+        def name(self) -> str:
+            return "MatrixTest: %s -> %s: %s" % (self.writer.label, self.reader.label, self.fixture.name())
+
+        def input_files(self) -> List[str]:
+            executables = [shutil.which(version.executable) or version.executable for version in [self.writer, self.reader]]
+            return self.fixture.tar_files() + executables
+
+        # All readers of a write run in the same shard, so the file system is only written once
+        def group(self) -> Optional[str]:
+            return "MatrixTest: %s: %s" % (self.writer.label, self.fixture.name())
+
+    def test_cases(self) -> List[ITestCase]:
+        # The first test case of each writer comes first, so all writes start early instead of
+        # the jobs being taken by test cases waiting for the same write.
+        first: List[ITestCase] = []
+        rest: List[ITestCase] = []
+        for fixture in self.data_fixtures:
+            for writer_index, writer in enumerate(self.versions):
+                readers = self.versions[writer_index:]
+                write = _SharedWrite(writer, fixture, num_readers=len(readers))
+                self._writes.append(write)
+                cases = [self._WriteReadTest(write, writer, reader, fixture) for reader in readers]
+                first += cases[:1]
+                rest += cases[1:]
+        return first + rest
+
+    async def cleanup(self) -> None:
+        for write in self._writes:
+            await write.cleanup()
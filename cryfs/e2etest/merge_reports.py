@@ -0,0 +1,17 @@
+import click
+import sys
+from typing import Optional, Tuple
+from cryfs.e2etest.test_framework.result import TestResults, TestStatus
+
+
+# Combines the --json-report files of several shards (see cryfs-e2etest --shard) into one summary and exit status
+@click.command()
+@click.argument('reports', nargs=-1, required=True)
+@click.option('--json-report', default=None, help='Write the merged report to this file.')
+@click.option('--slowest', default=10, help='Number of slowest test cases to show in the summary.')
+def merge_reports(reports: Tuple[str, ...], json_report: Optional[str], slowest: int) -> None:
+    result = TestResults.merge_json_reports(list(reports))
+    result.print(num_slowest=slowest)
+    if json_report is not None:
+        result.export_json(json_report)
+    sys.exit(0 if result.status() == TestStatus.SUCCESS else 1)
@@ -1,13 +1,18 @@
 import pkg_resources
-import shutil
-import tempfile
 import os
-from typing import List
-from cryfs.e2etest.utils.tar import TarFile, TarUnpacker
+from typing import Dict, List, Optional
+from cryfs.e2etest.utils.executor import AsyncTemporaryDirectory, run_blocking
+from cryfs.e2etest.utils.manifest import Manifest, load_or_create_manifest
+from cryfs.e2etest.utils.fixture_cache import CachedTarUnpacker, get_fixture_cache
+from cryfs.e2etest.utils.fs_trace import instrumented_copytree, trace_path_for, workload_fs
+from cryfs.e2etest.utils.instrumented_fs import Fs
+from cryfs.e2etest.utils.storage import scan_basedir
+from cryfs.e2etest.utils.tar import TarFile
 from cryfs.e2etest.fsmounter import IFsMounter
 from cryfs.e2etest.test_framework.test_case import ITestSuite, ITestCase
-from cryfs.e2etest.test_framework.logger import Logger
-from cryfs.e2etest.test_framework.dircomp import expect_dir_equals
+from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.test_framework.metrics import Phase, TestMetrics
+from cryfs.e2etest.test_framework.dircomp import expect_dir_matches_manifest_async
 
 
 class Fixture(object):
@@ -15,17 +20,62 @@ class Fixture(object):
         data_file = pkg_resources.resource_filename(__name__, data)
         self._data = data
         self._data_tar = TarFile(data_file)
+        self._manifest: Optional[Manifest] = None
 
-    def unpack_data(self) -> TarUnpacker:
-        return TarUnpacker(self._data_tar)
+    # The returned directory is shared with other test cases and must not be modified
+    def unpack_data(self, metrics: Optional[TestMetrics] = None) -> CachedTarUnpacker:
+        return get_fixture_cache().unpack(self._data_tar, metrics)
 
-    async def unpack_data_to(self, dest_path: str) -> None:
-        await self._data_tar.unpack(dest_path)
+    async def data_manifest(self) -> Manifest:
+        if self._manifest is None:
+            self._manifest = await run_blocking(load_or_create_manifest, self._data_tar.tar_path)
+        return self._manifest
+
+    async def unpack_data_to(self, dest_path: str, fs: Optional[Fs] = None) -> None:
+        await self._data_tar.unpack(dest_path, fs)
+
+    # Only extracts the given paths of the data tar file, see TarFile.unpack_members()
+    async def unpack_data_members_to(self, dest_path: str, paths: List[str], fs: Optional[Fs] = None) -> None:
+        await self._data_tar.unpack_members(dest_path, paths, fs)
+
+    def tar_files(self) -> List[str]:
+        return [self._data_tar.tar_path]
 
     def name(self) -> str:
         return self._data
 
 
+# Records how much space the file system written by a test case takes, and how much the daemon wrote to create it
+async def _report_storage(basedir: str, fixture: Fixture, logger: Logger, metrics: TestMetrics) -> None:
+    usage = metrics.daemon_usage()
+    report = await run_blocking(scan_basedir, basedir, (await fixture.data_manifest()).total_file_size(),
+                                usage.write_bytes if usage is not None else None)
+    metrics.storage = report
+    logger.log(LogLevel.INFO, "Storage: " + report.to_string())
+
+
+def _log_fs_ops(logger: Logger, metrics: TestMetrics) -> None:
+    logger.log_payload(LogLevel.INFO, "File system operation latencies", metrics.fs_ops.to_string())
+
+
+# The directory with the most file data below it, not counting directories containing all files.
+# Returns '' (the whole fixture) if there is no such directory.
+def largest_subdirectory(manifest: Manifest) -> str:
+    sizes: Dict[str, int] = {}
+    counts: Dict[str, int] = {}
+    files = [entry for entry in manifest.entries if entry.type == 'file']
+    for entry in files:
+        parts = entry.path.split('/')
+        for depth in range(1, len(parts)):
+            parent = '/'.join(parts[:depth])
+            sizes[parent] = sizes.get(parent, 0) + entry.size
+            counts[parent] = counts.get(parent, 0) + 1
+    candidates = [path for path in sizes if counts[path] < len(files)]
+    if len(candidates) == 0:
+        return ''
+    return max(candidates, key=lambda path: (sizes[path], path))
+
+
 fixtures = [Fixture(
     data="fixtures/scrypt_data.tar",
 ), Fixture(
@@ -42,43 +92,88 @@ class ReadWriteTests(ITestSuite):
             self.fixture = fixture
             self.mounter = mounter
 
-        async def run(self, logger: Logger) -> None:
+        async def run(self, logger: Logger, metrics: TestMetrics) -> None:
             password = b"mypassword"
-            with tempfile.TemporaryDirectory() as basedir:
-                async with self.fixture.unpack_data() as datadir:
-                    async with self.mounter.mount(basedir, password, logger) as mountdir:
+            manifest = await self.fixture.data_manifest()
+            async with AsyncTemporaryDirectory() as basedir:
+                async with self.fixture.unpack_data(metrics) as datadir:
+                    async with self.mounter.mount(basedir, password, logger, metrics) as mountdir:
                         _mountdir = os.path.join(mountdir, 'contents')
-                        shutil.copytree(datadir, _mountdir, symlinks=True)
-                        expect_dir_equals(datadir, _mountdir, logger)
-                    # unmount and remount, then test again
-                    async with self.mounter.mount(basedir, password, logger) as mountdir:
-                        _mountdir = os.path.join(mountdir, 'contents')
-                        expect_dir_equals(datadir, _mountdir, logger)
+                        with metrics.span(Phase.WORKLOAD):
+                            # The cached fixture is read-only, copy with the modes from the tar file instead
+                            metrics.fs_ops.merge(await run_blocking(instrumented_copytree, datadir, _mountdir, trace_path_for(self.name()),
+                                                                           manifest.modes()))
+                        _log_fs_ops(logger, metrics)
+                        await expect_dir_matches_manifest_async(manifest, _mountdir, logger, compare_modes=True, metrics=metrics)
+                await _report_storage(basedir, self.fixture, logger, metrics)
+                # unmount and remount, then test again
+                async with self.mounter.mount(basedir, password, logger, metrics) as mountdir:
+                    _mountdir = os.path.join(mountdir, 'contents')
+                    await expect_dir_matches_manifest_async(manifest, _mountdir, logger, compare_modes=True, metrics=metrics)
 
         def name(self) -> str:
             return "ReadWriteTest.copy_and_read: %s" % self.fixture.name()
 
+        def input_files(self) -> List[str]:
+            return self.fixture.tar_files()
+
     class _UntarAndReadTest(ITestCase):
         def __init__(self, fixture: Fixture, mounter: IFsMounter) -> None:
             self.fixture = fixture
             self.mounter = mounter
 
-        async def run(self, logger: Logger) -> None:
+        async def run(self, logger: Logger, metrics: TestMetrics) -> None:
             password = b"mypassword"
-            with tempfile.TemporaryDirectory() as basedir:
-                async with self.fixture.unpack_data() as datadir:
-                    async with self.mounter.mount(basedir, password, logger) as mountdir:
-                        await self.fixture.unpack_data_to(mountdir)
-                        expect_dir_equals(datadir, mountdir, logger)
-                    # unmount and remount, then test again
-                    async with self.mounter.mount(basedir, password, logger) as mountdir:
-                        expect_dir_equals(datadir, mountdir, logger)
+            manifest = await self.fixture.data_manifest()
+            async with AsyncTemporaryDirectory() as basedir:
+                async with self.mounter.mount(basedir, password, logger, metrics) as mountdir:
+                    with workload_fs(metrics.fs_ops, mountdir, trace_path_for(self.name())) as fs:
+                        with metrics.span(Phase.WORKLOAD):
+                            await self.fixture.unpack_data_to(mountdir, fs)
+                    _log_fs_ops(logger, metrics)
+                    await expect_dir_matches_manifest_async(manifest, mountdir, logger, compare_modes=True, metrics=metrics)
+                await _report_storage(basedir, self.fixture, logger, metrics)
+                # unmount and remount, then test again
+                async with self.mounter.mount(basedir, password, logger, metrics) as mountdir:
+                    await expect_dir_matches_manifest_async(manifest, mountdir, logger, compare_modes=True, metrics=metrics)
 
         def name(self) -> str:
             return "ReadWriteTest.untar_and_read: %s" % self.fixture.name()
 
+        def input_files(self) -> List[str]:
+            return self.fixture.tar_files()
+
+    # Only extracts one directory of the fixture, reading just its members from the tar file
+    class _UntarMembersAndReadTest(ITestCase):
+        def __init__(self, fixture: Fixture, mounter: IFsMounter) -> None:
+            self.fixture = fixture
+            self.mounter = mounter
+
+        async def run(self, logger: Logger, metrics: TestMetrics) -> None:
+            password = b"mypassword"
+            full_manifest = await self.fixture.data_manifest()
+            paths = [largest_subdirectory(full_manifest)]
+            manifest = full_manifest.select(paths)
+            async with AsyncTemporaryDirectory() as basedir:
+                async with self.mounter.mount(basedir, password, logger, metrics) as mountdir:
+                    with workload_fs(metrics.fs_ops, mountdir, trace_path_for(self.name())) as fs:
+                        with metrics.span(Phase.WORKLOAD):
+                            await self.fixture.unpack_data_members_to(mountdir, paths, fs)
+                    _log_fs_ops(logger, metrics)
+                    await expect_dir_matches_manifest_async(manifest, mountdir, logger, compare_modes=True, metrics=metrics)
+                # unmount and remount, then test again
+                async with self.mounter.mount(basedir, password, logger, metrics) as mountdir:
+                    await expect_dir_matches_manifest_async(manifest, mountdir, logger, compare_modes=True, metrics=metrics)
+
+        def name(self) -> str:
+            return "ReadWriteTest.untar_members_and_read: %s" % self.fixture.name()
+
+        def input_files(self) -> List[str]:
+            return self.fixture.tar_files()
+
     def test_cases(self) -> List[ITestCase]:
         result: List[ITestCase] = []
         result += [self._CopyAndReadTest(fixture, self.mounter) for fixture in fixtures]
         result += [self._UntarAndReadTest(fixture, self.mounter) for fixture in fixtures]
+        result += [self._UntarMembersAndReadTest(fixture, self.mounter) for fixture in fixtures]
         return result
@@ -0,0 +1,114 @@
+# Test CryFS with many processes writing to the same mount at the same time
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+from cryfs.e2etest.fsmounter import IFsMounter
+from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.test_framework.metrics import Phase, TestMetrics
+from cryfs.e2etest.test_framework.test_case import ITestSuite, ITestCase
+from cryfs.e2etest.utils.executor import AsyncTemporaryDirectory, run_blocking
+from cryfs.e2etest.utils.resource_limits import get_resource_limits
+from cryfs.e2etest.utils.stress import OpRecord, RoundStats, format_scaling, prepare_round, round_stats, verify_round
+
+
+DEFAULT_OPS_PER_WORKER = 2000
+# Number of record slots in the file all workers overwrite
+NUM_SLOTS = 64
+# Warn if adding workers makes the throughput drop below this fraction of the round with fewer workers
+CLIFF_RATIO = 0.5
+
+
+# Runs one stress worker process per worker and returns the records of all operations
+async def _run_workers(root: str, num_workers: int, num_ops: int, seed: int, logger: Logger) -> List[OpRecord]:
+    processes = [await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "cryfs.e2etest.utils.stress", "--root", root, "--worker", str(worker), "--num-ops", str(num_ops),
+        "--seed", str(seed), "--num-slots", str(NUM_SLOTS),
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE) for worker in range(num_workers)]
+    try:
+        # Start all workers at the same time, once they are done starting up
+        for process in processes:
+            assert process.stdout is not None
+            await process.stdout.readline()
+        for process in processes:
+            assert process.stdin is not None
+            process.stdin.write(b"go\n")
+            await process.stdin.drain()
+        outputs = await asyncio.gather(*[process.communicate() for process in processes])
+    except BaseException:
+        for process in processes:
+            if process.returncode is None:
+                process.kill()
+        raise
+    records: List[OpRecord] = []
+    for worker, ((stdout, _), process) in enumerate(zip(outputs, processes)):
+        if process.returncode != 0:
+            logger.log(LogLevel.ERROR, "Stress worker %d exited with code %s" % (worker, process.returncode))
+            continue
+        output = json.loads(stdout.decode('UTF-8'))
+        records += [OpRecord(**record) for record in output["records"]]
+        for error in output["errors"]:
+            logger.log(LogLevel.ERROR, error)
+    return records
+
+
+class StressTests(ITestSuite):
+    # One round is run for each entry of `worker_counts`, e.g. [1, 2, 4, 8], all in the same mount
+    def __init__(self, mounter: IFsMounter, worker_counts: List[int], ops_per_worker: int = DEFAULT_OPS_PER_WORKER, seed: int = 0) -> None:
+        self.mounter = mounter
+        self.worker_counts = worker_counts
+        self.ops_per_worker = ops_per_worker
+        self.seed = seed
+
+    class _MultiWriterTest(ITestCase):
+        def __init__(self, mounter: IFsMounter, worker_counts: List[int], ops_per_worker: int, seed: int) -> None:
+            self.mounter = mounter
+            self.worker_counts = worker_counts
+            self.ops_per_worker = ops_per_worker
+            self.seed = seed
+
+        async def run(self, logger: Logger, metrics: TestMetrics) -> None:
+            password = b"mypassword"
+            rounds: List[Tuple[str, int, List[OpRecord]]] = []
+            stats: List[RoundStats] = []
+            async with AsyncTemporaryDirectory() as basedir:
+                async with self.mounter.mount(basedir, password, logger, metrics) as mountdir:
+                    for num_workers in self.worker_counts:
+                        name = "round%d_%dworkers" % (len(rounds), num_workers)
+                        await run_blocking(prepare_round, os.path.join(mountdir, name), NUM_SLOTS)
+                        with metrics.span(Phase.WORKLOAD):
+                            records = await _run_workers(os.path.join(mountdir, name), num_workers, self.ops_per_worker, self.seed, logger)
+                        rounds.append((name, num_workers, records))
+                        stats.append(round_stats(records, num_workers))
+                        metrics.throughput["ops_per_sec.%dworkers" % num_workers] = stats[-1].ops_per_second()
+                    # Check what the workers see before remounting, too
+                    await self._verify(mountdir, rounds, logger, metrics)
+                self._report_scaling(stats, logger)
+                # unmount and remount, then verify again
+                async with self.mounter.mount(basedir, password, logger, metrics) as mountdir:
+                    await self._verify(mountdir, rounds, logger, metrics)
+
+        async def _verify(self, mountdir: str, rounds: List[Tuple[str, int, List[OpRecord]]], logger: Logger, metrics: TestMetrics) -> None:
+            async with get_resource_limits().comparison():
+                with metrics.span(Phase.COMPARISON):
+                    for name, num_workers, records in rounds:
+                        for error in await run_blocking(verify_round, os.path.join(mountdir, name), records, num_workers, NUM_SLOTS):
+                            logger.log(LogLevel.ERROR, "%s: %s" % (name, error))
+
+        def _report_scaling(self, stats: List[RoundStats], logger: Logger) -> None:
+            logger.log_payload(LogLevel.INFO, "Stress test throughput", format_scaling(stats))
+            for previous, current in zip(stats, stats[1:]):
+                if current.num_workers > previous.num_workers and current.ops_per_second() < CLIFF_RATIO * previous.ops_per_second():
+                    logger.log(LogLevel.WARNING, "Throughput cliff: %.1f ops/s with %d workers, but %.1f ops/s with %d workers" % (
+                        current.ops_per_second(), current.num_workers, previous.ops_per_second(), previous.num_workers))
+
+        def name(self) -> str:
+            return "StressTest.multi_writer: %s workers, %d ops each" % (",".join(str(count) for count in self.worker_counts), self.ops_per_worker)
+
+    def test_cases(self) -> List[ITestCase]:
+        if len(self.worker_counts) == 0:
+            return []
+        return [self._MultiWriterTest(self.mounter, self.worker_counts, self.ops_per_worker, self.seed)]
@@ -0,0 +1,47 @@
+# Test CryFS with large generated datasets. The expected content is regenerated from the seed, so nothing is stored on disk.
+
+from typing import List
+from cryfs.e2etest.fsmounter import IFsMounter
+from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.test_framework.metrics import Phase, TestMetrics
+from cryfs.e2etest.test_framework.test_case import ITestSuite, ITestCase
+from cryfs.e2etest.utils.executor import AsyncTemporaryDirectory, run_blocking
+from cryfs.e2etest.utils.resource_limits import get_resource_limits
+from cryfs.e2etest.utils.synthetic import DatasetShape, verify_dataset, write_dataset
+
+
+async def _expect_dataset(shape: DatasetShape, dir: str, logger: Logger, metrics: TestMetrics) -> None:
+    async with get_resource_limits().comparison():
+        with metrics.span(Phase.COMPARISON):
+            errors = await run_blocking(verify_dataset, shape, dir)
+    for error in errors:
+        logger.log(LogLevel.ERROR, error)
+
+
+class SyntheticTests(ITestSuite):
+    def __init__(self, mounter: IFsMounter, shapes: List[DatasetShape]) -> None:
+        self.mounter = mounter
+        self.shapes = shapes
+
+    class _WriteAndReadTest(ITestCase):
+        def __init__(self, shape: DatasetShape, mounter: IFsMounter) -> None:
+            self.shape = shape
+            self.mounter = mounter
+
+        async def run(self, logger: Logger, metrics: TestMetrics) -> None:
+            password = b"mypassword"
+            async with AsyncTemporaryDirectory() as basedir:
+                async with self.mounter.mount(basedir, password, logger, metrics) as mountdir:
+                    with metrics.span(Phase.WORKLOAD):
+                        stats = await run_blocking(write_dataset, self.shape, mountdir)
+                    logger.log(LogLevel.INFO, "Wrote %s" % stats.to_string())
+                    await _expect_dataset(self.shape, mountdir, logger, metrics)
+                # unmount and remount, then test again
+                async with self.mounter.mount(basedir, password, logger, metrics) as mountdir:
+                    await _expect_dataset(self.shape, mountdir, logger, metrics)
+
+        def name(self) -> str:
+            return "SyntheticTest.write_and_read: %s" % self.shape.to_string()
+
+    def test_cases(self) -> List[ITestCase]:
+        return [self._WriteAndReadTest(shape, self.mounter) for shape in self.shapes]
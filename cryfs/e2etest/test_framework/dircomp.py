@@ -1,79 +1,225 @@
+from typing import Dict, List, Optional, Tuple
+import hashlib
 import os
+import stat
+from io import RawIOBase
+import time
 from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.test_framework.metrics import Phase, TestMetrics, span
+from cryfs.e2etest.utils.manifest import Manifest, ManifestEntry
+from cryfs.e2etest.utils.executor import run_in_thread
+from cryfs.e2etest.utils.resource_limits import get_resource_limits
+
+
+# Size of the blocks file contents are compared in. Files are never loaded into memory as a whole.
+CHUNK_SIZE = 1024 * 1024
+
+
+class _ComparisonStats(object):
+    def __init__(self) -> None:
+        self.num_files = 0
+        self.num_bytes = 0
+        self._start = time.perf_counter()
+
+    def log_throughput(self, logger: Logger) -> None:
+        duration = time.perf_counter() - self._start
+        throughput = self.num_bytes / duration / 1024 / 1024 if duration > 0 else float('inf')
+        logger.log(LogLevel.INFO, "Verified %d files (%d bytes) in %.3fs: %.2f MB/s" % (self.num_files, self.num_bytes, duration, throughput))
 
 
 # Returns true, iff both file system nodes are equal, i.e.
 #  - either both are files and have same attributes and contents
 #  - or both are symlinks and have same attributes and target
 #  - or both are directories and have same attributes and entries, which are also equal (recursively)
-def expect_filesystem_node_equals(node1: str, node2: str, logger: Logger) -> None:
-    if not _attributes_equals(node1, node2):
+# The time the comparison takes is recorded in `metrics`, if given.
+def expect_filesystem_node_equals(node1: str, node2: str, logger: Logger, metrics: Optional[TestMetrics] = None) -> None:
+    with span(metrics, Phase.COMPARISON):
+        stats = _ComparisonStats()
+        _expect_node_equals(node1, os.stat(node1, follow_symlinks=False), node2, os.stat(node2, follow_symlinks=False), logger, stats)
+    stats.log_throughput(logger)
+
+
+def expect_dir_equals(node1: str, node2: str, logger: Logger, metrics: Optional[TestMetrics] = None) -> None:
+    with span(metrics, Phase.COMPARISON):
+        stats = _ComparisonStats()
+        _expect_dir_equals(node1, node2, logger, stats)
+    stats.log_throughput(logger)
+
+
+# Like expect_dir_equals, but waits for a free comparison slot first (see ResourceLimits) and doesn't block the event loop
+async def expect_dir_equals_async(node1: str, node2: str, logger: Logger, metrics: Optional[TestMetrics] = None) -> None:
+    async with get_resource_limits().comparison():
+        await run_in_thread(expect_dir_equals, node1, node2, logger, metrics)
+
+
+# Checks that `dir` has the same contents as the tar file the manifest was created from, without needing an extracted copy.
+# Owners are expected to be what extracting the tar file with `tar --numeric-owner` would have created.
+# With `compare_modes`, modes must be the ones from the tar file, i.e. `dir` must have been written without applying the umask.
+def expect_dir_matches_manifest(manifest: Manifest, dir: str, logger: Logger, compare_modes: bool = False,
+                                metrics: Optional[TestMetrics] = None) -> None:
+    with span(metrics, Phase.COMPARISON):
+        stats = _ComparisonStats()
+        children: Dict[str, List[ManifestEntry]] = {}
+        for entry in manifest.entries:
+            if entry.path != '':
+                children.setdefault(entry.path.rpartition('/')[0], []).append(entry)
+        # Like expect_dir_equals, this only compares the entries of `dir` but not `dir` itself
+        _expect_dir_matches_manifest(ManifestEntry(path='', type='dir'), dir, children, compare_modes, logger, stats)
+    stats.log_throughput(logger)
+
+
+async def expect_dir_matches_manifest_async(manifest: Manifest, dir: str, logger: Logger, compare_modes: bool = False,
+                                            metrics: Optional[TestMetrics] = None) -> None:
+    async with get_resource_limits().comparison():
+        await run_in_thread(expect_dir_matches_manifest, manifest, dir, logger, compare_modes, metrics)
+
+
+def expect_file_equals(node1: str, node2: str, logger: Logger) -> None:
+    _expect_file_equals(node1, node2, logger, _ComparisonStats())
+
+
+def expect_symlink_equals(node1: str, node2: str, logger: Logger) -> None:
+    if os.readlink(node1) != os.readlink(node2):
+        logger.log(LogLevel.ERROR, "Symlinks have different targets: %s and %s" % (node1, node2))
+
+
+# Compares the node types and attributes based on the already available stat results,
+# and only reads file contents if sizes and types match.
+def _expect_node_equals(node1: str, stat1: os.stat_result, node2: str, stat2: os.stat_result, logger: Logger, stats: _ComparisonStats) -> None:
+    if not _attributes_equals(stat1, stat2):
         logger.log(LogLevel.ERROR, "Attributes different: %s and %s" % (node1, node2))
-    # Need to check for symlinks first, because os.path.isdir and os.path.isfile return True for symlinks
-    if os.path.islink(node1):
-        if not os.path.islink(node2):
+    # stat results are taken without following symlinks, so S_ISLNK has to be checked separately from S_ISDIR/S_ISREG.
+    if stat.S_ISLNK(stat1.st_mode):
+        if not stat.S_ISLNK(stat2.st_mode):
             logger.log(LogLevel.ERROR, "%s is a symlink but %s is not" % (node1, node2))
         else:
             expect_symlink_equals(node1, node2, logger)
-    elif os.path.isdir(node1):
-        if not os.path.isdir(node2):
+    elif stat.S_ISDIR(stat1.st_mode):
+        if not stat.S_ISDIR(stat2.st_mode):
             logger.log(LogLevel.ERROR, "%s is a dir but %s is not" % (node1, node2))
         else:
-            expect_dir_equals(node1, node2, logger)
-    elif os.path.isfile(node1):
-        if not os.path.isfile(node2):
+            _expect_dir_equals(node1, node2, logger, stats)
+    elif stat.S_ISREG(stat1.st_mode):
+        if not stat.S_ISREG(stat2.st_mode):
             logger.log(LogLevel.ERROR, "%s is a file but %s is not" % (node1, node2))
+        elif stat1.st_size != stat2.st_size:
+            # Already reported as attribute difference, no need to read the contents
+            pass
         else:
-            expect_file_equals(node1, node2, logger)
+            _expect_file_equals(node1, node2, logger, stats)
     else:
         logger.log(LogLevel.FATAL, "Unknown filesystem node type: %s" % node1)
 
 
-def _attributes_equals(node1: str, node2: str) -> bool:
-    stat1 = os.stat(node1, follow_symlinks=False)
-    stat2 = os.stat(node2, follow_symlinks=False)
-    # TODO Compare more attributes (especially atime, mtime, ctime)
-    #print("mode %s vs %s" % (stat1.st_mode, stat2.st_mode))
-    #print("nlink %s vs %s" % (stat1.st_nlink, stat2.st_nlink))
-    #print("uid %s vs %s" % (stat1.st_uid, stat2.st_uid))
-    #print("gid %s vs %s" % (stat1.st_gid, stat2.st_gid))
-    #print("isdir: %d", os.path.isdir(node1))
-    #print("size %s vs %s" % (stat1.st_size, stat2.st_size))
-    #print("atime %s vs %s" % (stat1.st_atime, stat2.st_atime))
-    #print("mtime %s vs %s" % (stat1.st_mtime, stat2.st_mtime))
-    #print("ctime %s vs %s" % (stat1.st_ctime, stat2.st_ctime))
-    #return stat1.st_mode == stat2.st_mode  \
-    #  and stat1.st_nlink == stat2.st_nlink \
-    #  and stat1.st_uid == stat2.st_uid     \
-    #  and stat1.st_gid == stat2.st_gid     \
-    #  and (os.path.isdir(node1) or stat1.st_size == stat2.st_size)   \
-    #  and stat1.st_atime == stat2.st_atime \
-    #  and stat1.st_mtime == stat2.st_mtime \
-    #  and stat1.st_ctime == stat2.st_ctime
+def _attributes_equals(stat1: os.stat_result, stat2: os.stat_result) -> bool:
+    # TODO Compare more attributes (especially mode, nlink, atime, mtime, ctime)
     return stat1.st_uid == stat2.st_uid     \
       and stat1.st_gid == stat2.st_gid     \
-      and (os.path.isdir(node1) or stat1.st_size == stat2.st_size)
+      and (stat.S_ISDIR(stat1.st_mode) or stat1.st_size == stat2.st_size)
 
 
-def expect_dir_equals(node1: str, node2: str, logger: Logger) -> None:
-    # TODO Could be faster using os.scandir() instead of os.listdir() because that already returns the stat information
-    entries1 = sorted(os.listdir(node1))
-    entries2 = sorted(os.listdir(node2))
-    if entries1 != entries2:
+def _expect_dir_equals(node1: str, node2: str, logger: Logger, stats: _ComparisonStats) -> None:
+    # os.scandir() returns the file type together with the entry and caches the stat result,
+    # so each entry is stat'ed at most once.
+    with os.scandir(node1) as it1, os.scandir(node2) as it2:
+        entries1 = {entry.name: entry for entry in it1}
+        entries2 = {entry.name: entry for entry in it2}
+    if sorted(entries1.keys()) != sorted(entries2.keys()):
         logger.log(LogLevel.ERROR, "Different directory entries: %s and %s" % (node1, node2))
     else:
-        for entry in entries1:
-            expect_filesystem_node_equals(os.path.join(node1, entry), os.path.join(node2, entry), logger)
+        for name in sorted(entries1.keys()):
+            entry1 = entries1[name]
+            entry2 = entries2[name]
+            _expect_node_equals(entry1.path, entry1.stat(follow_symlinks=False), entry2.path, entry2.stat(follow_symlinks=False), logger, stats)
 
 
-def expect_file_equals(node1: str, node2: str, logger: Logger) -> None:
-    with open(node1, 'rb') as file1, open(node2, 'rb') as file2:
-        content1 = file1.read()
-        content2 = file2.read()
-        if content1 != content2:
-            logger.log(LogLevel.ERROR, "File contents differ: %s and %s" % (node1, node2))
+def _expect_file_equals(node1: str, node2: str, logger: Logger, stats: _ComparisonStats) -> None:
+    buffer1 = bytearray(CHUNK_SIZE)
+    buffer2 = bytearray(CHUNK_SIZE)
+    view1 = memoryview(buffer1)
+    view2 = memoryview(buffer2)
+    offset = 0
+    with open(node1, 'rb', buffering=0) as file1, open(node2, 'rb', buffering=0) as file2:
+        while True:
+            read1 = _read_chunk(file1, view1)
+            read2 = _read_chunk(file2, view2)
+            stats.num_bytes += read1
+            if read1 != read2 or view1[:read1] != view2[:read2]:
+                logger.log(LogLevel.ERROR, "File contents differ: %s and %s (in block at offset %d)" % (node1, node2, offset))
+                break
+            if read1 == 0:
+                break
+            offset += read1
+    stats.num_files += 1
 
 
-def expect_symlink_equals(node1: str, node2: str, logger: Logger) -> None:
-    if os.readlink(node1) != os.readlink(node2):
-        logger.log(LogLevel.ERROR, "Symlinks have different targets: %s and %s" % (node1, node2))
+# Fills the buffer as far as possible. Only returns less than the buffer size at the end of the file.
+def _read_chunk(file: RawIOBase, view: memoryview) -> int:
+    total = 0
+    while total < len(view):
+        num_read = file.readinto(view[total:])
+        if not num_read:
+            break
+        total += num_read
+    return total
+
+
+def _expected_owner(entry: ManifestEntry) -> Tuple[int, int]:
+    # Extracting only restores owners when running as root, otherwise everything is owned by the current user.
+    # The owners are the numeric ids from the tar file, like `tar --numeric-owner` and TarFile.unpack() extract them.
+    if os.geteuid() == 0 and entry.uid is not None and entry.gid is not None:
+        return (entry.uid, entry.gid)
+    return (os.getuid(), os.getgid())
+
+
+def _expect_node_matches_manifest(entry: ManifestEntry, node: str, node_stat: os.stat_result, children: Dict[str, List[ManifestEntry]],
+                                  compare_modes: bool, logger: Logger, stats: _ComparisonStats) -> None:
+    if (node_stat.st_uid, node_stat.st_gid) != _expected_owner(entry) or \
+            (entry.type != 'dir' and node_stat.st_size != entry.size):
+        logger.log(LogLevel.ERROR, "Attributes different: %s and %s" % (entry.path, node))
+    elif compare_modes and entry.type != 'symlink' and entry.mode is not None and stat.S_IMODE(node_stat.st_mode) != entry.mode:
+        logger.log(LogLevel.ERROR, "Modes different: %s (%o) and %s (%o)" % (entry.path, entry.mode, node, stat.S_IMODE(node_stat.st_mode)))
+    if entry.type == 'symlink':
+        if not stat.S_ISLNK(node_stat.st_mode):
+            logger.log(LogLevel.ERROR, "%s is a symlink but %s is not" % (entry.path, node))
+        elif os.readlink(node) != entry.symlink_target:
+            logger.log(LogLevel.ERROR, "Symlinks have different targets: %s and %s" % (entry.path, node))
+    elif entry.type == 'dir':
+        if not stat.S_ISDIR(node_stat.st_mode):
+            logger.log(LogLevel.ERROR, "%s is a dir but %s is not" % (entry.path, node))
+        else:
+            _expect_dir_matches_manifest(entry, node, children, compare_modes, logger, stats)
+    elif entry.type == 'file':
+        if not stat.S_ISREG(node_stat.st_mode):
+            logger.log(LogLevel.ERROR, "%s is a file but %s is not" % (entry.path, node))
+        elif node_stat.st_size == entry.size:
+            _expect_file_matches_hash(entry, node, logger, stats)
+    else:
+        logger.log(LogLevel.FATAL, "Unknown filesystem node type in manifest: %s" % entry.path)
+
+
+def _expect_dir_matches_manifest(entry: ManifestEntry, node: str, children: Dict[str, List[ManifestEntry]], compare_modes: bool,
+                                 logger: Logger, stats: _ComparisonStats) -> None:
+    expected = {child.path.rpartition('/')[2]: child for child in children.get(entry.path, [])}
+    with os.scandir(node) as it:
+        actual = {dir_entry.name: dir_entry for dir_entry in it}
+    if sorted(expected.keys()) != sorted(actual.keys()):
+        logger.log(LogLevel.ERROR, "Different directory entries: %s and %s" % (entry.path, node))
+    else:
+        for name in sorted(expected.keys()):
+            _expect_node_matches_manifest(expected[name], actual[name].path, actual[name].stat(follow_symlinks=False), children, compare_modes, logger, stats)
+
+
+def _expect_file_matches_hash(entry: ManifestEntry, node: str, logger: Logger, stats: _ComparisonStats) -> None:
+    hasher = hashlib.sha256()
+    view = memoryview(bytearray(CHUNK_SIZE))
+    with open(node, 'rb', buffering=0) as file:
+        while True:
+            num_read = _read_chunk(file, view)
+            if num_read == 0:
+                break
+            hasher.update(view[:num_read])
+            stats.num_bytes += num_read
+    stats.num_files += 1
+    if hasher.hexdigest() != entry.sha256:
+        logger.log(LogLevel.ERROR, "File contents differ: %s and %s" % (entry.path, node))
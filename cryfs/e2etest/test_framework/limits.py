@@ -0,0 +1,23 @@
+from typing import List, Optional
+import attr
+from cryfs.e2etest.test_framework.metrics import TestMetrics
+
+
+# Upper bounds for the resource usage of the CryFS daemon during a test case. None means unlimited.
+@attr.s(auto_attribs=True)
+class DaemonLimits(object):
+    max_peak_rss_bytes: Optional[int] = None
+    max_cpu_time: Optional[float] = None
+
+    # Returns a message for each limit the test case exceeded
+    def check(self, metrics: TestMetrics) -> List[str]:
+        usage = metrics.daemon_usage()
+        if usage is None:
+            return []
+        violations = []
+        if self.max_peak_rss_bytes is not None and usage.peak_rss_bytes > self.max_peak_rss_bytes:
+            violations.append("CryFS daemon peak RSS was %.1f MB, limit is %.1f MB" % (
+                usage.peak_rss_bytes / 1024 / 1024, self.max_peak_rss_bytes / 1024 / 1024))
+        if self.max_cpu_time is not None and usage.cpu_time() > self.max_cpu_time:
+            violations.append("CryFS daemon used %.2fs CPU time, limit is %.2fs" % (usage.cpu_time(), self.max_cpu_time))
+        return violations
@@ -1,9 +1,20 @@
-from typing import List
+from typing import Any, Deque, Dict, IO, Iterator, List, Optional, Tuple
 import attr
-from functools import reduce
+import collections
+import heapq
+import os
+import threading
 from enum import Enum
 
 
+# Number of INFO log entries kept in memory. Older entries are only available in the log file, if there is one.
+DEFAULT_MAX_ENTRIES = 1000
+# Payloads larger than this (e.g. the CryFS log) are only kept in the log file, or truncated if there is none.
+DEFAULT_MAX_PAYLOAD_SIZE = 64 * 1024
+
+_COPY_BLOCK_SIZE = 1024 * 1024
+
+
 class LogLevel(Enum):
     INFO = 1
     WARNING = 2
@@ -18,6 +29,13 @@ class LogLevel(Enum):
             LogLevel.FATAL: "FATAL",
         }[self]
 
+    @staticmethod
+    def from_string(name: str) -> 'LogLevel':
+        for level in LogLevel:
+            if level.to_string() == name:
+                return level
+        raise ValueError("Unknown log level: %s" % name)
+
 
 @attr.s(auto_attribs=True)
 class LogEntry(object):
@@ -28,16 +46,127 @@ class LogEntry(object):
         return "[%s] %s" % (self.level.to_string(), self.message)
 
 
+# Keeps the most recent `max_entries` INFO log entries and all entries with higher levels in memory, so the log of a failing test
+# always shows why it failed. Counts entries per level, so status checks don't scan the log.
+# If `log_file` is given, all entries are also appended to that file, and large payloads are streamed there
+# instead of being kept in memory. The file stays open until close() is called.
 class Logger(object):
-    def __init__(self) -> None:
-        self._log: List[LogEntry] = []
+    def __init__(self, log_file: Optional[str] = None, max_entries: int = DEFAULT_MAX_ENTRIES, max_payload_size: int = DEFAULT_MAX_PAYLOAD_SIZE) -> None:
+        # Entries together with their position in the log, to restore the order when merging both
+        self._info: Deque[Tuple[int, LogEntry]] = collections.deque(maxlen=max_entries)
+        self._important: List[Tuple[int, LogEntry]] = []
+        self._next_index = 0
+        self._num_dropped = 0
+        self._counts: Dict[LogLevel, int] = {level: 0 for level in LogLevel}
+        self._log_file = log_file
+        self._file: Optional[IO[str]] = None
+        # log_file_contents() runs on a thread, other entries can be logged meanwhile
+        self._file_lock = threading.Lock()
+        self._max_payload_size = max_payload_size
 
     def log(self, level: LogLevel, message: str) -> None:
-        self._log.append(LogEntry(level=level, message=message))
+        entry = LogEntry(level=level, message=message)
+        self._append(entry)
+        if self._log_file is not None:
+            with self._file_lock:
+                self._open_file().write(entry.to_string() + "\n")
+
+    # Logs a potentially large text. It is only kept in memory if it is small.
+    def log_payload(self, level: LogLevel, title: str, payload: str) -> None:
+        if len(payload) <= self._max_payload_size:
+            self.log(level, "%s:\n%s" % (title, payload))
+        elif self._log_file is not None:
+            with self._file_lock:
+                self._open_file().write("[%s] %s:\n%s\n" % (level.to_string(), title, payload))
+            self._append(LogEntry(level=level, message="%s: %d characters, see %s" % (title, len(payload), self._log_file)))
+        else:
+            self._append(LogEntry(level=level, message="%s (truncated to last %d characters):\n%s" % (title, self._max_payload_size, payload[-self._max_payload_size:])))
+
+    # Logs the contents of a file, e.g. the CryFS log. It is streamed into the log file and only kept in memory if it is small.
+    def log_file_contents(self, level: LogLevel, title: str, path: str) -> None:
+        size = os.path.getsize(path)
+        if size <= self._max_payload_size:
+            with open(path, 'r', errors='replace') as source:
+                self.log(level, "%s:\n%s" % (title, source.read()))
+        elif self._log_file is not None:
+            with open(path, 'r', errors='replace') as source, self._file_lock:
+                file = self._open_file()
+                file.write("[%s] %s:\n" % (level.to_string(), title))
+                while True:
+                    block = source.read(_COPY_BLOCK_SIZE)
+                    if not block:
+                        break
+                    file.write(block)
+                file.write("\n")
+            self._append(LogEntry(level=level, message="%s: %d bytes, see %s" % (title, size, self._log_file)))
+        else:
+            with open(path, 'rb') as source:
+                source.seek(size - self._max_payload_size)
+                tail = source.read().decode('UTF-8', errors='replace')
+            self._append(LogEntry(level=level, message="%s (truncated to last %d bytes):\n%s" % (title, self._max_payload_size, tail)))
+
+    # Must be called with _file_lock held
+    def _open_file(self) -> IO[str]:
+        assert self._log_file is not None
+        if self._file is None:
+            self._file = open(self._log_file, 'a')
+        return self._file
+
+    # Flushes and closes the log file. Entries logged afterwards open it again.
+    def close(self) -> None:
+        with self._file_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _append(self, entry: LogEntry) -> None:
+        index = self._next_index
+        self._next_index += 1
+        if entry.level == LogLevel.INFO:
+            if len(self._info) == self._info.maxlen:
+                self._num_dropped += 1
+            self._info.append((index, entry))
+        else:
+            self._important.append((index, entry))
+        self._counts[entry.level] += 1
+
+    def _entries(self) -> Iterator[LogEntry]:
+        for _, entry in heapq.merge(self._info, self._important):
+            yield entry
 
     def contains_entry_with_level(self, level: LogLevel) -> bool:
-        filtered = [entry for entry in self._log if entry.level == level]
-        return len(filtered) != 0
+        return self._counts[level] != 0
+
+    def count_entries_with_level(self, level: LogLevel) -> int:
+        return self._counts[level]
+
+    def log_file(self) -> Optional[str]:
+        return self._log_file
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "entries": [{"level": entry.level.to_string(), "message": entry.message} for entry in self._entries()],
+            "num_dropped": self._num_dropped,
+            "counts": {level.to_string(): count for level, count in self._counts.items()},
+            "log_file": self._log_file,
+        }
+
+    # Restores a logger exported with to_json(), e.g. to merge results of test runs in other processes.
+    # Entry counts (and therefore the test status) include entries that were dropped from memory.
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> 'Logger':
+        logger = Logger(max_entries=max(DEFAULT_MAX_ENTRIES, len(data["entries"])))
+        for entry in data["entries"]:
+            logger._append(LogEntry(level=LogLevel.from_string(entry["level"]), message=entry["message"]))
+        logger._num_dropped = data["num_dropped"]
+        logger._counts = {level: data["counts"].get(level.to_string(), 0) for level in LogLevel}
+        logger._log_file = data["log_file"]
+        return logger
 
     def to_string(self) -> str:
-        return reduce(lambda s, i: s + i.to_string() + "\n", self._log, "")
+        lines = []
+        if self._num_dropped > 0:
+            where = (", see %s" % self._log_file) if self._log_file is not None else ""
+            lines.append("[... %d earlier entries omitted%s]\n" % (self._num_dropped, where))
+        lines.extend(entry.to_string() + "\n" for entry in self._entries())
+        return "".join(lines)
@@ -0,0 +1,146 @@
+from typing import Any, Dict, List, Optional
+from types import TracebackType
+from enum import Enum
+import attr
+import time
+from cryfs.e2etest.utils.cryfs_log import MountProfile
+from cryfs.e2etest.utils.instrumented_fs import FsOpStats
+from cryfs.e2etest.utils.loop_lag import LoopLag
+from cryfs.e2etest.utils.proc import ProcessUsage
+from cryfs.e2etest.utils.storage import StorageReport
+
+
+class Phase(Enum):
+    FIXTURE_UNPACK = 1
+    MOUNT = 2
+    WORKLOAD = 3
+    COMPARISON = 4
+    UNMOUNT = 5
+    CLEANUP = 6
+
+    def to_string(self) -> str:
+        return {
+            Phase.FIXTURE_UNPACK: "fixture_unpack",
+            Phase.MOUNT: "mount",
+            Phase.WORKLOAD: "workload",
+            Phase.COMPARISON: "comparison",
+            Phase.UNMOUNT: "unmount",
+            Phase.CLEANUP: "cleanup",
+        }[self]
+
+    @staticmethod
+    def from_string(name: str) -> 'Phase':
+        for phase in Phase:
+            if phase.to_string() == name:
+                return phase
+        raise ValueError("Unknown phase: %s" % name)
+
+
+@attr.s(auto_attribs=True)
+class Span(object):
+    phase: Phase
+    # Seconds since the test case started
+    start: float
+    duration: float
+
+
+class _SpanContext(object):
+    def __init__(self, metrics: Optional['TestMetrics'], phase: Phase) -> None:
+        self._metrics = metrics
+        self._phase = phase
+        self._start = 0.0
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(self, exc_type: Optional[type], exc: Optional[BaseException], tb: Optional[TracebackType]) -> None:
+        if self._metrics is not None:
+            self._metrics.add_span(self._phase, self._start, time.perf_counter() - self._start)
+
+
+# Performance data recorded while a test case runs
+class TestMetrics(object):
+    def __init__(self) -> None:
+        self._created = time.perf_counter()
+        self.spans: List[Span] = []
+        # Wall-clock duration of the whole test case
+        self.duration = 0.0
+        # Resource usage of the CryFS daemon, one entry per mount
+        self.daemon_usages: List[ProcessUsage] = []
+        # Timings of each mount/unmount cycle
+        self.mount_profiles: List[MountProfile] = []
+        # Disk space used by the file system the test case wrote, if it reported it
+        self.storage: Optional[StorageReport] = None
+        # How much the event loop was stalled while the test case ran, by any test case
+        self.loop_lag: Optional[LoopLag] = None
+        # Throughput-like values where higher is better, e.g. operations per second, by name
+        self.throughput: Dict[str, float] = {}
+        # Latencies of the file system operations of workloads that run through an InstrumentedFs
+        self.fs_ops = FsOpStats()
+
+    # Context manager recording the time spent in the `with` block as a span of the given phase.
+    # Also usable around `await` statements.
+    def span(self, phase: Phase) -> _SpanContext:
+        return _SpanContext(self, phase)
+
+    def add_span(self, phase: Phase, start: float, duration: float) -> None:
+        self.spans.append(Span(phase=phase, start=start - self._created, duration=duration))
+
+    def phase_duration(self, phase: Phase) -> float:
+        return sum(span.duration for span in self.spans if span.phase == phase)
+
+    def add_mount_profile(self, profile: MountProfile) -> None:
+        self.mount_profiles.append(profile)
+
+    def add_daemon_usage(self, usage: ProcessUsage) -> None:
+        self.daemon_usages.append(usage)
+
+    # Resource usage of all CryFS daemons of this test case. Peak RSS is the maximum over all mounts, the counters are summed.
+    def daemon_usage(self) -> Optional[ProcessUsage]:
+        if len(self.daemon_usages) == 0:
+            return None
+        return ProcessUsage(
+            peak_rss_bytes=max(usage.peak_rss_bytes for usage in self.daemon_usages),
+            user_time=sum(usage.user_time for usage in self.daemon_usages),
+            system_time=sum(usage.system_time for usage in self.daemon_usages),
+            voluntary_context_switches=sum(usage.voluntary_context_switches for usage in self.daemon_usages),
+            involuntary_context_switches=sum(usage.involuntary_context_switches for usage in self.daemon_usages),
+            read_bytes=sum(usage.read_bytes for usage in self.daemon_usages),
+            write_bytes=sum(usage.write_bytes for usage in self.daemon_usages),
+            num_samples=sum(usage.num_samples for usage in self.daemon_usages),
+        )
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "duration": self.duration,
+            "phases": {phase.to_string(): self.phase_duration(phase) for phase in Phase},
+            "spans": [{"phase": span.phase.to_string(), "start": span.start, "duration": span.duration} for span in self.spans],
+            "daemon": [attr.asdict(usage) for usage in self.daemon_usages],
+            "mounts": [attr.asdict(profile) for profile in self.mount_profiles],
+            "storage": self.storage.to_json() if self.storage is not None else None,
+            "loop_lag": attr.asdict(self.loop_lag) if self.loop_lag is not None else None,
+            "throughput": self.throughput,
+            "fs_ops": self.fs_ops.to_json(),
+        }
+
+    # Restores metrics exported with to_json(), e.g. to merge results of test runs in other processes
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> 'TestMetrics':
+        metrics = TestMetrics()
+        metrics.duration = data["duration"]
+        metrics.spans = [Span(phase=Phase.from_string(span["phase"]), start=span["start"], duration=span["duration"])
+                         for span in data["spans"]]
+        metrics.daemon_usages = [ProcessUsage(**usage) for usage in data.get("daemon", [])]
+        metrics.mount_profiles = [MountProfile(**profile) for profile in data.get("mounts", [])]
+        if data.get("storage") is not None:
+            metrics.storage = StorageReport.from_json(data["storage"])
+        metrics.throughput = dict(data.get("throughput", {}))
+        metrics.fs_ops = FsOpStats.from_json(data.get("fs_ops", []))
+        if data.get("loop_lag") is not None:
+            metrics.loop_lag = LoopLag(**data["loop_lag"])
+        return metrics
+
+
+# Like TestMetrics.span(), but doesn't record anything if metrics is None
+def span(metrics: Optional[TestMetrics], phase: Phase) -> _SpanContext:
+    return _SpanContext(metrics, phase)
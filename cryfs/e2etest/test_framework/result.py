@@ -1,7 +1,10 @@
 from enum import Enum
 import attr
-from typing import List
+import json
+from typing import Any, Dict, List
 from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.test_framework.metrics import Phase, TestMetrics
+from cryfs.e2etest.utils.instrumented_fs import FsOpStats
 
 
 class TestStatus(Enum):
@@ -21,6 +24,9 @@ class TestStatus(Enum):
 class TestResult(object):
     test_case_name: str
     log: Logger
+    metrics: TestMetrics = attr.Factory(TestMetrics)
+    # True if the test case didn't run because it already passed with the same inputs in an earlier run
+    cached: bool = False
 
     def status(self) -> TestStatus:
         if self.log.contains_entry_with_level(LogLevel.FATAL):
@@ -38,6 +44,20 @@ class TestResult(object):
         print(self.log.to_string())
         print()
 
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "name": self.test_case_name,
+            "status": self.status().to_string(),
+            "metrics": self.metrics.to_json(),
+            "log": self.log.to_json(),
+            "cached": self.cached,
+        }
+
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> 'TestResult':
+        return TestResult(test_case_name=data["name"], log=Logger.from_json(data["log"]), metrics=TestMetrics.from_json(data["metrics"]),
+                          cached=data.get("cached", False))
+
 
 class TestResults(object):
     def __init__(self, results: List[TestResult]) -> None:
@@ -52,14 +72,109 @@ class TestResults(object):
             return TestStatus.ERROR
         return TestStatus.SUCCESS
 
-    def print(self) -> None:
+    def print(self, num_slowest: int = 10) -> None:
         print("-------------------------")
         print("Summary")
         print("-------------------------")
         for result in self._results:
-            print("[%s] %s" % (result.status().to_string(), result.test_case_name))
+            print("[%s] %s%s" % (result.status().to_string(), result.test_case_name, " (cached)" if result.cached else ""))
+        num_cached = len([result for result in self._results if result.cached])
+        if num_cached > 0:
+            print("%d of %d test cases were skipped because they already passed with the same inputs" % (num_cached, len(self._results)))
         print()
+        self._print_phase_breakdown()
+        self._print_slowest(num_slowest)
+        self._print_daemon_usage(num_slowest)
+        self._print_loop_lag(num_slowest)
+        self._print_fs_ops()
         for fatalled in [r for r in self._results if r.status() == TestStatus.FATAL]:
             fatalled.print()
         for errored in [r for r in self._results if r.status() == TestStatus.ERROR]:
-            errored.print()
\ No newline at end of file
+            errored.print()
+
+    def _print_phase_breakdown(self) -> None:
+        print("-------------------------")
+        print("Time per phase (summed over all tests)")
+        print("-------------------------")
+        total = sum(result.metrics.duration for result in self._results)
+        for phase in Phase:
+            duration = sum(result.metrics.phase_duration(phase) for result in self._results)
+            percentage = 100 * duration / total if total > 0 else 0.0
+            print("%-15s %10.3fs %5.1f%%" % (phase.to_string(), duration, percentage))
+        print("%-15s %10.3fs" % ("total", total))
+        print()
+
+    def _print_slowest(self, num_slowest: int) -> None:
+        if num_slowest <= 0:
+            return
+        print("-------------------------")
+        print("Slowest tests")
+        print("-------------------------")
+        slowest = sorted(self._results, key=lambda result: result.metrics.duration, reverse=True)[:num_slowest]
+        for result in slowest:
+            phases = ", ".join("%s %.2fs" % (phase.to_string(), result.metrics.phase_duration(phase))
+                               for phase in Phase if result.metrics.phase_duration(phase) > 0)
+            print("%9.2fs %s (%s)" % (result.metrics.duration, result.test_case_name, phases))
+        print()
+
+    def _print_loop_lag(self, num_results: int) -> None:
+        measured = [(result, result.metrics.loop_lag) for result in self._results if result.metrics.loop_lag is not None]
+        if num_results <= 0 or len(measured) == 0:
+            return
+        print("-------------------------")
+        print("Highest event loop lag (blocking code stalls all running tests)")
+        print("-------------------------")
+        for result, lag in sorted(measured, key=lambda item: item[1].max_lag, reverse=True)[:num_results]:
+            print("%8.1f ms %s (stalled %.3fs in total)" % (lag.max_lag * 1000, result.test_case_name, lag.total_lag))
+        print()
+
+    def _print_fs_ops(self) -> None:
+        fs_ops = FsOpStats()
+        for result in self._results:
+            fs_ops.merge(result.metrics.fs_ops)
+        if fs_ops.num_ops() == 0:
+            return
+        print("-------------------------")
+        print("File system operation latencies (merged over all tests)")
+        print("-------------------------")
+        print(fs_ops.to_string())
+        print()
+
+    def _print_daemon_usage(self, num_results: int) -> None:
+        usages = [(result, result.metrics.daemon_usage()) for result in self._results]
+        measured = [(result, usage) for result, usage in usages if usage is not None]
+        if num_results <= 0 or len(measured) == 0:
+            return
+        print("-------------------------")
+        print("Highest CryFS daemon memory usage")
+        print("-------------------------")
+        for result, usage in sorted(measured, key=lambda item: item[1].peak_rss_bytes, reverse=True)[:num_results]:
+            print("%8.1f MB %s (CPU %.2fs, wrote %.1f MB)" % (
+                usage.peak_rss_bytes / 1024 / 1024, result.test_case_name, usage.cpu_time(), usage.write_bytes / 1024 / 1024))
+        print()
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "status": self.status().to_string(),
+            "results": [result.to_json() for result in self._results],
+        }
+
+    def results(self) -> List[TestResult]:
+        return self._results
+
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> 'TestResults':
+        return TestResults([TestResult.from_json(result) for result in data["results"]])
+
+    # Combines the reports of several shards (see --shard) into one
+    @staticmethod
+    def merge_json_reports(paths: List[str]) -> 'TestResults':
+        results: List[TestResult] = []
+        for path in paths:
+            with open(path, 'r') as file:
+                results += TestResults.from_json(json.load(file)).results()
+        return TestResults(results)
+
+    def export_json(self, path: str) -> None:
+        with open(path, 'w') as file:
+            json.dump(self.to_json(), file, indent=2)
@@ -0,0 +1,82 @@
+from typing import Dict, List, Optional
+import hashlib
+import json
+import os
+from cryfs.e2etest.test_framework.result import TestResult, TestStatus
+from cryfs.e2etest.test_framework.test_case import ITestCase
+from cryfs.e2etest.utils.executor import run_blocking
+from cryfs.e2etest.utils.manifest import file_sha256
+
+
+# Remembers which test cases passed with which inputs, so incremental runs can skip them.
+# A result is keyed by the CryFS version (or a hash of its executable), the hashes of the test case's input files and its name.
+class ResultCache(object):
+    def __init__(self, cache_dir: str, cryfs_key: str) -> None:
+        self._cache_dir = cache_dir
+        self._cryfs_key = cryfs_key
+        self._hashes_path = os.path.join(cache_dir, "file_hashes.json")
+        # File hashes by path, only recomputed if a file's size or mtime changed
+        self._file_hashes: Dict[str, Dict[str, object]] = {}
+        if os.path.exists(self._hashes_path):
+            try:
+                with open(self._hashes_path, 'r') as file:
+                    self._file_hashes = json.load(file)
+            except ValueError:
+                self._file_hashes = {}
+
+    async def _file_hash(self, path: str) -> str:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            # The test case will fail, so its result won't be cached anyway
+            return "missing"
+        cached = self._file_hashes.get(path)
+        if cached is not None and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return str(cached["sha256"])
+        sha256 = await run_blocking(file_sha256, path)
+        self._file_hashes[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+        return sha256
+
+    async def key(self, case: ITestCase) -> str:
+        inputs: List[str] = [await self._file_hash(path) for path in case.input_files()]
+        data = json.dumps({"cryfs": self._cryfs_key, "inputs": inputs, "test_case": case.name()}, sort_keys=True)
+        return hashlib.sha256(data.encode('UTF-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._cache_dir, key[:2], key + ".json")
+
+    # Returns the earlier result if the test case already passed with the same inputs
+    async def lookup(self, case: ITestCase) -> Optional[TestResult]:
+        path = self._path(await self.key(case))
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as file:
+                result = TestResult.from_json(json.load(file))
+        except (ValueError, KeyError):
+            return None
+        result.cached = True
+        return result
+
+    # Only successful results are stored, failed test cases always run again
+    async def store(self, case: ITestCase, result: TestResult) -> None:
+        if result.status() != TestStatus.SUCCESS or result.cached:
+            return
+        path = self._path(await self.key(case))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, 'w') as file:
+            json.dump(result.to_json(), file)
+        os.replace(tmp_path, path)
+
+    def save(self) -> None:
+        os.makedirs(self._cache_dir, exist_ok=True)
+        # Several worker processes (see --workers) can save at the same time
+        tmp_path = "%s.%d.tmp" % (self._hashes_path, os.getpid())
+        with open(tmp_path, 'w') as file:
+            json.dump(self._file_hashes, file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self._hashes_path)
+
+
+async def executable_key(cryfs_executable: str) -> str:
+    return "sha256:" + await run_blocking(file_sha256, cryfs_executable)
@@ -0,0 +1,112 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import json
+import os
+import time
+from cryfs.e2etest.test_framework.result import TestResult
+from cryfs.e2etest.test_framework.test_case import ITestCase
+
+
+# Remembers how long each test case took in earlier runs, so the scheduler can start long tests first.
+class DurationHistory(object):
+    def __init__(self, path: Optional[str] = None) -> None:
+        self._path = path
+        self._durations: Dict[str, float] = {}
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, 'r') as file:
+                    loaded = json.load(file)
+                self._durations = {str(name): float(duration) for name, duration in loaded.items()}
+            except (ValueError, AttributeError):
+                # Corrupt history file. Start over, it will be overwritten on save().
+                self._durations = {}
+
+    def expected_duration(self, test_case_name: str) -> Optional[float]:
+        return self._durations.get(test_case_name)
+
+    def record(self, test_case_name: str, duration: float) -> None:
+        self._durations[test_case_name] = duration
+
+    def save(self) -> None:
+        if self._path is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+        tmp_path = self._path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(self._durations, file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self._path)
+
+
+class TestScheduler(object):
+    def __init__(self, jobs: int, history: DurationHistory) -> None:
+        if jobs < 1:
+            raise ValueError("Number of jobs must be at least 1, got %d" % jobs)
+        self._jobs = jobs
+        self._history = history
+
+    # Longest expected duration first. Test cases we haven't seen before are started first,
+    # because we don't know how long they take and they might be the longest ones.
+    def order(self, cases: List[ITestCase]) -> List[ITestCase]:
+        def key(case: ITestCase) -> float:
+            duration = self._history.expected_duration(case.name())
+            if duration is None:
+                return float('-inf')
+            return -duration
+        return sorted(cases, key=key)
+
+    # Runs the test cases with at most `jobs` of them at the same time.
+    # Results are returned in the order of `cases`, independent of the order they were scheduled in.
+    async def run(self, cases: List[ITestCase], run_case: Callable[[ITestCase], Awaitable[TestResult]]) -> List[TestResult]:
+        semaphore = asyncio.Semaphore(self._jobs)
+        results: Dict[int, TestResult] = {}
+
+        async def run_one(index: int, case: ITestCase) -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                results[index] = await run_case(case)
+                # Cached results didn't run, their duration says nothing about how long the test case takes
+                if not results[index].cached:
+                    self._history.record(case.name(), time.perf_counter() - start)
+
+        indices = {id(case): index for index, case in enumerate(cases)}
+        await asyncio.gather(*[run_one(indices[id(case)], case) for case in self.order(cases)])
+        return [results[index] for index in range(len(cases))]
+
+
+# Splits the test cases into `num_shards` shards with roughly equal expected durations.
+# Test cases are assigned greedily, longest first, to the shard with the least expected duration so far. Test cases of the
+# same group (see ITestCase.group()) are assigned together. Test cases without a recorded duration count with the average
+# duration. The result only depends on the test case names and the history, so all shards must use the same durations
+# file to get disjoint shards that together cover all test cases.
+def partition(cases: List[ITestCase], num_shards: int, history: DurationHistory) -> List[List[ITestCase]]:
+    if num_shards < 1:
+        raise ValueError("Number of shards must be at least 1, got %d" % num_shards)
+    known = [duration for duration in (history.expected_duration(case.name()) for case in cases) if duration is not None]
+    default_duration = sum(known) / len(known) if len(known) > 0 else 1.0
+
+    def expected(case: ITestCase) -> float:
+        duration = history.expected_duration(case.name())
+        return duration if duration is not None else default_duration
+    units: Dict[str, List[ITestCase]] = {}
+    for case in cases:
+        group = case.group()
+        units.setdefault("group:" + group if group is not None else "case:" + case.name(), []).append(case)
+    shards: List[List[ITestCase]] = [[] for _ in range(num_shards)]
+    loads = [0.0] * num_shards
+    for key, unit in sorted(units.items(), key=lambda item: (-sum(expected(case) for case in item[1]), item[0])):
+        shard = min(range(num_shards), key=lambda index: (loads[index], index))
+        shards[shard] += unit
+        loads[shard] += sum(expected(case) for case in unit)
+    # Keep the original order within each shard
+    positions = {id(case): index for index, case in enumerate(cases)}
+    return [sorted(shard, key=lambda case: positions[id(case)]) for shard in shards]
+
+
+# Parses a shard specification like "2/5" (the second of five shards) into a zero-based index and the number of shards
+def parse_shard(shard: str) -> Tuple[int, int]:
+    index, sep, count = shard.partition('/')
+    if sep == '' or not index.strip().isdigit() or not count.strip().isdigit():
+        raise ValueError("Invalid shard '%s', expected e.g. '1/4'" % shard)
+    if not 1 <= int(index) <= int(count):
+        raise ValueError("Invalid shard '%s', shard number must be between 1 and %s" % (shard, count))
+    return int(index) - 1, int(count)
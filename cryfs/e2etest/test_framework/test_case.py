@@ -1,16 +1,38 @@
 from abc import ABCMeta, abstractmethod
-from typing import Iterable
+from typing import Iterable, List, Optional
+from cryfs.e2etest.test_framework.limits import DaemonLimits
 from cryfs.e2etest.test_framework.logger import Logger
+from cryfs.e2etest.test_framework.metrics import TestMetrics
 
 
 class ITestCase(object, metaclass=ABCMeta):
+    # Timings, daemon resource usage and other performance data of the run go into `metrics`
     @abstractmethod
-    async def run(self, logger: Logger) -> None: ...
+    async def run(self, logger: Logger, metrics: TestMetrics) -> None: ...
 
     @abstractmethod
     def name(self) -> str: ...
 
+    # Files the outcome of the test case depends on, besides the CryFS executable, e.g. fixture tar files.
+    # Incremental runs skip test cases that already passed with the same input files.
+    def input_files(self) -> List[str]:
+        return []
+
+    # Test cases with the same group share expensive work (e.g. writing a file system) and are always put into the same shard.
+    # None if the test case doesn't share anything.
+    def group(self) -> Optional[str]:
+        return None
+
+    # Resource limits for the CryFS daemon. Test cases with unusual workloads can override the defaults given on the command line.
+    def daemon_limits(self, defaults: DaemonLimits) -> DaemonLimits:
+        return defaults
+
 
 class ITestSuite(object, metaclass=ABCMeta):
     @abstractmethod
     def test_cases(self) -> Iterable[ITestCase]: ...
+
+    # Called after all test cases ran. Removes what the test cases shared, including what test cases that didn't run
+    # (e.g. skipped by --incremental) would have released.
+    async def cleanup(self) -> None:
+        pass
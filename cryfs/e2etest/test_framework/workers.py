@@ -0,0 +1,61 @@
+from typing import List
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.test_framework.result import TestResult, TestResults
+
+# Options of the parent process that must not be passed on to the workers. The workers get their own values for some of them.
+_OPTIONS_WITH_VALUE = {'--workers', '--shard', '--json-report', '--jobs', '--baseline-dir'}
+_FLAGS = {'--save-baseline', '--compare-baseline'}
+
+
+# Removes the given options (both "--option value" and "--option=value" forms) from a command line
+def strip_options(argv: List[str]) -> List[str]:
+    result = []
+    skip_next = False
+    for arg in argv:
+        if skip_next:
+            skip_next = False
+            continue
+        name = arg.split('=', 1)[0]
+        if name in _OPTIONS_WITH_VALUE:
+            skip_next = '=' not in arg
+            continue
+        if arg in _FLAGS:
+            continue
+        result.append(arg)
+    return result
+
+
+# Runs each shard of the test suite in a separate cryfs-e2etest process and collects their results.
+# `argv` are the command line arguments of the current process, they are passed on to the workers.
+async def run_workers(argv: List[str], num_workers: int, jobs_per_worker: int) -> List[TestResult]:
+    worker_args = strip_options(argv)
+    with tempfile.TemporaryDirectory() as tempdir:
+        async def run_worker(index: int) -> List[TestResult]:
+            report = os.path.join(tempdir, "shard%d.json" % index)
+            output = os.path.join(tempdir, "shard%d.out" % index)
+            with open(output, 'wb') as output_file:
+                process = await asyncio.create_subprocess_exec(
+                    sys.executable, "-m", "cryfs.e2etest", *worker_args,
+                    "--shard", "%d/%d" % (index + 1, num_workers), "--jobs", str(jobs_per_worker),
+                    "--json-report", report, "--no-save-durations",
+                    stdin=subprocess.DEVNULL, stdout=output_file, stderr=subprocess.STDOUT)
+                returncode = await process.wait()
+            try:
+                with open(report, 'r') as file:
+                    return TestResults.from_json(json.load(file)).results()
+            except (OSError, ValueError, KeyError):
+                # The worker crashed before writing its report. Report its output as a failed test.
+                logger = Logger()
+                with open(output, 'r', errors='replace') as file:
+                    logger.log_payload(LogLevel.FATAL, "Worker for shard %d/%d exited with code %d without writing a report. Output" % (
+                        index + 1, num_workers, returncode), file.read())
+                return [TestResult(test_case_name="Worker %d/%d" % (index + 1, num_workers), log=logger)]
+
+        shard_results = await asyncio.gather(*[run_worker(index) for index in range(num_workers)])
+    return [result for results in shard_results for result in results]
@@ -1,7 +1,10 @@
 from asyncio import subprocess, create_subprocess_exec
-from typing import Any, Optional
+from asyncio.subprocess import Process
+from typing import Any, List, Optional, Tuple
 from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+import asyncio
 import attr
+import time
 
 
 class SubprocessException(Exception):
@@ -18,10 +21,15 @@ class CallResult(object):
     stderr: bytes
 
 
-async def check_call_subprocess(*args: Any, input: Optional[bytes] = None, stdout: int = subprocess.PIPE, logger: Optional[Logger] = None, throw_on_error: bool = True, **kwargs: Any) -> CallResult:
+# If `output_chunks` is given, the stdout data is also appended to it as it arrives, together with the time (time.time()) it arrived
+async def check_call_subprocess(*args: Any, input: Optional[bytes] = None, stdout: int = subprocess.PIPE, logger: Optional[Logger] = None, throw_on_error: bool = True,
+                                output_chunks: Optional[List[Tuple[float, bytes]]] = None, **kwargs: Any) -> CallResult:
     process = await create_subprocess_exec(*args, stdin=subprocess.PIPE, stdout=stdout,
                                            stderr=subprocess.PIPE, **kwargs)
-    (stdout_data, stderr_data) = await process.communicate(input)
+    if output_chunks is None:
+        (stdout_data, stderr_data) = await process.communicate(input)
+    else:
+        (stdout_data, stderr_data) = await _communicate_timestamped(process, input, output_chunks)
     if process.returncode != 0:
         stderr = stderr_data.decode(encoding="UTF-8")
         if logger is not None:
@@ -29,3 +37,32 @@ async def check_call_subprocess(*args: Any, input: Optional[bytes] = None, stdou
         if throw_on_error:
             raise SubprocessException(stderr)
     return CallResult(stdout=stdout_data, stderr=stderr_data)
+
+
+async def _communicate_timestamped(process: Process, input: Optional[bytes], output_chunks: List[Tuple[float, bytes]]) -> Tuple[bytes, bytes]:
+    assert process.stdin is not None and process.stdout is not None and process.stderr is not None
+    stdout_stream = process.stdout
+
+    async def write_input() -> None:
+        assert process.stdin is not None
+        try:
+            if input is not None:
+                process.stdin.write(input)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # The process exited without reading all of its input, like in communicate()
+            pass
+        process.stdin.close()
+
+    async def read_stdout() -> bytes:
+        data = b''
+        while True:
+            chunk = await stdout_stream.read(4096)
+            if not chunk:
+                return data
+            output_chunks.append((time.time(), chunk))
+            data += chunk
+
+    _, stdout_data, stderr_data = await asyncio.gather(write_input(), read_stdout(), process.stderr.read())
+    await process.wait()
+    return stdout_data, stderr_data
@@ -0,0 +1,115 @@
+from typing import Dict, Iterator, List, Optional, Pattern, Tuple
+import attr
+import datetime
+import re
+
+
+# CryFS logs through spdlog, whose default pattern starts each line with a local timestamp, e.g.
+# "[2018-05-06 12:34:56.789] [cryfs] [info] Filesystem started."
+_TIMESTAMP_RE = re.compile(r'^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?:\.\d+)?)\]\s*(.*)$')
+
+# Milestones of a mount in the output of the cryfs process. The log file can't be used for these, because CryFS only
+# starts writing it right before mounting. Each phase ends with the first line matching its pattern and starts where
+# the previous phase that was found ended. Phases whose milestone wasn't printed (e.g. CryFS versions printing other
+# messages) are skipped and their time counts towards the next phase that is found.
+MOUNT_MILESTONES: List[Tuple[str, Pattern[str]]] = [
+    # Loading the config file of an existing file system, which is mostly deriving the key from the password with scrypt.
+    # "Loading config file (this can take some time)...done" (CryConfigLoader.cpp, 0.9.x),
+    # "Deriving encryption key (this can take some time)...done" (CryPasswordBasedKeyProvider.cpp, 0.10 and later).
+    ("config_load", re.compile(r'(Loading config file|Deriving encryption key) \(this can take some time\)\.\.\.\s*done')),
+    # Everything until CryFS mounts, e.g. checking the local state, upgrading the file system and the sanity check.
+    # "Mounting filesystem. To unmount, call:" (Cli.cpp, 0.9 and later)
+    ("filesystem_setup", re.compile(r'Mounting filesystem\. To unmount, call:')),
+]
+
+# The daemon logs this when it handled the FUSE init request of the kernel, i.e. the file system is usable
+# (Fuse::init() in fspp/fuse/Fuse.cpp, 0.9 and later)
+_FILESYSTEM_STARTED_RE = re.compile(r'\[info\] Filesystem started\.$')
+
+
+@attr.s(auto_attribs=True)
+class LogLine(object):
+    # Seconds since the epoch
+    timestamp: float
+    message: str
+
+
+def _parse_timestamp(timestamp: str) -> float:
+    format = "%Y-%m-%d %H:%M:%S.%f" if '.' in timestamp else "%Y-%m-%d %H:%M:%S"
+    # spdlog writes local time, and so does a naive datetime's timestamp() assume
+    return datetime.datetime.strptime(timestamp, format).timestamp()
+
+
+# Yields the timestamped lines of a CryFS log file. Lines without timestamp (e.g. continuation lines) are skipped.
+def parse_log_lines(path: str) -> Iterator[LogLine]:
+    with open(path, 'r', errors='replace') as file:
+        for line in file:
+            match = _TIMESTAMP_RE.match(line)
+            if match is not None:
+                yield LogLine(timestamp=_parse_timestamp(match.group(1)), message=match.group(2).rstrip())
+
+
+# Splits the output of the cryfs process, recorded as (arrival time, data) chunks, into lines. Each line gets the time its
+# end arrived, e.g. "Deriving encryption key (this can take some time)...done" the time the key derivation finished.
+def timestamped_output_lines(chunks: List[Tuple[float, bytes]]) -> List[LogLine]:
+    lines: List[LogLine] = []
+    current = b''
+    for timestamp, data in chunks:
+        *complete, current = (current + data).split(b'\n')
+        lines.extend(LogLine(timestamp=timestamp, message=line.decode('UTF-8', errors='replace').rstrip()) for line in complete)
+    if current != b'':
+        lines.append(LogLine(timestamp=chunks[-1][0], message=current.decode('UTF-8', errors='replace').rstrip()))
+    return lines
+
+
+# Time spent in each phase of a mount, in seconds, measured from `start` (the time the cryfs process was started)
+# until `end` (the time it daemonized), using the lines cryfs printed. Time after the last milestone counts as "other".
+def mount_phases(lines: List[LogLine], start: float, end: float) -> Dict[str, float]:
+    phases: Dict[str, float] = {}
+    phase_start = start
+    remaining_milestones = list(MOUNT_MILESTONES)
+    for line in lines:
+        if line.timestamp > end:
+            break
+        for index, (name, pattern) in enumerate(remaining_milestones):
+            if pattern.search(line.message) is not None:
+                # Guard against lines timestamped slightly before `start`
+                phases[name] = max(0.0, line.timestamp - phase_start)
+                phase_start = max(phase_start, line.timestamp)
+                del remaining_milestones[:index + 1]
+                break
+    phases["other"] = max(0.0, end - phase_start)
+    return phases
+
+
+# Timings of one mount/unmount cycle
+@attr.s(auto_attribs=True)
+class MountProfile(object):
+    # Runtime of the cryfs process until it daemonized
+    invocation: float = 0.0
+    # Whole mount, including the invocation and finding the daemon
+    mount: float = 0.0
+    # From calling fusermount until the daemon exited
+    unmount: float = 0.0
+    # Breakdown of the invocation, see mount_phases(), plus "fuse_init" if the daemon logged when the file system started
+    phases: Dict[str, float] = attr.Factory(dict)
+
+
+# Time from daemonizing until the daemon handled the FUSE init request, or None if the log doesn't say.
+# CryFS only sets up the log file when it mounts, so this is the only milestone in there.
+def fuse_init_time(log_lines: Iterator[LogLine], invocation_end: float) -> Optional[float]:
+    for line in log_lines:
+        if _FILESYSTEM_STARTED_RE.search(line.message) is not None:
+            # Log timestamps only have millisecond precision, so this can be slightly before `invocation_end`
+            return max(0.0, line.timestamp - invocation_end)
+    return None
+
+
+# Breaks the invocation of cryfs down into phases, using the time its output (`output_chunks`, see timestamped_output_lines())
+# arrived and the timestamps in its log file
+def profile_mount(log_file: str, output_chunks: List[Tuple[float, bytes]], invocation_start: float, invocation_end: float) -> Dict[str, float]:
+    phases = mount_phases(timestamped_output_lines(output_chunks), invocation_start, invocation_end)
+    fuse_init = fuse_init_time(parse_log_lines(log_file), invocation_end)
+    if fuse_init is not None:
+        phases["fuse_init"] = fuse_init
+    return phases
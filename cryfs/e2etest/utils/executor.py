@@ -0,0 +1,75 @@
+from typing import Any, Callable, Optional, TypeVar
+from types import TracebackType
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import functools
+import shutil
+import tempfile
+
+
+T = TypeVar('T')
+
+EXECUTOR_KINDS = ['thread', 'process']
+
+
+# Runs blocking file system work (copying, comparing, removing directories, ...) outside of the event loop,
+# so it doesn't stall the subprocess I/O and mount handling of the other test cases running at the same time.
+# With kind='process', run() uses a process pool, which avoids contention on the GIL. Functions run with run_in_thread()
+# always use threads, because they work on objects of this process (e.g. log to a Logger).
+class BlockingExecutor(object):
+    def __init__(self, kind: str = 'thread', max_workers: Optional[int] = None) -> None:
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError("Unknown executor kind %s. Supported: %s" % (kind, ", ".join(EXECUTOR_KINDS)))
+        self._threads = ThreadPoolExecutor(max_workers=max_workers)
+        self._processes: Optional[Executor] = ProcessPoolExecutor(max_workers=max_workers) if kind == 'process' else None
+
+    # With a process pool, the function and its arguments must be picklable, and changes the function makes to them aren't visible here
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        executor = self._processes if self._processes is not None else self._threads
+        return await asyncio.get_event_loop().run_in_executor(executor, functools.partial(func, *args))
+
+    async def run_in_thread(self, func: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_event_loop().run_in_executor(self._threads, functools.partial(func, *args))
+
+    def shutdown(self) -> None:
+        self._threads.shutdown()
+        if self._processes is not None:
+            self._processes.shutdown()
+
+
+_instance: Optional[BlockingExecutor] = None
+
+
+def get_blocking_executor() -> BlockingExecutor:
+    global _instance
+    if _instance is None:
+        _instance = BlockingExecutor()
+    return _instance
+
+
+def set_blocking_executor(executor: BlockingExecutor) -> None:
+    global _instance
+    _instance = executor
+
+
+async def run_blocking(func: Callable[..., T], *args: Any) -> T:
+    return await get_blocking_executor().run(func, *args)
+
+
+async def run_in_thread(func: Callable[..., T], *args: Any) -> T:
+    return await get_blocking_executor().run_in_thread(func, *args)
+
+
+# Like tempfile.TemporaryDirectory, but an async context manager that removes the directory on the blocking executor
+class AsyncTemporaryDirectory(object):
+    def __init__(self) -> None:
+        self.name = tempfile.mkdtemp()
+
+    async def __aenter__(self) -> str:
+        return self.name
+
+    async def __aexit__(self, exc_type: Optional[type], exc: Optional[BaseException], tb: Optional[TracebackType]) -> None:
+        await self.cleanup()
+
+    async def cleanup(self) -> None:
+        await run_blocking(shutil.rmtree, self.name, True)
@@ -0,0 +1,190 @@
+from typing import Dict, Optional, Tuple
+from types import TracebackType
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+from cryfs.e2etest.test_framework.metrics import Phase, TestMetrics, span
+from cryfs.e2etest.utils.executor import run_blocking, run_in_thread
+from cryfs.e2etest.utils.manifest import file_sha256
+from cryfs.e2etest.utils.tar import TarFile
+
+
+_WRITE_BITS = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+
+
+def _set_writable(root: str, writable: bool) -> None:
+    for dirpath, dirnames, filenames in os.walk(root):
+        for path in [dirpath] + [os.path.join(dirpath, name) for name in filenames]:
+            if os.path.islink(path):
+                continue
+            mode = os.stat(path).st_mode
+            new_mode = (mode | stat.S_IWUSR) if writable else (mode & ~_WRITE_BITS)
+            os.chmod(path, new_mode)
+
+
+def _remove(root: str) -> None:
+    if os.path.exists(root):
+        _set_writable(root, True)
+        shutil.rmtree(root)
+
+
+# Exclusive lock on a file, held across processes. The lock file itself is never removed.
+class _FileLock(object):
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._fd: Optional[int] = None
+
+    async def __aenter__(self) -> None:
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            await run_in_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    async def __aexit__(self, exc_type: Optional[type], exc: Optional[BaseException], tb: Optional[TracebackType]) -> None:
+        assert self._fd is not None
+        # Closing the file releases the lock
+        os.close(self._fd)
+        self._fd = None
+
+
+class _CacheEntry(object):
+    def __init__(self, path: str, persistent: bool) -> None:
+        self.path = path
+        self.persistent = persistent
+        self.refcount = 0
+        self.extraction: Optional['asyncio.Future[None]'] = None
+
+
+class CachedTarUnpacker(object):
+    def __init__(self, cache: 'FixtureCache', tar_file: TarFile, metrics: Optional[TestMetrics] = None) -> None:
+        self._cache = cache
+        self._tar_file = tar_file
+        self._metrics = metrics
+        self._key: Optional[Tuple[str, str]] = None
+
+    async def __aenter__(self) -> str:
+        # This includes the time waiting for another test case extracting the same tar file
+        with span(self._metrics, Phase.FIXTURE_UNPACK):
+            self._key, path = await self._cache._acquire(self._tar_file)
+        return path
+
+    async def __aexit__(self, exc_type: Optional[type], exc: Optional[BaseException], tb: Optional[TracebackType]) -> None:
+        assert self._key is not None
+        await self._cache._release(self._key)
+
+
+# Process-wide cache of extracted fixtures. Each tar file is extracted once into a read-only directory, and the directory
+# is shared between all test cases using it at the same time. It is removed when the last user releases it.
+# With a `persistent_dir`, extracted fixtures are kept there between runs, and are re-extracted when the tar file changed.
+# Several processes can share a `persistent_dir` (e.g. with --workers), they take turns checking and extracting a fixture.
+class FixtureCache(object):
+    def __init__(self, persistent_dir: Optional[str] = None) -> None:
+        self._persistent_dir = persistent_dir
+        self._entries: Dict[Tuple[str, str], _CacheEntry] = {}
+        # Remember tar file hashes, so each tar file is only hashed once as long as it doesn't change
+        self._hashes: Dict[Tuple[str, float, int], str] = {}
+
+    # Returns an async context manager extracting the tar file (or reusing an existing extraction) and returning its path.
+    # The directory must not be modified.
+    def unpack(self, tar_file: TarFile, metrics: Optional[TestMetrics] = None) -> CachedTarUnpacker:
+        return CachedTarUnpacker(self, tar_file, metrics)
+
+    async def _tar_hash(self, tar_path: str) -> str:
+        tar_stat = os.stat(tar_path)
+        key = (tar_path, tar_stat.st_mtime, tar_stat.st_size)
+        if key not in self._hashes:
+            self._hashes[key] = await run_blocking(file_sha256, tar_path)
+        return self._hashes[key]
+
+    async def _acquire(self, tar_file: TarFile) -> Tuple[Tuple[str, str], str]:
+        tar_path = os.path.abspath(tar_file.tar_path)
+        key = (tar_path, await self._tar_hash(tar_path))
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._create_entry(tar_file, key)
+        entry.refcount += 1
+        assert entry.extraction is not None
+        try:
+            await asyncio.shield(entry.extraction)
+        except BaseException:
+            await self._release(key)
+            raise
+        return key, entry.path
+
+    async def _release(self, key: Tuple[str, str]) -> None:
+        entry = self._entries[key]
+        entry.refcount -= 1
+        if entry.refcount == 0:
+            del self._entries[key]
+            if not entry.persistent:
+                await run_blocking(_remove, entry.path)
+
+    def _create_entry(self, tar_file: TarFile, key: Tuple[str, str]) -> _CacheEntry:
+        if self._persistent_dir is not None:
+            entry = _CacheEntry(os.path.join(self._persistent_root(key), "data"), persistent=True)
+        else:
+            entry = _CacheEntry(tempfile.mkdtemp(prefix="cryfs-e2etest-fixture-"), persistent=False)
+        entry.extraction = asyncio.ensure_future(self._extract(tar_file, key, entry))
+        self._entries[key] = entry
+        return entry
+
+    def _persistent_root(self, key: Tuple[str, str]) -> str:
+        assert self._persistent_dir is not None
+        return os.path.join(self._persistent_dir, hashlib.sha256(key[0].encode('UTF-8')).hexdigest()[:32])
+
+    async def _extract(self, tar_file: TarFile, key: Tuple[str, str], entry: _CacheEntry) -> None:
+        if entry.persistent:
+            await self._extract_persistent(tar_file, key, os.path.dirname(entry.path))
+        else:
+            await tar_file.unpack(entry.path)
+            await run_blocking(_set_writable, entry.path, False)
+
+    async def _extract_persistent(self, tar_file: TarFile, key: Tuple[str, str], root: str) -> None:
+        os.makedirs(os.path.dirname(root), exist_ok=True)
+        async with _FileLock(root + ".lock"):
+            await self._extract_persistent_locked(tar_file, key, root)
+
+    async def _extract_persistent_locked(self, tar_file: TarFile, key: Tuple[str, str], root: str) -> None:
+        stamp_path = os.path.join(root, "stamp.json")
+        data_path = os.path.join(root, "data")
+        stamp = {"tar_path": key[0], "tar_mtime": os.stat(key[0]).st_mtime, "tar_sha256": key[1]}
+        if os.path.exists(stamp_path) and os.path.isdir(data_path):
+            with open(stamp_path, 'r') as file:
+                try:
+                    if json.load(file) == stamp:
+                        return
+                except ValueError:
+                    pass
+        # Missing, outdated or incomplete. Extract again.
+        await run_blocking(_remove, root)
+        os.makedirs(root)
+        tmp_data_path = data_path + ".tmp"
+        os.mkdir(tmp_data_path)
+        await tar_file.unpack(tmp_data_path)
+        os.rename(tmp_data_path, data_path)
+        await run_blocking(_set_writable, data_path, False)
+        with open(stamp_path, 'w') as file:
+            json.dump(stamp, file)
+
+
+_instance: Optional[FixtureCache] = None
+
+
+def get_fixture_cache() -> FixtureCache:
+    global _instance
+    if _instance is None:
+        _instance = FixtureCache()
+    return _instance
+
+
+def set_fixture_cache(cache: FixtureCache) -> None:
+    global _instance
+    _instance = cache
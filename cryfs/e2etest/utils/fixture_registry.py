@@ -0,0 +1,100 @@
+from typing import Any, Dict, List, Optional
+import attr
+import json
+import os
+import pkg_resources
+
+
+class FixtureRegistryException(Exception):
+    def __init__(self, message: str) -> None:
+        self._message = message
+
+    def message(self) -> str:
+        return self._message
+
+
+# An encoded fixture, i.e. a CryFS base directory created by some CryFS version from a data tar file.
+# File names are relative to the directory containing the registry.
+@attr.s(auto_attribs=True)
+class RegistryEntry(object):
+    data: str
+    encoded: str
+    password: str
+    cryfs_version: Optional[str] = None
+    # Hashes of the inputs the encoded tar file was created from. Used to skip recreating it if they didn't change.
+    data_sha256: Optional[str] = None
+    cryfs_sha256: Optional[str] = None
+
+    # Whether this (existing) entry was created from the same inputs as `wanted`. Entries without an executable hash were
+    # added before hashes were recorded, the CryFS version has to do for them.
+    def is_up_to_date(self, wanted: 'RegistryEntry') -> bool:
+        if self.cryfs_sha256 is not None and self.cryfs_sha256 != wanted.cryfs_sha256:
+            return False
+        return attr.evolve(self, cryfs_sha256=None) == attr.evolve(wanted, cryfs_sha256=None)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {key: value for key, value in attr.asdict(self).items() if value is not None}
+
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> 'RegistryEntry':
+        return RegistryEntry(**data)
+
+
+# List of the encoded fixtures the compatibility tests run against. Written by cryfs-e2etest-create-encoded-tars.
+@attr.s(auto_attribs=True)
+class FixtureRegistry(object):
+    entries: List[RegistryEntry] = attr.Factory(list)
+
+    def find(self, encoded: str) -> Optional[RegistryEntry]:
+        for entry in self.entries:
+            if entry.encoded == encoded:
+                return entry
+        return None
+
+    # Adds the entry, or replaces the existing entry for the same encoded tar file
+    def upsert(self, entry: RegistryEntry) -> None:
+        for index, existing in enumerate(self.entries):
+            if existing.encoded == entry.encoded:
+                self.entries[index] = entry
+                return
+        self.entries.append(entry)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"fixtures": [entry.to_json() for entry in self.entries]}
+
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> 'FixtureRegistry':
+        return FixtureRegistry(entries=[RegistryEntry.from_json(entry) for entry in data["fixtures"]])
+
+    @staticmethod
+    def load(path: str) -> 'FixtureRegistry':
+        try:
+            with open(path, 'r') as file:
+                return FixtureRegistry.from_json(json.load(file))
+        except (ValueError, KeyError, TypeError) as e:
+            raise FixtureRegistryException("Invalid fixture registry %s: %s" % (path, str(e)))
+
+    def save(self, path: str) -> None:
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, 'w') as file:
+            json.dump(self.to_json(), file, indent=2)
+            file.write("\n")
+        os.replace(tmp_path, path)
+
+
+def default_registry_path() -> str:
+    return str(pkg_resources.resource_filename('cryfs.e2etest.fixtures', 'registry.json'))
+
+
+# File name of the encoded tar file created from `data_tar` by the given CryFS version,
+# e.g. "scrypt_cryfs0.9.9_encoded.tar" for "scrypt_data.tar".
+def encoded_tar_name(data_tar: str, cryfs_version: str, compression: Optional[str] = None) -> str:
+    name = os.path.basename(data_tar)
+    for suffix in [".tar.xz", ".tar.zst", ".tar"]:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    if name.endswith("_data"):
+        name = name[:-len("_data")]
+    extension = {None: ".tar", "xz": ".tar.xz", "zstd": ".tar.zst"}[compression]
+    return "%s_cryfs%s_encoded%s" % (name, cryfs_version.replace('/', '_'), extension)
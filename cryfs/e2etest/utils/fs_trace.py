@@ -0,0 +1,251 @@
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
+import attr
+import errno
+import json
+import os
+import re
+import threading
+import time
+from cryfs.e2etest.utils.instrumented_fs import Fs, FsOpStats, InstrumentedFs, copytree
+
+
+TRACE_FORMAT = "cryfs-e2etest-trace"
+TRACE_VERSION = 1
+TRACE_SUFFIX = ".trace.jsonl"
+
+
+class TraceException(Exception):
+    def __init__(self, message: str) -> None:
+        self._message = message
+
+    def message(self) -> str:
+        return self._message
+
+
+# One file system operation of a trace. Only the arguments are stored, not the data, so replaying a write
+# writes the same number of bytes, but not the same bytes.
+@attr.s(auto_attribs=True)
+class TraceEvent(object):
+    # Name of the Fs method, e.g. "open" or "pwrite"
+    op: str
+    # Seconds since the recording started
+    time: float = 0.0
+    # How long the operation took when it was recorded
+    duration: float = 0.0
+    # Operations of the same lane (the thread that did them) depend on each other and are replayed in order
+    lane: int = 0
+    # Relative to the root directory of the recording
+    path: str = ''
+    # Destination of rename and link (relative), or target of a symlink (as given)
+    target: str = ''
+    # File handle in the trace. Not the file descriptor number, those are reused.
+    handle: int = -1
+    # os.open() flags and mode bits (Linux values)
+    flags: int = 0
+    mode: int = 0
+    size: int = 0
+    offset: int = -1
+    atime_ns: int = 0
+    mtime_ns: int = 0
+    uid: int = 0
+    gid: int = 0
+    follow_symlinks: bool = True
+    # errno name if the operation failed, e.g. "ENOENT"
+    error: str = ''
+
+    # Only fields that differ from the default, which keeps traces compact
+    def to_json(self) -> Dict[str, Any]:
+        data = attr.asdict(self)
+        return {field.name: data[field.name] for field in attr.fields(TraceEvent)
+                if field.name == 'op' or data[field.name] != field.default}
+
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> 'TraceEvent':
+        return TraceEvent(**data)
+
+
+# Writes the operations done through it to a trace file in JSON lines format: a header line, then one line per operation.
+# Operations on paths outside of `root` are done, but not recorded.
+class TracingFs(Fs):
+    def __init__(self, root: str, file: IO[str], inner: Optional[Fs] = None) -> None:
+        self._root = os.path.abspath(root)
+        self._file = file
+        self._inner = inner if inner is not None else Fs()
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._lanes: Dict[int, int] = {}
+        self._handles: Dict[int, int] = {}
+        self._next_handle = 0
+        json.dump({"format": TRACE_FORMAT, "version": TRACE_VERSION, "root": self._root}, self._file)
+        self._file.write("\n")
+
+    def _relative(self, path: str) -> Optional[str]:
+        relative = os.path.relpath(os.path.abspath(path), self._root)
+        if relative == '..' or relative.startswith('..' + os.sep):
+            return None
+        return relative
+
+    def _traced(self, event: TraceEvent, operation: Callable[[], Any], record: bool = True) -> Any:
+        start = time.perf_counter()
+        try:
+            result = operation()
+        except OSError as e:
+            event.error = errno.errorcode.get(e.errno or 0, str(e.errno))
+            raise
+        finally:
+            event.time = start - self._start
+            event.duration = time.perf_counter() - start
+            if record:
+                self._write(event)
+        return result
+
+    def _write(self, event: TraceEvent) -> None:
+        with self._lock:
+            event.lane = self._lanes.setdefault(threading.get_ident(), len(self._lanes))
+            json.dump(event.to_json(), self._file)
+            self._file.write("\n")
+
+    def _traced_path(self, event: TraceEvent, path: str, operation: Callable[[], Any]) -> Any:
+        relative = self._relative(path)
+        event.path = relative if relative is not None else ''
+        return self._traced(event, operation, record=relative is not None)
+
+    def _handle(self, fd: int) -> int:
+        with self._lock:
+            return self._handles.get(fd, -1)
+
+    def open(self, path: str, flags: int, mode: int = 0o777) -> int:
+        event = TraceEvent(op="open", flags=flags, mode=mode)
+        traced = self._relative(path) is not None
+
+        def do_open() -> int:
+            fd = self._inner.open(path, flags, mode)
+            if traced:
+                # Operations on files opened outside of the root aren't recorded either
+                with self._lock:
+                    event.handle = self._next_handle
+                    self._handles[fd] = self._next_handle
+                    self._next_handle += 1
+            return fd
+        return int(self._traced_path(event, path, do_open))
+
+    def close(self, fd: int) -> None:
+        event = TraceEvent(op="close", handle=self._handle(fd))
+        self._traced(event, lambda: self._inner.close(fd), record=event.handle != -1)
+        with self._lock:
+            self._handles.pop(fd, None)
+
+    def _traced_fd(self, event: TraceEvent, fd: int, operation: Callable[[], Any]) -> Any:
+        event.handle = self._handle(fd)
+        return self._traced(event, operation, record=event.handle != -1)
+
+    def read(self, fd: int, size: int) -> bytes:
+        return bytes(self._traced_fd(TraceEvent(op="read", size=size), fd, lambda: self._inner.read(fd, size)))
+
+    def pread(self, fd: int, size: int, offset: int) -> bytes:
+        return bytes(self._traced_fd(TraceEvent(op="pread", size=size, offset=offset), fd, lambda: self._inner.pread(fd, size, offset)))
+
+    def write(self, fd: int, data: Any) -> int:
+        return int(self._traced_fd(TraceEvent(op="write", size=len(data)), fd, lambda: self._inner.write(fd, data)))
+
+    def pwrite(self, fd: int, data: Any, offset: int) -> int:
+        return int(self._traced_fd(TraceEvent(op="pwrite", size=len(data), offset=offset), fd, lambda: self._inner.pwrite(fd, data, offset)))
+
+    def fsync(self, fd: int) -> None:
+        self._traced_fd(TraceEvent(op="fsync"), fd, lambda: self._inner.fsync(fd))
+
+    def stat(self, path: str, follow_symlinks: bool = True) -> os.stat_result:
+        event = TraceEvent(op="stat", follow_symlinks=follow_symlinks)
+        result: os.stat_result = self._traced_path(event, path, lambda: self._inner.stat(path, follow_symlinks))
+        return result
+
+    def listdir(self, path: str) -> List[str]:
+        return list(self._traced_path(TraceEvent(op="listdir"), path, lambda: self._inner.listdir(path)))
+
+    def _traced_two_paths(self, event: TraceEvent, src: str, dst: str, operation: Callable[[], Any]) -> None:
+        relative = self._relative(dst)
+        if relative is None:
+            operation()
+        else:
+            event.target = relative
+            self._traced_path(event, src, operation)
+
+    def rename(self, src: str, dst: str) -> None:
+        self._traced_two_paths(TraceEvent(op="rename"), src, dst, lambda: self._inner.rename(src, dst))
+
+    def link(self, src: str, dst: str) -> None:
+        self._traced_two_paths(TraceEvent(op="link"), src, dst, lambda: self._inner.link(src, dst))
+
+    def unlink(self, path: str) -> None:
+        self._traced_path(TraceEvent(op="unlink"), path, lambda: self._inner.unlink(path))
+
+    def mkdir(self, path: str, mode: int = 0o777) -> None:
+        self._traced_path(TraceEvent(op="mkdir", mode=mode), path, lambda: self._inner.mkdir(path, mode))
+
+    def symlink(self, target: str, path: str) -> None:
+        self._traced_path(TraceEvent(op="symlink", target=target), path, lambda: self._inner.symlink(target, path))
+
+    def chmod(self, path: str, mode: int) -> None:
+        self._traced_path(TraceEvent(op="chmod", mode=mode), path, lambda: self._inner.chmod(path, mode))
+
+    def utime(self, path: str, ns: Tuple[int, int], follow_symlinks: bool = True) -> None:
+        event = TraceEvent(op="utime", atime_ns=ns[0], mtime_ns=ns[1], follow_symlinks=follow_symlinks)
+        self._traced_path(event, path, lambda: self._inner.utime(path, ns, follow_symlinks))
+
+    def lchown(self, path: str, uid: int, gid: int) -> None:
+        self._traced_path(TraceEvent(op="lchown", uid=uid, gid=gid), path, lambda: self._inner.lchown(path, uid, gid))
+
+
+def load_trace(path: str) -> List[TraceEvent]:
+    with open(path, 'r') as file:
+        header = json.loads(file.readline() or 'null')
+        if not isinstance(header, dict) or header.get("format") != TRACE_FORMAT:
+            raise TraceException("%s isn't a trace file" % path)
+        if header.get("version") != TRACE_VERSION:
+            raise TraceException("%s has trace format version %s, but only version %d is supported" % (path, header.get("version"), TRACE_VERSION))
+        try:
+            return [TraceEvent.from_json(json.loads(line)) for line in file if line.strip() != '']
+        except (ValueError, TypeError) as e:
+            raise TraceException("%s is corrupted: %s" % (path, str(e)))
+
+
+_trace_dir: Optional[str] = None
+
+
+# If set, workloads record traces of their file system operations into this directory
+def get_trace_dir() -> Optional[str]:
+    return _trace_dir
+
+
+def set_trace_dir(trace_dir: Optional[str]) -> None:
+    global _trace_dir
+    _trace_dir = trace_dir
+
+
+# Where the trace of a workload is recorded, or None if traces aren't recorded
+def trace_path_for(name: str) -> Optional[str]:
+    if _trace_dir is None:
+        return None
+    return os.path.join(_trace_dir, re.sub(r'[^A-Za-z0-9._+-]+', '_', name).strip('_') + TRACE_SUFFIX)
+
+
+# The Fs a workload on `root` should use: an InstrumentedFs recording into `stats`,
+# and if `trace_path` is given, traced into that file
+@contextmanager
+def workload_fs(stats: FsOpStats, root: str, trace_path: Optional[str]) -> Iterator[Fs]:
+    fs = InstrumentedFs(stats)
+    if trace_path is None:
+        yield fs
+        return
+    os.makedirs(os.path.dirname(trace_path), exist_ok=True)
+    with open(trace_path, 'w') as file:
+        yield TracingFs(root, file, fs)
+
+
+# copytree() with an InstrumentedFs and optionally traced. Returns the measurements, so this also works on a process pool (see executor.py).
+def instrumented_copytree(src: str, dst: str, trace_path: Optional[str] = None, modes: Optional[Dict[str, int]] = None) -> FsOpStats:
+    stats = FsOpStats()
+    with workload_fs(stats, os.path.dirname(os.path.abspath(dst)), trace_path) as fs:
+        copytree(src, dst, fs, modes)
+    return stats
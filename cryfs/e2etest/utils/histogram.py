@@ -0,0 +1,115 @@
+from typing import Any, Dict, Optional, Tuple
+import math
+
+
+# Number of sub-buckets per power of two is 2**_SUB_BUCKET_BITS. With 7 bits, values are stored with a relative error below 1%.
+_SUB_BUCKET_BITS = 7
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+# Percentiles shown in reports and exported to JSON
+PERCENTILES = [("p50", 50.0), ("p90", 90.0), ("p99", 99.0), ("p999", 99.9)]
+
+
+def _bucket_index(value: int) -> int:
+    if value < _SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - _SUB_BUCKET_BITS - 1
+    return _SUB_BUCKETS * (shift + 1) + (value >> shift) - _SUB_BUCKETS
+
+
+# Lowest and highest value stored in a bucket
+def _bucket_range(index: int) -> Tuple[int, int]:
+    if index < _SUB_BUCKETS:
+        return index, index
+    shift = index // _SUB_BUCKETS - 1
+    mantissa = _SUB_BUCKETS + index % _SUB_BUCKETS
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+
+# Latency histogram with log-linear buckets, like HdrHistogram: each power of two of nanoseconds is split into
+# the same number of linear sub-buckets. Memory only depends on the range of the values, not on how many were recorded,
+# and histograms can be merged without losing precision, e.g. over several test cases or processes.
+class LatencyHistogram(object):
+    def __init__(self) -> None:
+        # Number of values per bucket index, only non-empty buckets are stored
+        self._buckets: Dict[int, int] = {}
+        self.count = 0
+        # In nanoseconds
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    # `latency` in seconds
+    def record(self, latency: float) -> None:
+        self.record_ns(max(0, int(latency * 1e9)))
+
+    def record_ns(self, value: int, count: int = 1) -> None:
+        index = _bucket_index(value)
+        self._buckets[index] = self._buckets.get(index, 0) + count
+        self.min = value if self.count == 0 else min(self.min, value)
+        self.max = max(self.max, value)
+        self.count += count
+        self.total += value * count
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        if other.count == 0:
+            return
+        for index, count in other._buckets.items():
+            self._buckets[index] = self._buckets.get(index, 0) + count
+        self.min = other.min if self.count == 0 else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+
+    # Latency in seconds below which `percentile` percent of the values are. `percentile` is in [0, 100].
+    # Like HdrHistogram, this is the highest value of the bucket the percentile falls into, so it never understates the tail.
+    def percentile(self, percentile: float) -> float:
+        if self.count == 0:
+            return float('nan')
+        rank = max(1, int(math.ceil(self.count * percentile / 100)))
+        seen = 0
+        for index in sorted(self._buckets.keys()):
+            seen += self._buckets[index]
+            if seen >= rank:
+                return min(_bucket_range(index)[1], self.max) / 1e9
+        return self.max / 1e9
+
+    def mean(self) -> float:
+        return self.total / self.count / 1e9 if self.count > 0 else float('nan')
+
+    # Summary in seconds, as reported in the JSON output of the benchmarks
+    def summary(self) -> Dict[str, float]:
+        if self.count == 0:
+            return {}
+        result = {"count": float(self.count), "mean": self.mean(), "min": self.min / 1e9, "max": self.max / 1e9}
+        for name, percentile in PERCENTILES:
+            result[name] = self.percentile(percentile)
+        return result
+
+    def to_string(self) -> str:
+        return "%d ops, p50 %s, p99 %s, p999 %s, max %s" % (
+            self.count, format_latency(self.percentile(50)), format_latency(self.percentile(99)),
+            format_latency(self.percentile(99.9)), format_latency(self.max / 1e9))
+
+    def to_json(self) -> Dict[str, Any]:
+        return dict(self.summary(), count=self.count, total_ns=self.total, min_ns=self.min, max_ns=self.max,
+                    buckets={str(index): count for index, count in sorted(self._buckets.items())})
+
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> 'LatencyHistogram':
+        histogram = LatencyHistogram()
+        histogram._buckets = {int(index): count for index, count in data["buckets"].items()}
+        histogram.count = data["count"]
+        histogram.total = data["total_ns"]
+        histogram.min = data["min_ns"]
+        histogram.max = data["max_ns"]
+        return histogram
+
+
+def format_latency(latency: Optional[float]) -> str:
+    if latency is None or math.isnan(latency):
+        return "-"
+    if latency < 1e-3:
+        return "%.0fus" % (latency * 1e6)
+    if latency < 1:
+        return "%.2fms" % (latency * 1e3)
+    return "%.2fs" % latency
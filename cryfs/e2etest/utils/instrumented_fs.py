@@ -0,0 +1,322 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import attr
+import os
+import stat
+import threading
+import time
+from cryfs.e2etest.utils.histogram import LatencyHistogram, format_latency
+from cryfs.e2etest.utils.sizes import format_size
+
+
+# Operations recorded by InstrumentedFs. "setattr" covers chmod, utime and chown.
+FS_OPERATIONS = ["open", "stat", "readdir", "read", "write", "fsync", "close", "rename", "unlink", "mkdir", "symlink", "link", "setattr"]
+# Upper bounds of the file size buckets. Larger files go into a last bucket.
+_SIZE_BUCKETS = [4 * 1024, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024]
+# Bucket of operations that aren't about a single file, e.g. readdir
+NO_SIZE = "-"
+# Size of the read() and write() calls of copytree()
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+def size_bucket(size: int) -> str:
+    lower = 0
+    for upper in _SIZE_BUCKETS:
+        if size <= upper:
+            return "%s-%s" % (format_size(lower), format_size(upper))
+        lower = upper
+    return ">%s" % format_size(lower)
+
+
+def _size_bucket_order(bucket: str) -> int:
+    if bucket == NO_SIZE:
+        return -1
+    return [size_bucket(upper) for upper in _SIZE_BUCKETS + [_SIZE_BUCKETS[-1] + 1]].index(bucket)
+
+
+# Latency histograms of file system operations, by operation and file size bucket
+class FsOpStats(object):
+    def __init__(self) -> None:
+        self.histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+
+    def record(self, op: str, bucket: str, latency: float) -> None:
+        self.histograms.setdefault((op, bucket), LatencyHistogram()).record(latency)
+
+    def merge(self, other: 'FsOpStats') -> None:
+        for key, histogram in other.histograms.items():
+            self.histograms.setdefault(key, LatencyHistogram()).merge(histogram)
+
+    def num_ops(self) -> int:
+        return sum(histogram.count for histogram in self.histograms.values())
+
+    # Keys ordered like FS_OPERATIONS, then by size
+    def sorted_keys(self) -> List[Tuple[str, str]]:
+        def order(key: Tuple[str, str]) -> Tuple[int, int]:
+            op, bucket = key
+            return (FS_OPERATIONS.index(op) if op in FS_OPERATIONS else len(FS_OPERATIONS), _size_bucket_order(bucket))
+        return sorted(self.histograms.keys(), key=order)
+
+    def to_string(self) -> str:
+        lines = ["%-8s %-10s %8s %10s %10s %10s %10s" % ("op", "file size", "count", "p50", "p99", "p999", "max")]
+        for op, bucket in self.sorted_keys():
+            histogram = self.histograms[(op, bucket)]
+            lines.append("%-8s %-10s %8d %10s %10s %10s %10s" % (
+                op, bucket, histogram.count, format_latency(histogram.percentile(50)), format_latency(histogram.percentile(99)),
+                format_latency(histogram.percentile(99.9)), format_latency(histogram.max / 1e9)))
+        return "\n".join(lines)
+
+    def to_json(self) -> List[Dict[str, Any]]:
+        return [{"op": op, "size": bucket, "latency": self.histograms[(op, bucket)].to_json()} for op, bucket in self.sorted_keys()]
+
+    @staticmethod
+    def from_json(data: List[Dict[str, Any]]) -> 'FsOpStats':
+        stats = FsOpStats()
+        for entry in data:
+            stats.histograms[(entry["op"], entry["size"])] = LatencyHistogram.from_json(entry["latency"])
+        return stats
+
+
+# The file system operations workloads do on a mount directory. This one just calls the os module,
+# InstrumentedFs measures each call. Workloads taking an Fs can run with or without measurements.
+class Fs(object):
+    def open(self, path: str, flags: int, mode: int = 0o777) -> int:
+        return os.open(path, flags, mode)
+
+    def close(self, fd: int) -> None:
+        os.close(fd)
+
+    def read(self, fd: int, size: int) -> bytes:
+        return os.read(fd, size)
+
+    def pread(self, fd: int, size: int, offset: int) -> bytes:
+        return os.pread(fd, size, offset)
+
+    def write(self, fd: int, data: Any) -> int:
+        return os.write(fd, data)
+
+    def pwrite(self, fd: int, data: Any, offset: int) -> int:
+        return os.pwrite(fd, data, offset)
+
+    def fsync(self, fd: int) -> None:
+        os.fsync(fd)
+
+    def stat(self, path: str, follow_symlinks: bool = True) -> os.stat_result:
+        return os.stat(path, follow_symlinks=follow_symlinks)
+
+    def listdir(self, path: str) -> List[str]:
+        return os.listdir(path)
+
+    def rename(self, src: str, dst: str) -> None:
+        os.rename(src, dst)
+
+    def unlink(self, path: str) -> None:
+        os.unlink(path)
+
+    def mkdir(self, path: str, mode: int = 0o777) -> None:
+        os.mkdir(path, mode)
+
+    def symlink(self, target: str, path: str) -> None:
+        os.symlink(target, path)
+
+    def link(self, src: str, dst: str) -> None:
+        os.link(src, dst)
+
+    def chmod(self, path: str, mode: int) -> None:
+        os.chmod(path, mode)
+
+    def utime(self, path: str, ns: Tuple[int, int], follow_symlinks: bool = True) -> None:
+        os.utime(path, ns=ns, follow_symlinks=follow_symlinks)
+
+    def lchown(self, path: str, uid: int, gid: int) -> None:
+        os.lchown(path, uid, gid)
+
+    def lexists(self, path: str) -> bool:
+        try:
+            self.stat(path, follow_symlinks=False)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def makedirs(self, path: str) -> None:
+        try:
+            if stat.S_ISDIR(self.stat(path).st_mode):
+                return
+        except FileNotFoundError:
+            pass
+        parent = os.path.dirname(path)
+        if parent != path:
+            self.makedirs(parent)
+        try:
+            self.mkdir(path)
+        except FileExistsError:
+            pass
+
+
+@attr.s(auto_attribs=True)
+class _OpenFile(object):
+    # Bytes read or written through the file descriptor so far
+    num_bytes: int = 0
+    # Operations waiting for close() to know the size bucket they belong to
+    pending: List[Tuple[str, float]] = attr.Factory(list)
+
+
+# Records the latency of each operation into FsOpStats. Operations on a file descriptor (open, read, write, fsync, close)
+# are bucketed by the number of bytes read or written through it until it is closed, stat by the size of the file,
+# and all other operations go into the NO_SIZE bucket. Can be used from several threads at the same time.
+class InstrumentedFs(Fs):
+    def __init__(self, stats: Optional[FsOpStats] = None) -> None:
+        self.stats = stats if stats is not None else FsOpStats()
+        self._lock = threading.Lock()
+        self._open_files: Dict[int, _OpenFile] = {}
+
+    def _timed(self, operation: Callable[[], Any]) -> Tuple[Any, float]:
+        start = time.perf_counter()
+        result = operation()
+        return result, time.perf_counter() - start
+
+    def _record(self, op: str, bucket: str, latency: float) -> None:
+        with self._lock:
+            self.stats.record(op, bucket, latency)
+
+    def _record_fd(self, fd: int, op: str, latency: float, num_bytes: int = 0) -> None:
+        with self._lock:
+            open_file = self._open_files.get(fd)
+            if open_file is None:
+                # Opened without this Fs, its size isn't known
+                self.stats.record(op, NO_SIZE, latency)
+            else:
+                open_file.num_bytes += num_bytes
+                open_file.pending.append((op, latency))
+
+    def open(self, path: str, flags: int, mode: int = 0o777) -> int:
+        fd, latency = self._timed(lambda: os.open(path, flags, mode))
+        with self._lock:
+            self._open_files[fd] = _OpenFile(pending=[("open", latency)])
+        return int(fd)
+
+    def close(self, fd: int) -> None:
+        _, latency = self._timed(lambda: os.close(fd))
+        with self._lock:
+            open_file = self._open_files.pop(fd, None)
+            if open_file is None:
+                self.stats.record("close", NO_SIZE, latency)
+                return
+            bucket = size_bucket(open_file.num_bytes)
+            for op, pending_latency in open_file.pending + [("close", latency)]:
+                self.stats.record(op, bucket, pending_latency)
+
+    def read(self, fd: int, size: int) -> bytes:
+        data, latency = self._timed(lambda: os.read(fd, size))
+        self._record_fd(fd, "read", latency, len(data))
+        return bytes(data)
+
+    def pread(self, fd: int, size: int, offset: int) -> bytes:
+        data, latency = self._timed(lambda: os.pread(fd, size, offset))
+        self._record_fd(fd, "read", latency, len(data))
+        return bytes(data)
+
+    def write(self, fd: int, data: Any) -> int:
+        written, latency = self._timed(lambda: os.write(fd, data))
+        self._record_fd(fd, "write", latency, written)
+        return int(written)
+
+    def pwrite(self, fd: int, data: Any, offset: int) -> int:
+        written, latency = self._timed(lambda: os.pwrite(fd, data, offset))
+        self._record_fd(fd, "write", latency, written)
+        return int(written)
+
+    def fsync(self, fd: int) -> None:
+        _, latency = self._timed(lambda: os.fsync(fd))
+        self._record_fd(fd, "fsync", latency)
+
+    def stat(self, path: str, follow_symlinks: bool = True) -> os.stat_result:
+        start = time.perf_counter()
+        try:
+            result = os.stat(path, follow_symlinks=follow_symlinks)
+        except OSError:
+            self._record("stat", NO_SIZE, time.perf_counter() - start)
+            raise
+        self._record("stat", size_bucket(result.st_size) if stat.S_ISREG(result.st_mode) else NO_SIZE, time.perf_counter() - start)
+        return result
+
+    def listdir(self, path: str) -> List[str]:
+        result, latency = self._timed(lambda: os.listdir(path))
+        self._record("readdir", NO_SIZE, latency)
+        return list(result)
+
+    def _timed_op(self, op: str, operation: Callable[[], Any]) -> None:
+        _, latency = self._timed(operation)
+        self._record(op, NO_SIZE, latency)
+
+    def rename(self, src: str, dst: str) -> None:
+        self._timed_op("rename", lambda: os.rename(src, dst))
+
+    def unlink(self, path: str) -> None:
+        self._timed_op("unlink", lambda: os.unlink(path))
+
+    def mkdir(self, path: str, mode: int = 0o777) -> None:
+        self._timed_op("mkdir", lambda: os.mkdir(path, mode))
+
+    def symlink(self, target: str, path: str) -> None:
+        self._timed_op("symlink", lambda: os.symlink(target, path))
+
+    def link(self, src: str, dst: str) -> None:
+        self._timed_op("link", lambda: os.link(src, dst))
+
+    def chmod(self, path: str, mode: int) -> None:
+        self._timed_op("setattr", lambda: os.chmod(path, mode))
+
+    def utime(self, path: str, ns: Tuple[int, int], follow_symlinks: bool = True) -> None:
+        self._timed_op("setattr", lambda: os.utime(path, ns=ns, follow_symlinks=follow_symlinks))
+
+    def lchown(self, path: str, uid: int, gid: int) -> None:
+        self._timed_op("setattr", lambda: os.lchown(path, uid, gid))
+
+
+def _copy_file(src: str, dst: str, fs: Fs) -> None:
+    with open(src, 'rb', buffering=0) as source:
+        fd = fs.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            while True:
+                block = source.read(COPY_BLOCK_SIZE)
+                if not block:
+                    break
+                view = memoryview(block)
+                while len(view) > 0:
+                    view = view[fs.write(fd, view):]
+        finally:
+            fs.close(fd)
+
+
+def _copy_stat(src_stat: os.stat_result, dst: str, mode: Optional[int], fs: Fs) -> None:
+    if stat.S_ISLNK(src_stat.st_mode):
+        # Like shutil.copystat(follow_symlinks=False), Linux can't change the mode of symlinks
+        fs.utime(dst, (src_stat.st_atime_ns, src_stat.st_mtime_ns), follow_symlinks=False)
+    else:
+        fs.chmod(dst, mode if mode is not None else stat.S_IMODE(src_stat.st_mode))
+        fs.utime(dst, (src_stat.st_atime_ns, src_stat.st_mtime_ns))
+
+
+# Like shutil.copytree(src, dst, symlinks=True), but all operations on `dst` go through `fs`.
+# `src` is read with the os module, because only the destination is the file system under test.
+# `modes` overrides the modes of the source, by path relative to `src` like in a Manifest ('' is `src` itself).
+# This is needed to copy from the fixture cache, which removes the write permissions of its directories.
+def copytree(src: str, dst: str, fs: Fs, modes: Optional[Dict[str, int]] = None) -> None:
+    _copytree(src, dst, '', fs, modes or {})
+
+
+def _copytree(src: str, dst: str, relative: str, fs: Fs, modes: Dict[str, int]) -> None:
+    fs.mkdir(dst)
+    with os.scandir(src) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    for entry in entries:
+        target = os.path.join(dst, entry.name)
+        entry_relative = relative + '/' + entry.name if relative != '' else entry.name
+        if entry.is_symlink():
+            fs.symlink(os.readlink(entry.path), target)
+        elif entry.is_dir():
+            _copytree(entry.path, target, entry_relative, fs, modes)
+            continue
+        else:
+            _copy_file(entry.path, target, fs)
+        _copy_stat(entry.stat(follow_symlinks=False), target, modes.get(entry_relative), fs)
+    _copy_stat(os.stat(src), dst, modes.get(relative), fs)
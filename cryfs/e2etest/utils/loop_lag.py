@@ -0,0 +1,59 @@
+from typing import List, Optional
+import asyncio
+import attr
+import bisect
+import time
+
+
+# Interval in seconds at which the event loop lag is measured
+DEFAULT_LAG_INTERVAL = 0.01
+# Delays below this are timer noise and don't count as stalls
+_NOISE = 0.001
+
+
+@attr.s(auto_attribs=True)
+class LoopLag(object):
+    # Longest delay of a wakeup, in seconds. This is roughly the longest time the event loop was blocked.
+    max_lag: float = 0.0
+    # Sum of all delays above timer noise, i.e. roughly how long the event loop was blocked in total
+    total_lag: float = 0.0
+    num_samples: int = 0
+
+    def to_string(self) -> str:
+        return "max %.1fms, stalled %.3fs in total" % (self.max_lag * 1000, self.total_lag)
+
+
+# Measures how late the event loop wakes up from short sleeps. A late wakeup means some code blocked the event loop,
+# and with it all test cases running at the same time.
+class LoopLagMonitor(object):
+    def __init__(self, interval: float = DEFAULT_LAG_INTERVAL) -> None:
+        self._interval = interval
+        # Wakeup times (time.perf_counter()) and by how much they were late
+        self._times: List[float] = []
+        self._lags: List[float] = []
+        self._task: Optional[asyncio.Future[None]] = None
+
+    def start(self) -> None:
+        self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self._interval
+            await asyncio.sleep(self._interval)
+            now = time.perf_counter()
+            self._times.append(now)
+            self._lags.append(max(0.0, now - expected))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # Lag of the wakeups between `start` and `end` (both time.perf_counter() values)
+    def lag_between(self, start: float, end: float) -> LoopLag:
+        lags = self._lags[bisect.bisect_left(self._times, start):bisect.bisect_right(self._times, end)]
+        return LoopLag(max_lag=max(lags, default=0.0), total_lag=sum(lag for lag in lags if lag > _NOISE), num_samples=len(lags))
@@ -0,0 +1,170 @@
+from typing import Any, Dict, IO, List, Optional
+import attr
+import hashlib
+import json
+import os
+import tarfile
+from cryfs.e2etest.utils.paths import default_cache_dir, write_json_atomically
+from cryfs.e2etest.utils.tar_index import path_filter
+
+
+MANIFEST_VERSION = 1
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class ManifestException(Exception):
+    def __init__(self, message: str) -> None:
+        self._message = message
+
+    def message(self) -> str:
+        return self._message
+
+
+@attr.s(auto_attribs=True)
+class ManifestEntry(object):
+    # Path relative to the root of the tar file, using '/' as separator. The root directory itself is ''.
+    path: str
+    # 'file', 'dir' or 'symlink'
+    type: str
+    size: int = 0
+    # None for directories that aren't in the tar file but are created implicitly when extracting
+    uid: Optional[int] = None
+    gid: Optional[int] = None
+    mode: Optional[int] = None
+    symlink_target: Optional[str] = None
+    sha256: Optional[str] = None
+
+    def to_json(self) -> Dict[str, Any]:
+        return attr.asdict(self)
+
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> 'ManifestEntry':
+        return ManifestEntry(**data)
+
+
+# Describes the contents of a data tar file, so a directory can be checked against it without extracting the tar file.
+@attr.s(auto_attribs=True)
+class Manifest(object):
+    tar_sha256: str
+    entries: List[ManifestEntry]
+
+    def total_file_size(self) -> int:
+        return sum(entry.size for entry in self.entries if entry.type == 'file')
+
+    # Modes of the files and directories by path. Symlinks don't have a mode on Linux.
+    def modes(self) -> Dict[str, int]:
+        return {entry.path: entry.mode for entry in self.entries if entry.mode is not None and entry.type != 'symlink'}
+
+    # The entries a directory contains after extracting only the given paths from the tar file, see TarFile.unpack_members()
+    def select(self, paths: List[str]) -> 'Manifest':
+        is_selected = path_filter(paths)
+        return Manifest(tar_sha256=self.tar_sha256, entries=[entry for entry in self.entries if is_selected(entry.path)])
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "version": MANIFEST_VERSION,
+            "tar_sha256": self.tar_sha256,
+            "entries": [entry.to_json() for entry in self.entries],
+        }
+
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> 'Manifest':
+        if data.get("version") != MANIFEST_VERSION:
+            raise ManifestException("Unsupported manifest version: %s" % data.get("version"))
+        return Manifest(tar_sha256=data["tar_sha256"], entries=[ManifestEntry.from_json(entry) for entry in data["entries"]])
+
+    def save(self, path: str) -> None:
+        write_json_atomically(path, self.to_json(), indent=1)
+
+    @staticmethod
+    def load(path: str) -> 'Manifest':
+        with open(path, 'r') as file:
+            return Manifest.from_json(json.load(file))
+
+
+def file_sha256(path: str) -> str:
+    with open(path, 'rb') as file:
+        return _stream_sha256(file)
+
+
+def _stream_sha256(stream: IO[bytes]) -> str:
+    hasher = hashlib.sha256()
+    while True:
+        block = stream.read(_HASH_BLOCK_SIZE)
+        if not block:
+            return hasher.hexdigest()
+        hasher.update(block)
+
+
+def _normalize_path(name: str) -> str:
+    parts = [part for part in name.split('/') if part not in ('', '.')]
+    return '/'.join(parts)
+
+
+# Reads the tar file once as a stream and records every entry. Hardlinks are recorded as the file they link to,
+# and parent directories missing from the tar file are added the same way tar would create them when extracting.
+def create_manifest(tar_path: str) -> Manifest:
+    entries: Dict[str, ManifestEntry] = {'': ManifestEntry(path='', type='dir')}
+    with tarfile.open(tar_path, mode='r|*') as tar:
+        for member in tar:
+            path = _normalize_path(member.name)
+            if member.isdir():
+                entry = ManifestEntry(path=path, type='dir', uid=member.uid, gid=member.gid, mode=member.mode)
+            elif member.issym():
+                entry = ManifestEntry(path=path, type='symlink', size=len(os.fsencode(member.linkname)), uid=member.uid,
+                                      gid=member.gid, mode=member.mode, symlink_target=member.linkname)
+            elif member.islnk():
+                target = entries.get(_normalize_path(member.linkname))
+                if target is None or target.type != 'file':
+                    raise ManifestException("Hardlink %s points to unknown file %s" % (member.name, member.linkname))
+                entry = attr.evolve(target, path=path)
+            elif member.isfile():
+                extracted = tar.extractfile(member)
+                assert extracted is not None
+                entry = ManifestEntry(path=path, type='file', size=member.size, uid=member.uid, gid=member.gid,
+                                      mode=member.mode, sha256=_stream_sha256(extracted))
+            else:
+                raise ManifestException("Unsupported tar member type for %s" % member.name)
+            entries[path] = entry
+            _add_implicit_parents(entries, path)
+    return Manifest(tar_sha256=file_sha256(tar_path), entries=[entries[path] for path in sorted(entries.keys())])
+
+
+def _add_implicit_parents(entries: Dict[str, ManifestEntry], path: str) -> None:
+    while path != '':
+        path = path.rpartition('/')[0]
+        if path not in entries:
+            entries[path] = ManifestEntry(path=path, type='dir')
+
+
+def manifest_path_for(tar_path: str) -> str:
+    return tar_path + ".manifest.json"
+
+
+def _cached_manifest_path_for(tar_path: str) -> str:
+    key = hashlib.sha256(os.path.abspath(tar_path).encode('UTF-8')).hexdigest()
+    return os.path.join(default_cache_dir(), "manifests", key + ".json")
+
+
+# Returns the manifest for a data tar file. A manifest next to the tar file (see cryfs-e2etest-create-manifest) or in the
+# user cache dir is only used if it was created from the same tar file contents. Otherwise, the manifest is created and
+# cached in the user cache dir. It is never written next to the tar file, so test runs don't modify the fixtures directory.
+def load_or_create_manifest(tar_path: str) -> Manifest:
+    tar_sha256 = file_sha256(tar_path)
+    cached_path = _cached_manifest_path_for(tar_path)
+    for candidate in [manifest_path_for(tar_path), cached_path]:
+        if os.path.exists(candidate):
+            try:
+                manifest = Manifest.load(candidate)
+            except (ValueError, KeyError, TypeError, ManifestException):
+                continue
+            if manifest.tar_sha256 == tar_sha256:
+                return manifest
+    manifest = create_manifest(tar_path)
+    try:
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        manifest.save(cached_path)
+    except OSError:
+        # It is only a cache
+        pass
+    return manifest
@@ -0,0 +1,49 @@
+from typing import IO, List
+import os
+import re
+import select
+from cryfs.e2etest.utils.executor import run_in_thread
+
+
+MOUNTINFO_PATH = "/proc/self/mountinfo"
+
+
+def mountinfo_supported() -> bool:
+    return os.path.exists(MOUNTINFO_PATH)
+
+
+def _unescape(path: str) -> str:
+    # The kernel escapes space, tab, newline and backslash as octal sequences, e.g. "\040" for space
+    return re.sub(r'\\([0-7]{3})', lambda match: chr(int(match.group(1), 8)), path)
+
+
+# Returns the mount points listed in a /proc/<pid>/mountinfo file. See proc(5) for the format.
+def parse_mount_points(mountinfo: str) -> List[str]:
+    result = []
+    for line in mountinfo.splitlines():
+        fields = line.split(' ')
+        if len(fields) > 4:
+            result.append(_unescape(fields[4]))
+    return result
+
+
+def _is_mounted(mountinfo_file: IO[str], dir: str) -> bool:
+    mountinfo_file.seek(0)
+    return os.path.realpath(dir) in parse_mount_points(mountinfo_file.read())
+
+
+def _wait_for_change(mountinfo_file: IO[str], timeout_ms: int) -> None:
+    # The kernel signals changes to the mount table with POLLPRI/POLLERR on an open mountinfo file.
+    # The event is reset when the file is read again.
+    poller = select.poll()
+    poller.register(mountinfo_file, select.POLLPRI | select.POLLERR)
+    poller.poll(timeout_ms)
+
+
+# Waits until `dir` doesn't show up in the mount table anymore.
+# Instead of polling the mount table, this blocks in poll() (on an executor thread) until the mount table changes.
+# `recheck_interval_ms` bounds the time we wait for a single change notification, in case one is lost.
+async def wait_until_unmounted(dir: str, recheck_interval_ms: int = 100) -> None:
+    with open(MOUNTINFO_PATH, 'r') as mountinfo_file:
+        while _is_mounted(mountinfo_file, dir):
+            await run_in_thread(_wait_for_change, mountinfo_file, recheck_interval_ms)
@@ -0,0 +1,24 @@
+from typing import Any, Optional
+import json
+import os
+import tempfile
+
+
+def default_cache_dir() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_home, "cryfs-e2etest")
+
+
+# Writes `data` as JSON to a temporary file next to `path` and renames it to `path`, so readers never see a partially
+# written file. The temporary file has a unique name, so several processes and threads can write the same path at the same time.
+def write_json_atomically(path: str, data: Any, indent: Optional[int] = None) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as file:
+            json.dump(data, file, indent=indent, sort_keys=indent is not None)
+        # mkstemp creates the file only readable by us
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
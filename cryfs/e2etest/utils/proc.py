@@ -0,0 +1,204 @@
+from typing import Dict, List, Optional
+import asyncio
+import attr
+import ctypes
+import os
+
+
+def _read_cmdline(pid: int) -> Optional[List[str]]:
+    try:
+        with open("/proc/%d/cmdline" % pid, 'rb') as file:
+            content = file.read()
+    except OSError:
+        # Process exited in the meantime or isn't accessible
+        return None
+    return [arg.decode('UTF-8', errors='replace') for arg in content.split(b'\0') if arg != b'']
+
+
+# Returns the pids of all processes of the current user whose command line contains `argument`
+def find_processes_with_argument(argument: str) -> List[int]:
+    if not os.path.isdir("/proc"):
+        return []
+    result = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        pid = int(entry)
+        if pid == os.getpid():
+            continue
+        cmdline = _read_cmdline(pid)
+        if cmdline is not None and argument in cmdline:
+            result.append(pid)
+    return sorted(result)
+
+
+def process_is_running(pid: int) -> bool:
+    try:
+        with open("/proc/%d/stat" % pid, 'r') as file:
+            stat = file.read()
+    except OSError:
+        return False
+    # The process state comes after the command name, which is in parentheses and can contain spaces.
+    # A zombie has already exited, it is only waiting for its parent to reap it.
+    state = stat[stat.rfind(')') + 2:].split(' ', 1)[0]
+    return state not in ('Z', 'X')
+
+
+# From <linux/prctl.h>
+_PR_SET_CHILD_SUBREAPER = 36
+
+
+# Makes orphaned descendants of this process, e.g. daemons that detached from their parent, children of this process
+# instead of init. When they exit, they stay zombies until we reap them, and until then their final resource usage
+# can still be read from /proc. Returns False if the kernel doesn't support it.
+# This applies to all orphaned descendants for the rest of the process, so only use it in a helper process (see subreaper.py).
+def become_child_subreaper() -> bool:
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        return int(libc.prctl(_PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0)) == 0
+    except (OSError, AttributeError):
+        return False
+
+
+# Waits until the process with the given pid exited. The process doesn't have to be a child of ours.
+async def wait_for_process_exit(pid: int, poll_interval: float = 0.005) -> None:
+    loop = asyncio.get_event_loop()
+    pidfd_open = getattr(os, 'pidfd_open', None)
+    if pidfd_open is not None:
+        try:
+            pidfd = pidfd_open(pid)
+        except OSError:
+            # Process already gone, or pidfds not supported by the kernel. Fall back to polling.
+            pidfd = None
+        if pidfd is not None:
+            try:
+                exited = loop.create_future()
+
+                def on_exit() -> None:
+                    if not exited.done():
+                        exited.set_result(None)
+                loop.add_reader(pidfd, on_exit)
+                try:
+                    await exited
+                finally:
+                    loop.remove_reader(pidfd)
+            finally:
+                os.close(pidfd)
+            return
+    while process_is_running(pid):
+        await asyncio.sleep(poll_interval)
+
+
+# Resource usage of a process. Counters are cumulative since the process started.
+@attr.s(auto_attribs=True)
+class ProcessUsage(object):
+    # Peak resident set size as tracked by the kernel (VmHWM), so it doesn't depend on how often we sample
+    peak_rss_bytes: int = 0
+    user_time: float = 0.0
+    system_time: float = 0.0
+    voluntary_context_switches: int = 0
+    involuntary_context_switches: int = 0
+    # Bytes the process caused to be read from or written to the storage layer, i.e. to the basedir
+    read_bytes: int = 0
+    write_bytes: int = 0
+    num_samples: int = 0
+
+    def cpu_time(self) -> float:
+        return self.user_time + self.system_time
+
+
+def _read_proc_file(pid: int, name: str) -> Optional[str]:
+    try:
+        with open("/proc/%d/%s" % (pid, name), 'r') as file:
+            return file.read()
+    except OSError:
+        return None
+
+
+def _parse_key_values(content: str) -> Dict[str, str]:
+    result = {}
+    for line in content.splitlines():
+        key, sep, value = line.partition(':')
+        if sep != '':
+            result[key.strip()] = value.strip()
+    return result
+
+
+def _parse_kb(value: Optional[str]) -> int:
+    # /proc/<pid>/status reports memory as e.g. "1234 kB"
+    if value is None:
+        return 0
+    return int(value.split()[0]) * 1024
+
+
+# Reads the current resource usage of a process from /proc. Returns None if the process doesn't exist (anymore).
+def read_process_usage(pid: int) -> Optional[ProcessUsage]:
+    stat = _read_proc_file(pid, "stat")
+    status = _read_proc_file(pid, "status")
+    if stat is None or status is None:
+        return None
+    # Fields after the command name (which is in parentheses and can contain spaces), starting with the state (field 3).
+    # utime and stime are fields 14 and 15.
+    fields = stat[stat.rfind(')') + 2:].split()
+    clock_ticks = os.sysconf('SC_CLK_TCK')
+    status_values = _parse_key_values(status)
+    # Reading /proc/<pid>/io can fail if the kernel doesn't have task IO accounting
+    io = _read_proc_file(pid, "io")
+    io_values = _parse_key_values(io) if io is not None else {}
+    return ProcessUsage(
+        peak_rss_bytes=max(_parse_kb(status_values.get("VmHWM")), _parse_kb(status_values.get("VmRSS"))),
+        user_time=int(fields[11]) / clock_ticks,
+        system_time=int(fields[12]) / clock_ticks,
+        voluntary_context_switches=int(status_values.get("voluntary_ctxt_switches", "0")),
+        involuntary_context_switches=int(status_values.get("nonvoluntary_ctxt_switches", "0")),
+        read_bytes=int(io_values.get("read_bytes", "0")),
+        write_bytes=int(io_values.get("write_bytes", "0")),
+        num_samples=1,
+    )
+
+
+# Samples the resource usage of a process at a fixed interval until it is stopped or the process exits.
+# The process doesn't have to be a child of ours. As long as it wasn't reaped yet (see subreaper.py), stop() still gets
+# its final usage after it exited. Otherwise, whatever the process did after the
+# last sample is missing.
+class ProcessMonitor(object):
+    def __init__(self, pid: int, interval: float) -> None:
+        self._pid = pid
+        self._interval = interval
+        self._usage: Optional[ProcessUsage] = None
+        self._task: Optional[asyncio.Future[None]] = None
+
+    def start(self) -> None:
+        self._sample()
+        self._task = asyncio.ensure_future(self._run())
+
+    def _sample(self) -> bool:
+        usage = read_process_usage(self._pid)
+        if usage is None:
+            return False
+        if self._usage is not None:
+            usage.peak_rss_bytes = max(usage.peak_rss_bytes, self._usage.peak_rss_bytes)
+            usage.num_samples += self._usage.num_samples
+        self._usage = usage
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            if not self._sample():
+                return
+
+    # Takes a last sample (if the process is still running or a zombie) and returns the usage, or None if the process couldn't be sampled at all
+    async def stop(self) -> Optional[ProcessUsage]:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._sample()
+        return self._usage
+
+    def usage(self) -> Optional[ProcessUsage]:
+        return self._usage
@@ -0,0 +1,56 @@
+from typing import Optional
+from types import TracebackType
+import asyncio
+
+
+class _ResourceSlot(object):
+    def __init__(self, semaphore: Optional[asyncio.Semaphore]) -> None:
+        self._semaphore = semaphore
+
+    async def __aenter__(self) -> None:
+        if self._semaphore is not None:
+            await self._semaphore.acquire()
+
+    async def __aexit__(self, exc_type: Optional[type], exc: Optional[BaseException], tb: Optional[TracebackType]) -> None:
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+
+def _semaphore(limit: Optional[int]) -> Optional[asyncio.Semaphore]:
+    if limit is None:
+        return None
+    if limit < 1:
+        raise ValueError("Resource limit must be at least 1, got %d" % limit)
+    return asyncio.Semaphore(limit)
+
+
+# Limits how many expensive operations run at the same time, independently of how many test cases are running.
+# A limit of None means unbounded. Each slot kind is only ever acquired once at a time by a test case
+# (mounts are held for the lifetime of the mount, extractions and comparisons only while they run),
+# so tests can't deadlock on each other.
+class ResourceLimits(object):
+    def __init__(self, max_mounts: Optional[int] = None, max_extractions: Optional[int] = None, max_comparisons: Optional[int] = None) -> None:
+        self._mounts = _semaphore(max_mounts)
+        self._extractions = _semaphore(max_extractions)
+        self._comparisons = _semaphore(max_comparisons)
+
+    def mount(self) -> _ResourceSlot:
+        return _ResourceSlot(self._mounts)
+
+    def extraction(self) -> _ResourceSlot:
+        return _ResourceSlot(self._extractions)
+
+    def comparison(self) -> _ResourceSlot:
+        return _ResourceSlot(self._comparisons)
+
+
+_instance = ResourceLimits()
+
+
+def get_resource_limits() -> ResourceLimits:
+    return _instance
+
+
+def set_resource_limits(limits: ResourceLimits) -> None:
+    global _instance
+    _instance = limits
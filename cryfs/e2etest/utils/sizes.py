@@ -0,0 +1,27 @@
+_UNITS = {
+    '': 1,
+    'B': 1,
+    'K': 1024,
+    'M': 1024 ** 2,
+    'G': 1024 ** 3,
+    'T': 1024 ** 4,
+}
+
+
+# Parses sizes like "4096", "4K", "1M" or "50G" (binary units) into a number of bytes
+def parse_size(size: str) -> int:
+    size = size.strip().upper()
+    if size.endswith('IB'):
+        size = size[:-2]
+    unit = size[-1:] if size[-1:].isalpha() else ''
+    if unit not in _UNITS:
+        raise ValueError("Invalid size: %s" % size)
+    number = size[:len(size) - len(unit)]
+    return int(float(number) * _UNITS[unit])
+
+
+def format_size(num_bytes: int) -> str:
+    for unit in ['T', 'G', 'M', 'K']:
+        if num_bytes >= _UNITS[unit] and num_bytes % _UNITS[unit] == 0:
+            return "%d%s" % (num_bytes // _UNITS[unit], unit)
+    return "%d" % num_bytes
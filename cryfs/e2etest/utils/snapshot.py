@@ -0,0 +1,127 @@
+from typing import List, Optional, Tuple
+from types import TracebackType
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import errno
+import fcntl
+import os
+import shutil
+import stat
+from cryfs.e2etest.test_framework.metrics import Phase, TestMetrics, span
+from cryfs.e2etest.utils.executor import AsyncTemporaryDirectory, run_blocking
+from cryfs.e2etest.utils.fixture_cache import CachedTarUnpacker, get_fixture_cache
+from cryfs.e2etest.utils.resource_limits import get_resource_limits
+from cryfs.e2etest.utils.tar import TarFile
+
+
+# ioctl from linux/fs.h that makes a file share the data blocks of another file (copy-on-write), on btrfs, xfs, ...
+FICLONE = 0x40049409
+
+# errnos that tell us the file system doesn't support reflinks, as opposed to an actual I/O error
+_REFLINK_UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS}
+
+
+# clone_first() finds out if the file system supports reflinks. After that, clone() can be called from several threads,
+# reflink_supported is only read by then.
+class _FileCloner(object):
+    def __init__(self) -> None:
+        self.reflink_supported = True
+
+    def clone_first(self, source: str, dest: str) -> None:
+        self.reflink_supported = self._reflink(source, dest)
+        if not self.reflink_supported:
+            self._copy(source, dest)
+
+    def clone(self, source: str, dest: str) -> None:
+        if not self.reflink_supported or not self._reflink(source, dest):
+            self._copy(source, dest)
+
+    # Returns false if the file system doesn't support reflinks. `dest` doesn't exist then.
+    def _reflink(self, source: str, dest: str) -> bool:
+        try:
+            with open(source, 'rb') as source_file:
+                dest_fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_EXCL, _writable_mode(source))
+                try:
+                    fcntl.ioctl(dest_fd, FICLONE, source_file.fileno())
+                    return True
+                finally:
+                    os.close(dest_fd)
+        except OSError as e:
+            if e.errno not in _REFLINK_UNSUPPORTED:
+                raise
+            # os.open() itself can fail with these, then there is nothing to remove
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(dest)
+            return False
+
+    def _copy(self, source: str, dest: str) -> None:
+        shutil.copyfile(source, dest)
+        os.chmod(dest, _writable_mode(source))
+
+
+def _writable_mode(path: str) -> int:
+    return stat.S_IMODE(os.stat(path).st_mode) | stat.S_IWUSR
+
+
+# Creates a writable copy of the `source` tree at `dest` (which must not exist yet).
+# Files are reflinked if the file system supports it, so the copy costs roughly the same independent of the file sizes.
+# Otherwise, files are copied using `num_threads` threads in parallel.
+#
+# Note: A hardlink farm isn't used as fallback, because CryFS rewrites block files in place,
+# which would modify the shared source tree.
+def clone_tree(source: str, dest: str, num_threads: int = 8) -> bool:
+    files: List[Tuple[str, str]] = []
+    for dirpath, dirnames, filenames in os.walk(source):
+        target_dir = os.path.join(dest, os.path.relpath(dirpath, source))
+        os.makedirs(target_dir, exist_ok=True)
+        os.chmod(target_dir, stat.S_IMODE(os.stat(dirpath).st_mode) | stat.S_IWUSR)
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path):
+                os.symlink(os.readlink(path), os.path.join(target_dir, name))
+            elif name in filenames:
+                files.append((path, os.path.join(target_dir, name)))
+    cloner = _FileCloner()
+    if len(files) > 0:
+        # Clone the first file alone, so we know if reflinks work before starting the threads.
+        cloner.clone_first(*files[0])
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        for _ in executor.map(lambda file: cloner.clone(*file), files[1:]):
+            pass
+    return cloner.reflink_supported
+
+
+# Async context manager returning a private, writable copy of an extracted tar file.
+# The tar file is only extracted once (see FixtureCache), and each user gets a copy-on-write snapshot of it.
+class SnapshotUnpacker(object):
+    def __init__(self, tar_file: TarFile, metrics: Optional[TestMetrics] = None) -> None:
+        self._master: CachedTarUnpacker = get_fixture_cache().unpack(tar_file, metrics)
+        self._metrics = metrics
+        self._tempdir: Optional[AsyncTemporaryDirectory] = None
+
+    async def __aenter__(self) -> str:
+        master_dir = await self._master.__aenter__()
+        try:
+            self._tempdir = AsyncTemporaryDirectory()
+            snapshot_dir = os.path.join(self._tempdir.name, "snapshot")
+            with span(self._metrics, Phase.FIXTURE_UNPACK):
+                async with get_resource_limits().extraction():
+                    await run_blocking(clone_tree, master_dir, snapshot_dir)
+            return snapshot_dir
+        except BaseException:
+            try:
+                # Could hold a partial copy of the snapshot
+                if self._tempdir is not None:
+                    await self._tempdir.cleanup()
+                    self._tempdir = None
+            finally:
+                await self._master.__aexit__(None, None, None)
+            raise
+
+    async def __aexit__(self, exc_type: Optional[type], exc: Optional[BaseException], tb: Optional[TracebackType]) -> None:
+        try:
+            if self._tempdir is not None:
+                with span(self._metrics, Phase.CLEANUP):
+                    await self._tempdir.cleanup()
+        finally:
+            await self._master.__aexit__(exc_type, exc, tb)
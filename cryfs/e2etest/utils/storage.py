@@ -0,0 +1,89 @@
+from typing import Any, Dict, Optional
+import attr
+import os
+
+
+# Files in the basedir that aren't blocks
+_NON_BLOCK_FILES = {"cryfs.config"}
+
+
+# How much space a CryFS file system takes in its basedir, compared to the plaintext data stored in it
+@attr.s(auto_attribs=True)
+class StorageReport(object):
+    num_blocks: int = 0
+    # Sum of the block file sizes
+    block_bytes: int = 0
+    # Space allocated on disk for all files in the basedir (including the config file and directories)
+    bytes_on_disk: int = 0
+    # Size of the plaintext data in the file system, i.e. of the files in the data fixture
+    plaintext_bytes: int = 0
+    # Number of blocks per block file size. CryFS pads blocks, so there are usually only very few different sizes.
+    block_size_histogram: Dict[int, int] = attr.Factory(dict)
+    # Bytes the CryFS daemon wrote to the storage layer, from its /proc/<pid>/io counters. None if not measured, or if the
+    # counters didn't see all writes, e.g. because the basedir is on tmpfs, which doesn't do IO accounting.
+    daemon_write_bytes: Optional[int] = None
+
+    def overhead_ratio(self) -> float:
+        return self.bytes_on_disk / self.plaintext_bytes if self.plaintext_bytes > 0 else float('nan')
+
+    def write_amplification(self) -> Optional[float]:
+        if self.daemon_write_bytes is None or self.plaintext_bytes == 0:
+            return None
+        return self.daemon_write_bytes / self.plaintext_bytes
+
+    # The write amplification is left out if it wasn't measured
+    def to_json(self) -> Dict[str, Any]:
+        result = {
+            "num_blocks": self.num_blocks,
+            "block_bytes": self.block_bytes,
+            "bytes_on_disk": self.bytes_on_disk,
+            "plaintext_bytes": self.plaintext_bytes,
+            "overhead_ratio": self.overhead_ratio(),
+            "block_size_histogram": {str(size): count for size, count in sorted(self.block_size_histogram.items())},
+        }
+        write_amplification = self.write_amplification()
+        if self.daemon_write_bytes is not None and write_amplification is not None:
+            result["daemon_write_bytes"] = self.daemon_write_bytes
+            result["write_amplification"] = write_amplification
+        return result
+
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> 'StorageReport':
+        return StorageReport(
+            num_blocks=data["num_blocks"],
+            block_bytes=data["block_bytes"],
+            bytes_on_disk=data["bytes_on_disk"],
+            plaintext_bytes=data["plaintext_bytes"],
+            block_size_histogram={int(size): count for size, count in data["block_size_histogram"].items()},
+            daemon_write_bytes=data.get("daemon_write_bytes"),
+        )
+
+    def to_string(self) -> str:
+        histogram = ", ".join("%d bytes: %d" % (size, count) for size, count in sorted(self.block_size_histogram.items()))
+        result = "%d blocks, %.1f MB on disk for %.1f MB plaintext (ratio %.2f). Block sizes: %s" % (
+            self.num_blocks, self.bytes_on_disk / 1024 / 1024, self.plaintext_bytes / 1024 / 1024, self.overhead_ratio(), histogram)
+        write_amplification = self.write_amplification()
+        if self.daemon_write_bytes is not None and write_amplification is not None:
+            result += ". Daemon wrote %.1f MB (write amplification %.2f)" % (self.daemon_write_bytes / 1024 / 1024, write_amplification)
+        return result
+
+
+# Scans the basedir of an unmounted CryFS file system. `daemon_write_bytes` must include the writes at unmount,
+# when CryFS flushes its caches (see ProcessMonitor).
+def scan_basedir(basedir: str, plaintext_bytes: int, daemon_write_bytes: Optional[int] = None) -> StorageReport:
+    report = StorageReport(plaintext_bytes=plaintext_bytes, daemon_write_bytes=daemon_write_bytes)
+    for dirpath, dirnames, filenames in os.walk(basedir):
+        for dirname in dirnames:
+            report.bytes_on_disk += os.lstat(os.path.join(dirpath, dirname)).st_blocks * 512
+        for filename in filenames:
+            stat = os.lstat(os.path.join(dirpath, filename))
+            report.bytes_on_disk += stat.st_blocks * 512
+            if dirpath == basedir and filename in _NON_BLOCK_FILES:
+                continue
+            report.num_blocks += 1
+            report.block_bytes += stat.st_size
+            report.block_size_histogram[stat.st_size] = report.block_size_histogram.get(stat.st_size, 0) + 1
+    if daemon_write_bytes is not None and daemon_write_bytes < report.block_bytes:
+        # The daemon wrote every block in the basedir, so the counters missed some writes
+        report.daemon_write_bytes = None
+    return report
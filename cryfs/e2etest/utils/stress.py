@@ -0,0 +1,283 @@
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import attr
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from cryfs.e2etest.utils.synthetic import content_block
+
+
+# Size of the records appended to the shared log file and written to the shared slots file.
+# Each record identifies the worker and operation that wrote it, so torn or lost writes can be detected.
+RECORD_SIZE = 64
+# Maximal size of the data written by a single create, append or overwrite of a private file
+MAX_WRITE_SIZE = 16 * 1024
+SHARED_DIR = "shared"
+SHARED_LOG = "log"
+SHARED_SLOTS = "slots"
+# Worker number of the records the slots file is initialized with
+_INITIAL_WORKER = 0xffff
+
+_OPERATIONS = [
+    ("create", 15), ("append", 20), ("overwrite", 15), ("rename", 10), ("read", 15),
+    ("shared_append", 10), ("shared_write", 10), ("shared_read", 5),
+]
+
+
+# One operation done by a stress worker. `start` and `end` are time.monotonic() values, which are comparable between processes.
+@attr.s(auto_attribs=True)
+class OpRecord(object):
+    worker: int
+    seq: int
+    op: str
+    start: float
+    end: float
+    # Relative to the worker's directory for private files, or to the shared directory
+    path: str = ''
+    target: str = ''
+    offset: int = 0
+    size: int = 0
+    content_seed: int = 0
+    slot: int = 0
+
+
+def worker_dir(root: str, worker: int) -> str:
+    return os.path.join(root, "w%d" % worker)
+
+
+def make_record(worker: int, seq: int) -> bytes:
+    header = b"R%04x%08x" % (worker, seq)
+    return header + hashlib.sha256(header).hexdigest().encode('ascii')[:RECORD_SIZE - len(header)]
+
+
+# Returns (worker, seq) of a record, or None if it isn't a valid record
+def parse_record(data: bytes) -> Optional[Tuple[int, int]]:
+    if len(data) != RECORD_SIZE or data[:1] != b"R":
+        return None
+    try:
+        worker, seq = int(data[1:5], 16), int(data[5:13], 16)
+    except ValueError:
+        return None
+    return (worker, seq) if make_record(worker, seq) == data else None
+
+
+# Creates the shared files all workers of a round write to
+def prepare_round(root: str, num_slots: int) -> None:
+    shared = os.path.join(root, SHARED_DIR)
+    os.makedirs(shared)
+    with open(os.path.join(shared, SHARED_LOG), 'wb'):
+        pass
+    with open(os.path.join(shared, SHARED_SLOTS), 'wb') as file:
+        for slot in range(num_slots):
+            file.write(make_record(_INITIAL_WORKER, slot))
+
+
+def _content(content_seed: int, size: int) -> bytes:
+    return content_block(content_seed, 0, size)
+
+
+# Applies the effect of a private file operation to a model of the worker's directory
+def apply_private(model: Dict[str, bytearray], record: OpRecord) -> None:
+    if record.op == "create":
+        model[record.path] = bytearray(_content(record.content_seed, record.size))
+    elif record.op == "append":
+        model[record.path] += _content(record.content_seed, record.size)
+    elif record.op == "overwrite":
+        data = model[record.path]
+        end = record.offset + record.size
+        if len(data) < end:
+            data += bytes(end - len(data))
+        data[record.offset:end] = _content(record.content_seed, record.size)
+    elif record.op == "rename":
+        model[record.target] = model.pop(record.path)
+
+
+def _read_all(path: str) -> bytes:
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+# Checks that a shared file only consists of complete records
+def _check_records(data: bytes, path: str) -> Tuple[List[Tuple[int, int]], List[str]]:
+    records = []
+    errors = []
+    if len(data) % RECORD_SIZE != 0:
+        errors.append("%s has size %d, which isn't a multiple of the record size" % (path, len(data)))
+    for offset in range(0, len(data) - len(data) % RECORD_SIZE, RECORD_SIZE):
+        record = parse_record(data[offset:offset + RECORD_SIZE])
+        if record is None:
+            errors.append("%s has a torn or corrupted record at offset %d" % (path, offset))
+        else:
+            records.append(record)
+    return records, errors
+
+
+# Runs `num_ops` random operations on the worker's private files and the shared files below `root`.
+# Reads are checked immediately. Returns the ordered record of all operations and the errors found by reads.
+def run_worker(root: str, worker: int, num_ops: int, seed: int, num_slots: int) -> Tuple[List[OpRecord], List[str]]:
+    rand = random.Random(seed * 1000003 + worker)
+    operations = [op for op, weight in _OPERATIONS for _ in range(weight)]
+    mydir = worker_dir(root, worker)
+    shared = os.path.join(root, SHARED_DIR)
+    os.makedirs(mydir, exist_ok=True)
+    model: Dict[str, bytearray] = {}
+    records: List[OpRecord] = []
+    errors: List[str] = []
+    next_name = 0
+    for seq in range(num_ops):
+        op = rand.choice(operations)
+        if op in ("append", "overwrite", "rename", "read") and len(model) == 0:
+            op = "create"
+        record = OpRecord(worker=worker, seq=seq, op=op, start=time.monotonic(), end=0.0)
+        if op == "create":
+            record.path = "f%d" % next_name
+            next_name += 1
+            record.size = rand.randint(0, MAX_WRITE_SIZE)
+            record.content_seed = rand.getrandbits(32)
+            with open(os.path.join(mydir, record.path), 'wb') as file:
+                file.write(_content(record.content_seed, record.size))
+        elif op in ("append", "overwrite"):
+            record.path = rand.choice(sorted(model.keys()))
+            record.size = rand.randint(1, MAX_WRITE_SIZE)
+            record.content_seed = rand.getrandbits(32)
+            if op == "append":
+                with open(os.path.join(mydir, record.path), 'ab') as file:
+                    file.write(_content(record.content_seed, record.size))
+            else:
+                record.offset = rand.randint(0, len(model[record.path]))
+                with open(os.path.join(mydir, record.path), 'r+b') as file:
+                    file.seek(record.offset)
+                    file.write(_content(record.content_seed, record.size))
+        elif op == "rename":
+            record.path = rand.choice(sorted(model.keys()))
+            record.target = "f%d" % next_name
+            next_name += 1
+            os.rename(os.path.join(mydir, record.path), os.path.join(mydir, record.target))
+        elif op == "read":
+            record.path = rand.choice(sorted(model.keys()))
+            if _read_all(os.path.join(mydir, record.path)) != bytes(model[record.path]):
+                errors.append("Worker %d read wrong content from %s after operation %d" % (worker, record.path, seq))
+        elif op == "shared_append":
+            record.path = SHARED_LOG
+            # O_APPEND, so concurrent appends of the workers must not overwrite each other
+            fd = os.open(os.path.join(shared, SHARED_LOG), os.O_WRONLY | os.O_APPEND)
+            try:
+                os.write(fd, make_record(worker, seq))
+            finally:
+                os.close(fd)
+        elif op == "shared_write":
+            record.path = SHARED_SLOTS
+            record.slot = rand.randrange(num_slots)
+            fd = os.open(os.path.join(shared, SHARED_SLOTS), os.O_WRONLY)
+            try:
+                os.pwrite(fd, make_record(worker, seq), record.slot * RECORD_SIZE)
+            finally:
+                os.close(fd)
+        elif op == "shared_read":
+            record.path = rand.choice([SHARED_LOG, SHARED_SLOTS])
+            errors += _check_records(_read_all(os.path.join(shared, record.path)), "%s (read by worker %d)" % (record.path, worker))[1]
+        record.end = time.monotonic()
+        apply_private(model, record)
+        records.append(record)
+    return records, errors
+
+
+# Checks the files below `root` against the records of all workers of a round. Private files must exactly match a replay
+# of their worker's operations. The shared log must contain each appended record exactly once. Each slot must hold a record
+# of a write to it that wasn't definitely overwritten, i.e. no other write to the slot started after it ended.
+def verify_round(root: str, records: List[OpRecord], num_workers: int, num_slots: int) -> List[str]:
+    errors: List[str] = []
+    for worker in range(num_workers):
+        model: Dict[str, bytearray] = {}
+        for record in sorted((r for r in records if r.worker == worker), key=lambda r: r.seq):
+            apply_private(model, record)
+        mydir = worker_dir(root, worker)
+        actual = sorted(os.listdir(mydir)) if os.path.isdir(mydir) else []
+        if actual != sorted(model.keys()):
+            errors.append("%s has files %s, expected %s" % (mydir, actual, sorted(model.keys())))
+        for name in sorted(set(actual) & set(model.keys())):
+            if _read_all(os.path.join(mydir, name)) != bytes(model[name]):
+                errors.append("%s has wrong content" % os.path.join(mydir, name))
+
+    shared = os.path.join(root, SHARED_DIR)
+    appended, log_errors = _check_records(_read_all(os.path.join(shared, SHARED_LOG)), SHARED_LOG)
+    errors += log_errors
+    expected = sorted((r.worker, r.seq) for r in records if r.op == "shared_append")
+    if sorted(appended) != expected:
+        errors.append("%s has %d records, expected the %d appended ones" % (SHARED_LOG, len(appended), len(expected)))
+
+    slots, slot_errors = _check_records(_read_all(os.path.join(shared, SHARED_SLOTS)), SHARED_SLOTS)
+    errors += slot_errors
+    if len(slots) != num_slots:
+        errors.append("%s has %d slots, expected %d" % (SHARED_SLOTS, len(slots), num_slots))
+    writes: Dict[int, List[OpRecord]] = {}
+    for record in records:
+        if record.op == "shared_write":
+            writes.setdefault(record.slot, []).append(record)
+    for slot, (worker, seq) in enumerate(slots):
+        candidates = writes.get(slot, [])
+        if len(candidates) == 0:
+            if (worker, seq) != (_INITIAL_WORKER, slot):
+                errors.append("Slot %d was never written, but contains a record of worker %d" % (slot, worker))
+            continue
+        found = [r for r in candidates if (r.worker, r.seq) == (worker, seq)]
+        if len(found) == 0:
+            errors.append("Slot %d contains a record that wasn't written to it" % slot)
+        elif any(other.start > found[0].end for other in candidates):
+            errors.append("Slot %d contains the write of worker %d, operation %d, which was overwritten later" % (slot, worker, seq))
+    return errors
+
+
+@attr.s(auto_attribs=True)
+class RoundStats(object):
+    num_workers: int
+    num_ops: int
+    # From the start of the first operation to the end of the last one
+    duration: float
+
+    def ops_per_second(self) -> float:
+        return self.num_ops / self.duration if self.duration > 0 else float('inf')
+
+
+def round_stats(records: List[OpRecord], num_workers: int) -> RoundStats:
+    if len(records) == 0:
+        return RoundStats(num_workers=num_workers, num_ops=0, duration=0.0)
+    return RoundStats(num_workers=num_workers, num_ops=len(records),
+                      duration=max(r.end for r in records) - min(r.start for r in records))
+
+
+# Table of the throughput of each round, relative to the round with the fewest workers
+def format_scaling(rounds: List[RoundStats]) -> str:
+    lines = ["%8s %10s %10s %10s" % ("workers", "ops/s", "speedup", "per worker")]
+    base = rounds[0].ops_per_second() if len(rounds) > 0 else 0.0
+    for stats in rounds:
+        speedup = stats.ops_per_second() / base if base > 0 else 0.0
+        lines.append("%8d %10.1f %9.2fx %10.1f" % (stats.num_workers, stats.ops_per_second(), speedup, stats.ops_per_second() / stats.num_workers))
+    return "\n".join(lines)
+
+
+# Entry point of the worker processes. Prints "ready", waits for a line on stdin so all workers start at the same time,
+# runs the operations and prints the records and errors as JSON.
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root', required=True)
+    parser.add_argument('--worker', type=int, required=True)
+    parser.add_argument('--num-ops', type=int, required=True)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--num-slots', type=int, required=True)
+    args = parser.parse_args()
+    print("ready", flush=True)
+    sys.stdin.readline()
+    try:
+        records, errors = run_worker(args.root, args.worker, args.num_ops, args.seed, args.num_slots)
+    except OSError as e:
+        records, errors = [], ["Worker %d failed: %s" % (args.worker, str(e))]
+    output: Dict[str, Any] = {"records": [attr.asdict(record) for record in records], "errors": errors}
+    json.dump(output, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from cryfs.e2etest.utils.proc import become_child_subreaper
+
+
+# Runs a command that starts a daemon (e.g. cryfs) under a helper process that is a child subreaper, see become_child_subreaper().
+# The daemon becomes a child of the helper instead of init, so after it exited it stays a zombie until release_daemon() is called,
+# and its final resource usage can still be read from /proc. Only the helper collects orphaned processes this way, the test
+# process doesn't.
+#
+# The process started with the command line from subreaper_command() behaves like the command itself: it exits with the exit
+# code of the command once the command exited. The helper keeps running in the background until the daemon is released.
+
+_SPEC_ENV = "CRYFS_E2ETEST_SUBREAPER_COMMAND"
+_MODULE = "cryfs.e2etest.utils.subreaper"
+
+# If nobody released the daemon this many seconds after all children of the helper exited (e.g. because the test process
+# crashed), the helper reaps them and exits anyway. Without any children (e.g. the command failed before starting a daemon),
+# it exits right away.
+_RELEASE_TIMEOUT = 60.0
+
+
+# Returns the command line and environment to start `command` with `env` under a helper process.
+# The command is passed in the environment, so it doesn't show up in the command line of the helper.
+def subreaper_command(command: List[str], env: Dict[str, str]) -> Tuple[List[str], Dict[str, str]]:
+    return [sys.executable, "-m", _MODULE], dict(os.environ, **{_SPEC_ENV: json.dumps({"command": command, "env": env})})
+
+
+def _read_stat_field(pid: int, index: int) -> Optional[str]:
+    try:
+        with open("/proc/%d/stat" % pid, 'r') as file:
+            stat = file.read()
+    except OSError:
+        return None
+    # Fields after the command name, which is in parentheses and can contain spaces. index 0 is the state.
+    return stat[stat.rfind(')') + 2:].split(' ')[index]
+
+
+def _is_helper(pid: int) -> bool:
+    try:
+        with open("/proc/%d/cmdline" % pid, 'rb') as file:
+            cmdline = file.read().split(b'\0')
+    except OSError:
+        return False
+    return _MODULE.encode('UTF-8') in cmdline
+
+
+# Lets the helper of the daemon reap it and exit. Does nothing if the daemon wasn't started under a helper.
+def release_daemon(daemon_pid: int) -> None:
+    ppid = _read_stat_field(daemon_pid, 1)
+    if ppid is None or not _is_helper(int(ppid)):
+        return
+    try:
+        os.kill(int(ppid), signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
+
+# States of our children, e.g. 'Z' for zombies
+def _child_states() -> List[str]:
+    own_pid = str(os.getpid())
+    states = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit() and _read_stat_field(int(entry), 1) == own_pid:
+            state = _read_stat_field(int(entry), 0)
+            if state is not None:
+                states.append(state)
+    return states
+
+
+def _wait_for_release() -> None:
+    all_exited_since: Optional[float] = None
+    while len(_child_states()) > 0 and signal.sigtimedwait([signal.SIGTERM], 1.0) is None:
+        if any(state not in ('Z', 'X') for state in _child_states()):
+            all_exited_since = None
+        elif all_exited_since is None:
+            all_exited_since = time.monotonic()
+        elif time.monotonic() - all_exited_since > _RELEASE_TIMEOUT:
+            return
+
+
+def _reap_children() -> None:
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            # Children that are still running get reparented to init when we exit
+            return
+
+
+def _unblock_sigterm() -> None:
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, [signal.SIGTERM])
+
+
+def main() -> None:
+    spec = json.loads(os.environ[_SPEC_ENV])
+    status_read, status_write = os.pipe()
+    if os.fork() != 0:
+        # This is the process the caller waits for. It exits like the command once the helper reports its exit code.
+        os.close(status_write)
+        with os.fdopen(status_read, 'rb') as status:
+            reported = status.read()
+        os._exit(int(reported) if reported != b'' else 1)
+    os.close(status_read)
+    become_child_subreaper()
+    # Blocked, so a release before we wait for it isn't lost
+    signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGTERM])
+    returncode = subprocess.call(spec["command"], env=spec["env"], preexec_fn=_unblock_sigterm)
+    # The caller reads the output of the command until everyone holding the pipes closed them
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.write(status_write, str(returncode if returncode >= 0 else 128 - returncode).encode('ascii'))
+    os.close(status_write)
+    _wait_for_release()
+    _reap_children()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+from typing import Callable, Dict, Iterator, List, Optional, Set
+import attr
+import math
+import os
+import random
+from cryfs.e2etest.utils.sizes import parse_size
+
+
+# File contents are generated in blocks of this size. Each block is generated independently from the file seed and block index.
+CONTENT_BLOCK_SIZE = 1024 * 1024
+# Verification stops reporting mismatches after this many
+MAX_REPORTED_ERRORS = 100
+
+
+class SyntheticDatasetException(Exception):
+    def __init__(self, message: str) -> None:
+        self._message = message
+
+    def message(self) -> str:
+        return self._message
+
+
+# Distribution of file sizes. Specified as "fixed:SIZE", "uniform:MIN:MAX" or "lognormal:MEDIAN:SIGMA[:MAX]".
+@attr.s(auto_attribs=True)
+class SizeDistribution(object):
+    kind: str
+    params: List[str]
+
+    @staticmethod
+    def parse(spec: str) -> 'SizeDistribution':
+        kind, *params = spec.split(':')
+        expected = {"fixed": [1], "uniform": [2], "lognormal": [2, 3]}
+        if kind not in expected or len(params) not in expected[kind]:
+            raise SyntheticDatasetException("Invalid size distribution '%s'. Expected e.g. 'fixed:4K', 'uniform:0:1M' or 'lognormal:16K:1.5:1G'" % spec)
+        distribution = SizeDistribution(kind=kind, params=params)
+        # Fail early on invalid numbers
+        distribution.sample(random.Random(0))
+        return distribution
+
+    def sample(self, rand: random.Random) -> int:
+        try:
+            if self.kind == "fixed":
+                return parse_size(self.params[0])
+            elif self.kind == "uniform":
+                return rand.randint(parse_size(self.params[0]), parse_size(self.params[1]))
+            else:
+                size = int(rand.lognormvariate(math.log(max(1, parse_size(self.params[0]))), float(self.params[1])))
+                return min(size, parse_size(self.params[2])) if len(self.params) > 2 else size
+        except ValueError as e:
+            raise SyntheticDatasetException("Invalid size distribution '%s': %s" % (self.to_string(), str(e)))
+
+    def to_string(self) -> str:
+        return ":".join([self.kind] + self.params)
+
+
+# Shape of a synthetic dataset. The same shape (including the seed) always generates the same dataset.
+# `depth` and `fanout` describe a directory tree, and each file is put into a random directory of that tree. Only the directories
+# containing files (and their parents) are created, so the number of directories is at most num_files * depth,
+# and deep trees with few files are cheap.
+@attr.s(auto_attribs=True)
+class DatasetShape(object):
+    num_files: int = 1000
+    # Number of directory levels below the root
+    depth: int = 2
+    # Maximum number of subdirectories per directory
+    fanout: int = 10
+    sizes: SizeDistribution = attr.Factory(lambda: SizeDistribution(kind="lognormal", params=["16K", "1.5", "16M"]))
+    # Fraction of the files that are symlinks instead of regular files
+    symlink_ratio: float = 0.0
+    seed: int = 0
+
+    # Number of directories in the tree described by depth and fanout, including the root
+    def tree_size(self) -> int:
+        return sum(self.fanout ** level for level in range(self.depth + 1))
+
+    # E.g. "files=1000,depth=2,fanout=10,sizes=lognormal:16K:1.5:16M,symlinks=0.0,seed=0"
+    def to_string(self) -> str:
+        return "files=%d,depth=%d,fanout=%d,sizes=%s,symlinks=%s,seed=%d" % (
+            self.num_files, self.depth, self.fanout, self.sizes.to_string(), self.symlink_ratio, self.seed)
+
+    # Parses the format of to_string(). Missing keys keep their default.
+    @staticmethod
+    def parse(spec: str) -> 'DatasetShape':
+        parsers: Dict[str, Callable[[DatasetShape, str], DatasetShape]] = {
+            "files": lambda shape, value: attr.evolve(shape, num_files=int(value)),
+            "depth": lambda shape, value: attr.evolve(shape, depth=int(value)),
+            "fanout": lambda shape, value: attr.evolve(shape, fanout=int(value)),
+            "sizes": lambda shape, value: attr.evolve(shape, sizes=SizeDistribution.parse(value)),
+            "symlinks": lambda shape, value: attr.evolve(shape, symlink_ratio=float(value)),
+            "seed": lambda shape, value: attr.evolve(shape, seed=int(value)),
+        }
+        shape = DatasetShape()
+        for item in spec.split(','):
+            if item.strip() == '':
+                continue
+            key, sep, value = item.partition('=')
+            if sep == '' or key.strip() not in parsers:
+                raise SyntheticDatasetException("Invalid dataset shape '%s'. Valid keys: %s" % (spec, ", ".join(sorted(parsers.keys()))))
+            try:
+                shape = parsers[key.strip()](shape, value.strip())
+            except ValueError as e:
+                raise SyntheticDatasetException("Invalid value for %s in dataset shape '%s': %s" % (key, spec, str(e)))
+        if shape.num_files < 0 or shape.depth < 0 or shape.fanout < 1 or not 0.0 <= shape.symlink_ratio <= 1.0:
+            raise SyntheticDatasetException("Invalid dataset shape '%s'" % spec)
+        return shape
+
+
+@attr.s(auto_attribs=True)
+class SyntheticEntry(object):
+    # Relative path using '/' as separator
+    path: str
+    # 'file', 'dir' or 'symlink'
+    type: str
+    size: int = 0
+    # Seed the file content is generated from
+    content_seed: int = 0
+    symlink_target: Optional[str] = None
+
+
+def _dir_path(shape: DatasetShape, index: int) -> str:
+    # Directories are numbered level by level. The root is 0, its children are 1..fanout, and so on.
+    level = 0
+    while index >= shape.fanout ** level:
+        index -= shape.fanout ** level
+        level += 1
+    components = []
+    for _ in range(level):
+        components.append("d%d" % (index % shape.fanout))
+        index //= shape.fanout
+    return "/".join(reversed(components))
+
+
+def _join(dir: str, name: str) -> str:
+    return dir + "/" + name if dir != "" else name
+
+
+# Creates the directories of `dir` that weren't created yet, parents first
+def _missing_dirs(dir: str, created: Set[str]) -> Iterator[SyntheticEntry]:
+    missing = []
+    while dir != "" and dir not in created:
+        missing.append(dir)
+        dir = dir.rpartition('/')[0]
+    for path in reversed(missing):
+        created.add(path)
+        yield SyntheticEntry(path=path, type='dir')
+
+
+# Generates the entries of the dataset: the files and symlinks, each preceded by the directories it needs that weren't
+# generated yet. Entries are generated on the fly, so only the paths of the directories are kept in memory.
+def generate_entries(shape: DatasetShape) -> Iterator[SyntheticEntry]:
+    tree_size = shape.tree_size()
+    created_dirs: Set[str] = set()
+    rand = random.Random(shape.seed)
+    previous_file: Optional[str] = None
+    for index in range(shape.num_files):
+        dir = _dir_path(shape, rand.randrange(tree_size))
+        yield from _missing_dirs(dir, created_dirs)
+        path = _join(dir, "f%d" % index)
+        if rand.random() < shape.symlink_ratio:
+            # Point to the previous regular file, or to a nonexisting file if there is none
+            target = previous_file if previous_file is not None else "nonexisting"
+            yield SyntheticEntry(path=path, type='symlink', symlink_target=os.path.relpath(target, dir if dir != "" else "."))
+        else:
+            size = shape.sizes.sample(rand)
+            yield SyntheticEntry(path=path, type='file', size=size, content_seed=rand.getrandbits(64))
+            previous_file = path
+
+
+def content_block(content_seed: int, block_index: int, length: int) -> bytes:
+    return random.Random(content_seed * 1000003 + block_index).getrandbits(8 * length).to_bytes(length, 'little') if length > 0 else b''
+
+
+# Yields the content of a file in blocks of CONTENT_BLOCK_SIZE (the last block can be shorter)
+def generate_content(entry: SyntheticEntry) -> Iterator[bytes]:
+    for block_index in range((entry.size + CONTENT_BLOCK_SIZE - 1) // CONTENT_BLOCK_SIZE):
+        length = min(CONTENT_BLOCK_SIZE, entry.size - block_index * CONTENT_BLOCK_SIZE)
+        yield content_block(entry.content_seed, block_index, length)
+
+
+@attr.s(auto_attribs=True)
+class DatasetStats(object):
+    num_dirs: int = 0
+    num_files: int = 0
+    num_symlinks: int = 0
+    num_bytes: int = 0
+
+    def to_string(self) -> str:
+        return "%d directories, %d files, %d symlinks, %.1f MB" % (self.num_dirs, self.num_files, self.num_symlinks, self.num_bytes / 1024 / 1024)
+
+
+# Writes the dataset into `dest_dir` (e.g. a CryFS mount directory), streaming file contents without keeping them in memory.
+# Blocking, run it on an executor.
+def write_dataset(shape: DatasetShape, dest_dir: str, progress: Optional[Callable[[DatasetStats], None]] = None) -> DatasetStats:
+    stats = DatasetStats()
+    for entry in generate_entries(shape):
+        path = os.path.join(dest_dir, *entry.path.split('/'))
+        if entry.type == 'dir':
+            os.mkdir(path)
+            stats.num_dirs += 1
+        elif entry.type == 'symlink':
+            assert entry.symlink_target is not None
+            os.symlink(entry.symlink_target, path)
+            stats.num_symlinks += 1
+        else:
+            with open(path, 'wb') as file:
+                for block in generate_content(entry):
+                    file.write(block)
+            stats.num_files += 1
+            stats.num_bytes += entry.size
+            if progress is not None:
+                progress(stats)
+    return stats
+
+
+def _verify_file(entry: SyntheticEntry, path: str) -> Optional[str]:
+    with open(path, 'rb', buffering=0) as file:
+        offset = 0
+        for expected in generate_content(entry):
+            actual = file.read(len(expected))
+            # Raw reads can return less than requested, read until the block is complete or the file ends
+            while len(actual) < len(expected):
+                more = file.read(len(expected) - len(actual))
+                if not more:
+                    break
+                actual += more
+            if actual != expected:
+                return "File %s differs from expected content in block at offset %d" % (entry.path, offset)
+            offset += len(expected)
+        if file.read(1) != b'':
+            return "File %s is larger than expected (%d bytes)" % (entry.path, entry.size)
+    return None
+
+
+# Checks that `dir` contains exactly the dataset, regenerating the expected contents from the seed.
+# Returns a list of errors (at most MAX_REPORTED_ERRORS), empty if the directory matches. Blocking, run it on an executor.
+def verify_dataset(shape: DatasetShape, dir: str) -> List[str]:
+    errors: List[str] = []
+    num_expected = 0
+    for entry in generate_entries(shape):
+        if len(errors) >= MAX_REPORTED_ERRORS:
+            errors.append("Stopped after %d errors" % MAX_REPORTED_ERRORS)
+            return errors
+        num_expected += 1
+        path = os.path.join(dir, *entry.path.split('/'))
+        if entry.type == 'dir':
+            if not os.path.isdir(path) or os.path.islink(path):
+                errors.append("Expected directory %s" % entry.path)
+        elif entry.type == 'symlink':
+            if not os.path.islink(path):
+                errors.append("Expected symlink %s" % entry.path)
+            elif os.readlink(path) != entry.symlink_target:
+                errors.append("Symlink %s points to %s instead of %s" % (entry.path, os.readlink(path), entry.symlink_target))
+        else:
+            if not os.path.isfile(path) or os.path.islink(path):
+                errors.append("Expected file %s" % entry.path)
+            elif os.path.getsize(path) != entry.size:
+                errors.append("File %s has size %d instead of %d" % (entry.path, os.path.getsize(path), entry.size))
+            else:
+                error = _verify_file(entry, path)
+                if error is not None:
+                    errors.append(error)
+    # All expected entries exist, so if the number of entries matches, there are no unexpected ones
+    num_actual = sum(len(dirnames) + len(filenames) for _, dirnames, filenames in os.walk(dir))
+    if num_actual != num_expected:
+        errors.append("Expected %d entries in %s, found %d" % (num_expected, dir, num_actual))
+    return errors
@@ -1,34 +1,389 @@
-from typing import Optional
+from typing import Any, Callable, IO, Iterator, List, Optional, Tuple
 from types import TracebackType
-import tempfile
-from cryfs.e2etest.utils.async_subprocess import check_call_subprocess
+from contextlib import contextmanager
+import attr
+import io
+import os
+import shutil
+import stat
+import subprocess
+import tarfile
+import time
+from cryfs.e2etest.utils.executor import AsyncTemporaryDirectory, run_in_thread
+from cryfs.e2etest.utils.instrumented_fs import Fs
+from cryfs.e2etest.utils.resource_limits import get_resource_limits
+from cryfs.e2etest.utils.tar_index import TarIndex, TarIndexException, TarIndexEntry, check_entry, load_or_create_tar_index, path_filter
+from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.test_framework.metrics import Phase, TestMetrics, span
+
+
+# Size of the write() calls used to write extracted files. Changing it allows measuring CryFS under different I/O patterns.
+DEFAULT_WRITE_BLOCK_SIZE = 64 * 1024
+
+_XZ_MAGIC = b'\xfd7zXZ\x00'
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Compression formats for TarFile.pack()
+COMPRESSIONS = ['xz', 'zstd']
+
+
+class TarException(Exception):
+    def __init__(self, message: str) -> None:
+        self._message = message
+
+    def message(self) -> str:
+        return self._message
+
+
+@attr.s(auto_attribs=True)
+class TarStats(object):
+    num_members: int = 0
+    # Payload bytes of regular files
+    num_bytes: int = 0
+    duration: float = 0.0
+
+    def throughput(self) -> float:
+        # in bytes per second
+        if self.duration <= 0:
+            return float('inf')
+        return self.num_bytes / self.duration
+
+    def to_string(self) -> str:
+        return "%d entries, %d bytes in %.3fs (%.2f MB/s)" % (self.num_members, self.num_bytes, self.duration, self.throughput() / 1024 / 1024)
 
 
 class TarFile(object):
-    def __init__(self, tar_path: str) -> None:
+    # write_block_size: Size of the write() calls when extracting regular files.
+    # parallel_xz: Use the multi-threaded `xz` binary (if installed) instead of the single-threaded lzma module.
+    # progress: Called with the statistics so far after each extracted or packed entry.
+    def __init__(self, tar_path: str, write_block_size: int = DEFAULT_WRITE_BLOCK_SIZE, parallel_xz: bool = True,
+                 progress: Optional[Callable[[TarStats], None]] = None) -> None:
         self.tar_path = tar_path
+        self.write_block_size = write_block_size
+        self.parallel_xz = parallel_xz
+        self.progress = progress
+
+    # All operations on the extracted files go through `fs`, e.g. an InstrumentedFs to measure them
+    async def unpack(self, dest_path: str, fs: Optional[Fs] = None) -> TarStats:
+        async with get_resource_limits().extraction():
+            return await run_in_thread(self.unpack_blocking, dest_path, fs)
 
-    async def unpack(self, dest_path: str) -> None:
-        # Use --same-owner, but that needs sudo
-        await check_call_subprocess("tar", "--preserve-permissions", "--atime-preserve", "-C", dest_path, "-xvf", self.tar_path)
+    async def unpack_members(self, dest_path: str, paths: List[str], fs: Optional[Fs] = None) -> TarStats:
+        async with get_resource_limits().extraction():
+            return await run_in_thread(self.unpack_members_blocking, dest_path, paths, fs)
 
-    async def pack(self, source_path: str, compress: bool = False) -> None:
-        # Use --same-owner, but that needs sudo
-        if compress:
-            args = "-cJvf"
+    def is_compressed(self) -> bool:
+        with open(self.tar_path, 'rb') as file:
+            magic = file.read(len(_XZ_MAGIC))
+        return magic == _XZ_MAGIC or magic.startswith(_ZSTD_MAGIC) or magic.startswith(b'\x1f\x8b') or magic.startswith(b'BZh')
+
+    # Uncompressed tar files get an index of their members (see tar_index.py), so single members can be read
+    # without reading the tar file from the start. Returns None for compressed tar files.
+    def index(self) -> Optional[TarIndex]:
+        if self.is_compressed():
+            return None
+        try:
+            return load_or_create_tar_index(self.tar_path)
+        except TarIndexException:
+            return None
+
+    async def pack(self, source_path: str, compress: bool = False, compression: str = 'xz') -> TarStats:
+        return await run_in_thread(self.pack_blocking, source_path, compress, compression)
+
+    # Extracts the tar file like `tar --preserve-permissions --numeric-owner -xf` would, but streaming and without a subprocess.
+    # File owners are only restored when running as root.
+    def unpack_blocking(self, dest_path: str, fs: Optional[Fs] = None) -> TarStats:
+        _fs = fs if fs is not None else Fs()
+        stats = TarStats()
+        start = time.perf_counter()
+        directories: List[Tuple[tarfile.TarInfo, str]] = []
+        with self._open_for_reading() as tar:
+            for member in tar:
+                self._extract_member(member, lambda: tar.extractfile(member), dest_path, stats, directories, _fs)
+                self._report_progress(stats, start)
+        for member, target in reversed(directories):
+            _restore_attributes(member, target, _fs)
+        stats.duration = time.perf_counter() - start
+        return stats
+
+    # Extracts only the members at the given paths (relative to the root of the tar file), their parent directories and,
+    # for directories, everything below them. Uncompressed tar files are read through their index, so only the selected
+    # members are read. Compressed tar files are streamed.
+    def unpack_members_blocking(self, dest_path: str, paths: List[str], fs: Optional[Fs] = None) -> TarStats:
+        _fs = fs if fs is not None else Fs()
+        index = self.index()
+        if index is None:
+            return self._unpack_members_streaming(dest_path, paths, _fs)
+        stats = TarStats()
+        start = time.perf_counter()
+        directories: List[Tuple[tarfile.TarInfo, str]] = []
+        with open(self.tar_path, 'rb') as file:
+            for entry in index.select(paths):
+                self._extract_member(entry.to_tarinfo(), lambda: _open_indexed_member(file, self._hardlink_target(index, entry)),
+                                     dest_path, stats, directories, _fs)
+                self._report_progress(stats, start)
+        for member, target in reversed(directories):
+            _restore_attributes(member, target, _fs)
+        stats.duration = time.perf_counter() - start
+        return stats
+
+    def _unpack_members_streaming(self, dest_path: str, paths: List[str], fs: Fs) -> TarStats:
+        is_selected = path_filter(paths)
+        stats = TarStats()
+        start = time.perf_counter()
+        directories: List[Tuple[tarfile.TarInfo, str]] = []
+        with self._open_for_reading() as tar:
+            for member in tar:
+                if not is_selected(member.name):
+                    continue
+                # A streamed tar file can't go back to the file a hardlink points to
+                self._extract_member(member, lambda: tar.extractfile(member) if not member.islnk() else None, dest_path, stats, directories, fs)
+                self._report_progress(stats, start)
+        for member, target in reversed(directories):
+            _restore_attributes(member, target, fs)
+        stats.duration = time.perf_counter() - start
+        return stats
+
+    def _hardlink_target(self, index: TarIndex, entry: TarIndexEntry) -> TarIndexEntry:
+        if entry.type != 'hardlink':
+            return entry
+        target = index.find(entry.linkname)
+        if target is None or target.type != 'file':
+            raise TarException("Hardlink %s points to unknown file %s" % (entry.name, entry.linkname))
+        return target
+
+    # Extracts a single member. `open_source` returns the payload of regular files.
+    def _extract_member(self, member: tarfile.TarInfo, open_source: Callable[[], Optional[IO[bytes]]], dest_path: str,
+                        stats: TarStats, directories: List[Tuple[tarfile.TarInfo, str]], fs: Fs) -> None:
+        target = _target_path(dest_path, member.name)
+        if member.isdir():
+            fs.makedirs(target)
+            # Set directory attributes at the end, because extracting the directory contents modifies them
+            directories.append((member, target))
         else:
-            args = "-cvf"
-        await check_call_subprocess("tar", "--preserve-permissions", "--atime-preserve", args, self.tar_path, "-C", source_path, ".")
+            fs.makedirs(os.path.dirname(target))
+            _remove_existing(target, fs)
+            if member.isfile():
+                source = open_source()
+                assert source is not None
+                stats.num_bytes += self._write_file(source, target, member.mode, fs)
+                _restore_attributes(member, target, fs)
+            elif member.issym():
+                fs.symlink(member.linkname, target)
+                _restore_owner(member, target, fs)
+            elif member.islnk():
+                link_target = _target_path(dest_path, member.linkname)
+                if fs.lexists(link_target):
+                    fs.link(link_target, target)
+                else:
+                    # Only the hardlink was selected for extraction, not the file it links to
+                    source = open_source()
+                    if source is None:
+                        raise TarException("Can't extract hardlink %s without the file it points to from a compressed tar file" % member.name)
+                    stats.num_bytes += self._write_file(source, target, member.mode, fs)
+                    _restore_attributes(member, target, fs)
+            else:
+                raise TarException("Unsupported tar member type for %s" % member.name)
+        stats.num_members += 1
+
+    # Packs the directory contents like `tar --preserve-permissions --atime-preserve -cf` would.
+    # If compress is True, the tar file is compressed with `compression` (see COMPRESSIONS). zstd needs the `zstd` binary.
+    def pack_blocking(self, source_path: str, compress: bool = False, compression: str = 'xz') -> TarStats:
+        if compression not in COMPRESSIONS:
+            raise TarException("Unknown compression %s. Supported: %s" % (compression, ", ".join(COMPRESSIONS)))
+        stats = TarStats()
+        start = time.perf_counter()
+        with self._open_for_writing(compress, compression) as tar:
+            for path, arcname in _walk_sorted(source_path):
+                info = tar.gettarinfo(path, arcname)
+                if info.isfile():
+                    file_stat = os.stat(path)
+                    with open(path, 'rb') as file:
+                        tar.addfile(info, file)
+                    # Don't let reading the file modify its atime
+                    os.utime(path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+                    stats.num_bytes += info.size
+                else:
+                    tar.addfile(info)
+                stats.num_members += 1
+                self._report_progress(stats, start)
+        stats.duration = time.perf_counter() - start
+        return stats
+
+    def _report_progress(self, stats: TarStats, start: float) -> None:
+        if self.progress is not None:
+            stats.duration = time.perf_counter() - start
+            self.progress(stats)
+
+    def _write_file(self, source: IO[bytes], target: str, mode: int, fs: Fs) -> int:
+        num_bytes = 0
+        fd = fs.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            while True:
+                block = source.read(self.write_block_size)
+                if not block:
+                    break
+                view = memoryview(block)
+                while len(view) > 0:
+                    view = view[fs.write(fd, view):]
+                num_bytes += len(block)
+        finally:
+            fs.close(fd)
+        fs.chmod(target, mode)
+        return num_bytes
+
+    def _use_xz_binary(self) -> bool:
+        return self.parallel_xz and shutil.which("xz") is not None
+
+    @contextmanager
+    def _open_for_reading(self) -> Iterator[tarfile.TarFile]:
+        with open(self.tar_path, 'rb') as file:
+            magic = file.read(len(_XZ_MAGIC))
+        decompressor: Optional[List[str]] = None
+        if magic.startswith(_ZSTD_MAGIC):
+            # The tarfile module doesn't support zstd
+            if shutil.which("zstd") is None:
+                raise TarException("Reading %s needs the zstd binary, which isn't installed" % self.tar_path)
+            decompressor = ["zstd", "--decompress", "--stdout", "--quiet", self.tar_path]
+        elif magic == _XZ_MAGIC and self._use_xz_binary():
+            decompressor = ["xz", "--decompress", "--stdout", "--threads=0", self.tar_path]
+        if decompressor is not None:
+            with _compressor_process(decompressor, stdout=subprocess.PIPE) as process:
+                assert process.stdout is not None
+                with tarfile.open(fileobj=process.stdout, mode='r|') as tar:
+                    yield tar
+        else:
+            with tarfile.open(self.tar_path, mode='r|*') as tar:
+                yield tar
+
+    @contextmanager
+    def _open_for_writing(self, compress: bool, compression: str) -> Iterator[tarfile.TarFile]:
+        compressor: Optional[List[str]] = None
+        if compress and compression == 'zstd':
+            if shutil.which("zstd") is None:
+                raise TarException("Compressing with zstd needs the zstd binary, which isn't installed")
+            compressor = ["zstd", "--compress", "--stdout", "--quiet", "-19", "--threads=0"]
+        elif compress and self._use_xz_binary():
+            compressor = ["xz", "--compress", "--stdout", "--threads=0"]
+        if compressor is not None:
+            with open(self.tar_path, 'wb') as output:
+                with _compressor_process(compressor, stdin=subprocess.PIPE, stdout=output) as process:
+                    assert process.stdin is not None
+                    with tarfile.open(fileobj=process.stdin, mode='w|', format=tarfile.GNU_FORMAT) as tar:
+                        yield tar
+                    process.stdin.close()
+        else:
+            with tarfile.open(self.tar_path, mode='w|xz' if compress else 'w|', format=tarfile.GNU_FORMAT) as tar:
+                yield tar
+
+
+# Reads the payload of a member of an uncompressed tar file, seeking directly to it
+class _MemberReader(io.RawIOBase):
+    def __init__(self, file: IO[bytes], offset: int, size: int) -> None:
+        self._file = file
+        self._offset = offset
+        self._remaining = size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        length = min(len(buffer), self._remaining)
+        if length == 0:
+            return 0
+        self._file.seek(self._offset)
+        data = self._file.read(length)
+        if len(data) == 0:
+            raise TarException("Unexpected end of tar file")
+        buffer[:len(data)] = data
+        self._offset += len(data)
+        self._remaining -= len(data)
+        return len(data)
+
+
+def _open_indexed_member(file: IO[bytes], entry: TarIndexEntry) -> IO[bytes]:
+    try:
+        check_entry(file, entry)
+    except TarIndexException as e:
+        raise TarException(e.message())
+    return io.BufferedReader(_MemberReader(file, entry.offset_data, entry.size))
+
+
+# Runs xz or zstd, compressing or decompressing a stream
+@contextmanager
+def _compressor_process(args: List[str], stdin: Any = None, stdout: Any = None) -> Iterator['subprocess.Popen[bytes]']:
+    process = subprocess.Popen(args, stdin=stdin, stdout=stdout, stderr=subprocess.PIPE)
+    try:
+        yield process
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    if process.stdout is not None:
+        # tarfile doesn't necessarily read the padding at the end of the archive. Drain it so the process can exit.
+        process.stdout.read()
+        process.stdout.close()
+    assert process.stderr is not None
+    stderr = process.stderr.read()
+    if process.wait() != 0:
+        raise TarException("%s failed: %s" % (args[0], stderr.decode('UTF-8', errors='replace')))
+
+
+def _target_path(dest_path: str, name: str) -> str:
+    if os.path.isabs(name) or '..' in name.split('/'):
+        raise TarException("Refusing to extract tar member outside of the destination: %s" % name)
+    return os.path.normpath(os.path.join(dest_path, name))
+
+
+def _remove_existing(path: str, fs: Fs) -> None:
+    try:
+        if not stat.S_ISDIR(fs.stat(path).st_mode):
+            fs.unlink(path)
+    except FileNotFoundError:
+        # Doesn't exist, or a dangling symlink
+        if fs.lexists(path):
+            fs.unlink(path)
+
+
+def _restore_owner(member: tarfile.TarInfo, path: str, fs: Fs) -> None:
+    # Like tar, only restore owners when running as root. Like `tar --numeric-owner`, the numeric ids are used and not
+    # the user and group names, so the owners don't depend on the users of the host. dircomp expects the same.
+    if os.geteuid() != 0:
+        return
+    fs.lchown(path, member.uid, member.gid)
+
+
+def _restore_attributes(member: tarfile.TarInfo, path: str, fs: Fs) -> None:
+    _restore_owner(member, path, fs)
+    fs.chmod(path, member.mode)
+    mtime_ns = int(member.mtime * 10 ** 9)
+    fs.utime(path, (mtime_ns, mtime_ns))
+
+
+# Yields (path, name in archive) for the directory and everything in it, like `tar -C source_path .` would add them
+def _walk_sorted(source_path: str) -> Iterator[Tuple[str, str]]:
+    yield source_path, "."
+    for dirpath, dirnames, filenames in os.walk(source_path):
+        dirnames.sort()
+        for name in sorted(dirnames + filenames):
+            path = os.path.join(dirpath, name)
+            yield path, "./" + os.path.relpath(path, source_path)
 
 
 class TarUnpacker(object):
-    def __init__(self, tar_file: TarFile) -> None:
+    def __init__(self, tar_file: TarFile, logger: Optional[Logger] = None, metrics: Optional[TestMetrics] = None) -> None:
         self.tar_file = tar_file
+        self.logger = logger
+        self.metrics = metrics
 
     async def __aenter__(self) -> str:
-        self.tempdir = tempfile.TemporaryDirectory()
-        await self.tar_file.unpack(self.tempdir.name)
+        self.tempdir = AsyncTemporaryDirectory()
+        with span(self.metrics, Phase.FIXTURE_UNPACK):
+            stats = await self.tar_file.unpack(self.tempdir.name)
+        if self.logger is not None:
+            self.logger.log(LogLevel.INFO, "Unpacked %s: %s" % (self.tar_file.tar_path, stats.to_string()))
         return self.tempdir.name
 
     async def __aexit__(self, exc_type: Optional[type], exc: Optional[BaseException], tb: Optional[TracebackType]) -> None:
-        self.tempdir.cleanup()
+        with span(self.metrics, Phase.CLEANUP):
+            await self.tempdir.cleanup()
@@ -0,0 +1,189 @@
+from typing import Any, Callable, Dict, IO, List, Optional
+import attr
+import hashlib
+import json
+import os
+import tarfile
+from cryfs.e2etest.utils.paths import default_cache_dir, write_json_atomically
+
+
+TAR_INDEX_VERSION = 1
+_BLOCK_SIZE = tarfile.BLOCKSIZE
+
+
+class TarIndexException(Exception):
+    def __init__(self, message: str) -> None:
+        self._message = message
+
+    def message(self) -> str:
+        return self._message
+
+
+_TYPES = {tarfile.REGTYPE: 'file', tarfile.AREGTYPE: 'file', tarfile.DIRTYPE: 'dir', tarfile.SYMTYPE: 'symlink', tarfile.LNKTYPE: 'hardlink'}
+_TARFILE_TYPES = {'file': tarfile.REGTYPE, 'dir': tarfile.DIRTYPE, 'symlink': tarfile.SYMTYPE, 'hardlink': tarfile.LNKTYPE}
+
+
+@attr.s(auto_attribs=True)
+class TarIndexEntry(object):
+    # Name as stored in the tar file, e.g. "./dir/file"
+    name: str
+    # 'file', 'dir', 'symlink' or 'hardlink'
+    type: str
+    # Offset of the member's payload in the tar file
+    offset_data: int
+    size: int
+    mode: int
+    uid: int
+    gid: int
+    uname: str
+    gname: str
+    mtime: int
+    linkname: str = ''
+
+    # For the functions extracting members, which work on tarfile.TarInfo
+    def to_tarinfo(self) -> tarfile.TarInfo:
+        info = tarfile.TarInfo(self.name)
+        info.type = _TARFILE_TYPES[self.type]
+        info.size = self.size
+        info.mode = self.mode
+        info.uid = self.uid
+        info.gid = self.gid
+        info.uname = self.uname
+        info.gname = self.gname
+        info.mtime = self.mtime
+        info.linkname = self.linkname
+        info.offset_data = self.offset_data
+        return info
+
+    def to_json(self) -> Dict[str, Any]:
+        return attr.asdict(self)
+
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> 'TarIndexEntry':
+        return TarIndexEntry(**data)
+
+
+# Offsets of the members of an uncompressed tar file, so single members can be read without reading the archive from the start
+@attr.s(auto_attribs=True)
+class TarIndex(object):
+    # Size and modification time of the indexed tar file. The index is recreated if they change.
+    tar_size: int
+    tar_mtime_ns: int
+    entries: List[TarIndexEntry]
+
+    def __attrs_post_init__(self) -> None:
+        self._by_path = {normalize_name(entry.name): entry for entry in self.entries}
+
+    # Looks up a member by its path relative to the root of the tar file, e.g. "dir/file"
+    def find(self, path: str) -> Optional[TarIndexEntry]:
+        return self._by_path.get(normalize_name(path))
+
+    # The members at the given paths, their parent directories and, for directories, everything below them. In tar file order.
+    def select(self, paths: List[str]) -> List[TarIndexEntry]:
+        is_selected = path_filter(paths)
+        return [entry for entry in self.entries if is_selected(entry.name)]
+
+    def matches(self, tar_path: str) -> bool:
+        stat = os.stat(tar_path)
+        return stat.st_size == self.tar_size and stat.st_mtime_ns == self.tar_mtime_ns
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "version": TAR_INDEX_VERSION,
+            "tar_size": self.tar_size,
+            "tar_mtime_ns": self.tar_mtime_ns,
+            "entries": [entry.to_json() for entry in self.entries],
+        }
+
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> 'TarIndex':
+        if data.get("version") != TAR_INDEX_VERSION:
+            raise TarIndexException("Unsupported tar index version: %s" % data.get("version"))
+        return TarIndex(tar_size=data["tar_size"], tar_mtime_ns=data["tar_mtime_ns"],
+                        entries=[TarIndexEntry.from_json(entry) for entry in data["entries"]])
+
+    def save(self, path: str) -> None:
+        write_json_atomically(path, self.to_json())
+
+    @staticmethod
+    def load(path: str) -> 'TarIndex':
+        with open(path, 'r') as file:
+            return TarIndex.from_json(json.load(file))
+
+
+def normalize_name(name: str) -> str:
+    return '/'.join(part for part in name.split('/') if part not in ('', '.'))
+
+
+# Returns a function telling whether a member name is one of the given paths, one of their parent directories or below one of them.
+# Parent directories are selected so they get their attributes from the tar file, as if the whole tar file was extracted.
+def path_filter(paths: List[str]) -> Callable[[str], bool]:
+    prefixes = [normalize_name(path) for path in paths]
+    parents = {'/'.join(prefix.split('/')[:depth]) for prefix in prefixes for depth in range(prefix.count('/') + 1) if prefix != ''}
+
+    def is_selected(name: str) -> bool:
+        normalized = normalize_name(name)
+        return normalized in parents or any(prefix == '' or normalized == prefix or normalized.startswith(prefix + '/') for prefix in prefixes)
+    return is_selected
+
+
+# Reads the headers of an uncompressed tar file. tarfile seeks over the payloads, so this is fast even for large tar files.
+def create_tar_index(tar_path: str) -> TarIndex:
+    stat = os.stat(tar_path)
+    entries = []
+    try:
+        with tarfile.open(tar_path, mode='r:') as tar:
+            for member in tar:
+                if member.type not in _TYPES:
+                    raise TarIndexException("Unsupported tar member type for %s" % member.name)
+                entries.append(TarIndexEntry(name=member.name, type=_TYPES[member.type], offset_data=member.offset_data, size=member.size,
+                                             mode=member.mode, uid=member.uid, gid=member.gid, uname=member.uname, gname=member.gname,
+                                             mtime=int(member.mtime), linkname=member.linkname))
+    except tarfile.ReadError as e:
+        raise TarIndexException("Can't index %s, only uncompressed tar files can be indexed: %s" % (tar_path, str(e)))
+    return TarIndex(tar_size=stat.st_size, tar_mtime_ns=stat.st_mtime_ns, entries=entries)
+
+
+# Checks that the index still describes the tar file at this member, by comparing the member's header in the tar file.
+# This catches a tar file that was replaced while keeping its size and modification time.
+def check_entry(file: IO[bytes], entry: TarIndexEntry) -> None:
+    if entry.offset_data < _BLOCK_SIZE:
+        raise TarIndexException("Invalid offset %d for tar member %s" % (entry.offset_data, entry.name))
+    file.seek(entry.offset_data - _BLOCK_SIZE)
+    try:
+        header = tarfile.TarInfo.frombuf(file.read(_BLOCK_SIZE), tarfile.ENCODING, 'surrogateescape')
+    except tarfile.HeaderError as e:
+        raise TarIndexException("Tar index is out of date, no header for %s: %s" % (entry.name, str(e)))
+    if header.size != entry.size or int(header.mtime) != entry.mtime:
+        raise TarIndexException("Tar index is out of date, header for %s doesn't match" % entry.name)
+
+
+def tar_index_path_for(tar_path: str) -> str:
+    return tar_path + ".index.json"
+
+
+def _cached_tar_index_path_for(tar_path: str) -> str:
+    key = hashlib.sha256(os.path.abspath(tar_path).encode('UTF-8')).hexdigest()
+    return os.path.join(default_cache_dir(), "tar_indices", key + ".json")
+
+
+# Returns the index for an uncompressed tar file. Like manifests, an index next to the tar file (see cryfs-e2etest-create-tar-index)
+# or in the user cache dir is used if the tar file didn't change. Otherwise, the index is created and cached in the user cache dir.
+def load_or_create_tar_index(tar_path: str) -> TarIndex:
+    cached_path = _cached_tar_index_path_for(tar_path)
+    for candidate in [tar_index_path_for(tar_path), cached_path]:
+        if os.path.exists(candidate):
+            try:
+                index = TarIndex.load(candidate)
+            except (ValueError, KeyError, TypeError, TarIndexException):
+                continue
+            if index.matches(tar_path):
+                return index
+    index = create_tar_index(tar_path)
+    try:
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        index.save(cached_path)
+    except OSError:
+        # It is only a cache
+        pass
+    return index
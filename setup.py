@@ -59,8 +59,15 @@ setup(name='cryfs-e2etest',
       entry_points = {
         'console_scripts': [
           'cryfs-e2etest = cryfs.e2etest.__main__:main',
+          'cryfs-e2etest-bench = cryfs.e2etest.bench.__main__:main',
           'cryfs-e2etest-create-data-tar = cryfs.e2etest.create_fixture:create_data_tar',
           'cryfs-e2etest-create-encoded-tar = cryfs.e2etest.create_fixture:create_encoded_tar',
+          'cryfs-e2etest-create-encoded-tars = cryfs.e2etest.create_fixture:create_encoded_tars',
+          'cryfs-e2etest-create-manifest = cryfs.e2etest.create_fixture:create_manifest',
+          'cryfs-e2etest-create-tar-index = cryfs.e2etest.create_fixture:create_tar_index',
+          'cryfs-e2etest-merge-reports = cryfs.e2etest.merge_reports:merge_reports',
+          'cryfs-e2etest-create-synthetic-data = cryfs.e2etest.create_fixture:create_synthetic_data',
+          'cryfs-e2etest-verify-synthetic-data = cryfs.e2etest.create_fixture:verify_synthetic_data',
         ]
       },
       install_requires=dependencies,
@@ -0,0 +1,73 @@
+from typing import List, Optional
+from types import TracebackType
+import asyncio
+import tempfile
+from cryfs.e2etest.bench.baseline import metrics_from_bench_results
+from cryfs.e2etest.bench.cache import CacheVariant, format_cache_results, read_pass, run_cache_benchmark
+from cryfs.e2etest.fsmounter import IFsMounter
+from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.test_framework.metrics import TestMetrics
+from cryfs.e2etest.utils.synthetic import DatasetShape, write_dataset
+
+
+# Doesn't mount anything, the "mount directory" is the base directory itself
+class _FakeMounterContext(object):
+    def __init__(self, basedir: str) -> None:
+        self.basedir = basedir
+
+    async def __aenter__(self) -> str:
+        return self.basedir
+
+    async def __aexit__(self, exc_type: Optional[type], exc: Optional[BaseException], tb: Optional[TracebackType]) -> None:
+        pass
+
+
+class _FakeMounter(IFsMounter):
+    def __init__(self) -> None:
+        self.mounted: List[str] = []
+
+    def mount(self, basedir: str, password: bytes, logger: Optional[Logger] = None,  # type: ignore
+              metrics: Optional[TestMetrics] = None) -> _FakeMounterContext:
+        self.mounted.append(basedir)
+        return _FakeMounterContext(basedir)
+
+
+_SHAPE = DatasetShape.parse("files=30,depth=1,fanout=3,sizes=uniform:1K:200K,symlinks=0.1,seed=4")
+
+
+def test_parse_variant() -> None:
+    variant = CacheVariant.parse("small=--blocksize 4096 CRYFS_SOMETHING=1 '--opt=a b'")
+    assert variant == CacheVariant(name="small", extra_args=["--blocksize", "4096", "--opt=a b"], extra_env={"CRYFS_SOMETHING": "1"})
+    assert CacheVariant.parse("plain") == CacheVariant(name="plain")
+    try:
+        CacheVariant.parse("=--blocksize 4096")
+        assert False, "Expected exception"
+    except ValueError:
+        pass
+
+
+def test_read_pass() -> None:
+    with tempfile.TemporaryDirectory() as dir:
+        stats = write_dataset(_SHAPE, dir)
+        result = read_pass(dir, drop_kernel_cache=True)
+        assert result.num_files == stats.num_files
+        assert result.num_bytes == stats.num_bytes
+        assert result.ttfb.count == stats.num_files
+        assert 0 < result.first_byte <= result.duration
+
+
+def test_cycles() -> None:
+    mounter = _FakeMounter()
+    logger = Logger()
+    result = asyncio.new_event_loop().run_until_complete(
+        run_cache_benchmark(mounter, CacheVariant(name="default"), _SHAPE, cycles=3, drop_kernel_cache=False, logger=logger))
+    assert not logger.contains_entry_with_level(LogLevel.ERROR)
+    # One mount to write the dataset, then one per cycle
+    assert len(mounter.mounted) == 4
+    assert len(result.cycles) == 3
+    assert result.cycles[0].cold.num_bytes == result.cycles[0].warm.num_bytes > 0
+    assert result.summary()["speedup"] > 0
+    assert len(result.to_json()["cycles"]) == 3
+    metrics = metrics_from_bench_results({"results": result.bench_results()})
+    assert len(metrics["cache_cold_read_default.mb_per_s"].samples) == 3
+    assert "default" in format_cache_results([result])
@@ -0,0 +1,15 @@
+from cryfs.e2etest.bench.mount_profile import format_summary, summarize
+from cryfs.e2etest.utils.cryfs_log import MountProfile
+
+
+def test_summarize_counts_missing_phases_as_zero() -> None:
+    profiles = [
+        MountProfile(invocation=1.0, mount=1.1, unmount=0.2, phases={"config_load": 0.8, "upgrade": 0.1, "other": 0.1}),
+        MountProfile(invocation=0.9, mount=1.0, unmount=0.3, phases={"config_load": 0.8, "other": 0.1}),
+    ]
+    summary = summarize("fixture", profiles)
+    assert summary["cycles"] == 2
+    assert summary["mount"]["max"] == 1.1
+    assert summary["phases"]["upgrade"]["min"] == 0.0
+    assert summary["phases"]["upgrade"]["max"] == 0.1
+    assert "fixture" in format_summary([summary])
@@ -0,0 +1,92 @@
+import contextlib
+import io
+import os
+import tempfile
+from cryfs.e2etest.bench.baseline import BaselineStore, MAX_SAMPLES, Metric, check_and_save_baseline, metrics_from_json, select_baseline_version
+from cryfs.e2etest.bench.regression import compare_metric
+
+
+def test_compare_metric_detects_significant_slowdown() -> None:
+    comparison = compare_metric("seq.mb_per_s", True, [100.0, 101.0, 99.0, 100.5, 99.5], [80.0, 81.0, 79.0, 80.5, 79.5])
+    assert comparison is not None
+    assert comparison.significant
+    assert 19 < comparison.slowdown_percent < 21
+    assert comparison.is_regression(5.0)
+    assert not comparison.is_regression(25.0)
+
+
+def test_compare_metric_ignores_noise() -> None:
+    comparison = compare_metric("seq.mb_per_s", True, [100.0, 60.0, 140.0, 90.0, 110.0], [95.0, 55.0, 135.0, 85.0, 105.0])
+    assert comparison is not None
+    assert not comparison.significant
+    assert not comparison.is_regression(1.0)
+
+
+def test_compare_metric_speedup_is_no_regression() -> None:
+    comparison = compare_metric("test.duration", False, [10.0, 10.1, 9.9], [5.0, 5.1, 4.9])
+    assert comparison is not None
+    assert comparison.slowdown_percent < 0
+    assert not comparison.is_regression(5.0)
+
+
+def test_compare_metric_single_sample_against_prediction_interval() -> None:
+    comparison = compare_metric("test.duration", False, [10.0, 10.2, 9.8, 10.1, 9.9], [15.0])
+    assert comparison is not None
+    assert comparison.is_regression(5.0)
+
+
+def test_compare_metric_single_baseline_sample_is_never_significant() -> None:
+    comparison = compare_metric("test.duration", False, [10.0], [20.0])
+    assert comparison is not None
+    assert not comparison.enough_samples
+    assert not comparison.is_regression(5.0)
+
+
+def test_baseline_store_appends_and_limits_samples() -> None:
+    with tempfile.TemporaryDirectory() as dir:
+        store = BaselineStore(dir)
+        assert store.load("bench", "0.10.2") is None
+        store.save("bench", "0.10.2", {"a": Metric(higher_is_better=True, samples=[1.0, 2.0])})
+        store.save("bench", "0.10.2", {"a": Metric(higher_is_better=True, samples=[float(i) for i in range(MAX_SAMPLES)])})
+        loaded = store.load("bench", "0.10.2")
+        assert loaded is not None
+        assert loaded["a"].higher_is_better
+        assert loaded["a"].samples == [float(i) for i in range(MAX_SAMPLES)]
+
+
+def test_select_baseline_version_prefers_other_versions() -> None:
+    with tempfile.TemporaryDirectory() as dir:
+        store = BaselineStore(dir)
+        assert select_baseline_version(store, "bench", "0.11.0", None) is None
+        store.save("bench", "0.11.0", {"a": Metric(higher_is_better=True, samples=[1.0])})
+        assert select_baseline_version(store, "bench", "0.11.0", None) == "0.11.0"
+        path = store.save("bench", "0.10.2", {"a": Metric(higher_is_better=True, samples=[1.0])})
+        assert select_baseline_version(store, "bench", "0.11.0", None) == "0.10.2"
+        assert select_baseline_version(store, "bench", "0.11.0", "0.9.0") == "0.9.0"
+        assert os.path.exists(path)
+
+
+def test_metrics_from_json() -> None:
+    bench = metrics_from_json({"cryfs_executable": "cryfs", "results": [
+        {"name": "seq", "bytes": 10, "mb_per_s": 1.0, "ops_per_s": 2.0, "latency": {"p99": 0.1}},
+        {"name": "seq", "bytes": 10, "mb_per_s": 3.0, "ops_per_s": 4.0, "latency": {"p99": 0.2}},
+    ]})
+    assert bench["seq.mb_per_s"].samples == [1.0, 3.0]
+    assert not bench["seq.latency_p99"].higher_is_better
+    report = metrics_from_json({"results": [
+        {"name": "ok", "status": "SUCCESS", "metrics": {"duration": 2.0, "phases": {"mount": 1.0, "workload": 0.0}}},
+        {"name": "failed", "status": "ERROR", "metrics": {"duration": 2.0, "phases": {}}},
+    ]})
+    assert sorted(report.keys()) == ["ok.duration", "ok.mount"]
+
+
+def test_check_and_save_baseline_keeps_stdout_clean() -> None:
+    # stdout is where cryfs-e2etest-bench writes the JSON results
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    metrics = {"read.mb_per_s": Metric(higher_is_better=True, samples=[100.0, 101.0, 99.0])}
+    with tempfile.TemporaryDirectory() as baseline_dir, contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        check_and_save_baseline(baseline_dir, "bench", "0.11", metrics, compare=True, save=True, requested_version=None, threshold_percent=5.0)
+        check_and_save_baseline(baseline_dir, "bench", "0.11", metrics, compare=True, save=False, requested_version=None, threshold_percent=5.0)
+    assert stdout.getvalue() == ""
+    assert "Performance compared to baseline" in stderr.getvalue()
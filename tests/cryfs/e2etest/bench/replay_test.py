@@ -0,0 +1,52 @@
+import os
+import tempfile
+from cryfs.e2etest.bench.replay import replay_trace
+from cryfs.e2etest.utils.fs_trace import TraceEvent, instrumented_copytree, load_trace
+
+
+def _record_trace(tempdir: str) -> str:
+    source = os.path.join(tempdir, "source")
+    os.makedirs(os.path.join(source, "dir"))
+    for i in range(5):
+        with open(os.path.join(source, "dir", "file%d" % i), 'wb') as file:
+            file.write(os.urandom(1000 * i))
+    os.symlink("dir/file1", os.path.join(source, "link"))
+    trace_path = os.path.join(tempdir, "copy.trace.jsonl")
+    os.mkdir(os.path.join(tempdir, "recorded"))
+    instrumented_copytree(source, os.path.join(tempdir, "recorded", "contents"), trace_path)
+    return trace_path
+
+
+def test_fast_replay_in_parallel() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        events = load_trace(_record_trace(tempdir))
+        replay_dir = os.path.join(tempdir, "replay")
+        os.mkdir(replay_dir)
+        result = replay_trace(events, replay_dir, "copy", mode='fast', parallel=3)
+        assert result.errors == []
+        assert result.num_ops == 3 * len(events)
+        assert result.num_bytes == 3 * sum(1000 * i for i in range(5))
+        assert result.latency().count == result.num_ops
+        for copy in range(3):
+            contents = os.path.join(replay_dir, "copy%d" % copy, "contents")
+            assert sorted(os.listdir(os.path.join(contents, "dir"))) == ["file%d" % i for i in range(5)]
+            assert os.path.getsize(os.path.join(contents, "dir", "file4")) == 4000
+            assert os.readlink(os.path.join(contents, "link")) == "dir/file1"
+        assert result.to_json()["ops_per_s"] > 0
+
+
+def test_timed_replay_keeps_timing() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        events = [TraceEvent(op="mkdir", path="a", mode=0o755), TraceEvent(op="stat", path="a", time=0.2)]
+        result = replay_trace(events, tempdir, "timed", mode='timed')
+        assert result.errors == []
+        assert result.duration >= 0.2
+
+
+def test_reports_mismatches() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        events = [TraceEvent(op="stat", path="missing"), TraceEvent(op="unlink", path="missing", error="ENOENT"),
+                  TraceEvent(op="mkdir", path="a", error="EEXIST"), TraceEvent(op="close", handle=5)]
+        result = replay_trace(events, tempdir, "broken")
+        assert result.num_errors == 3
+        assert "ENOENT" in result.errors[0]
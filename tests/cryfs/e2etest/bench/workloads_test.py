@@ -0,0 +1,46 @@
+import tempfile
+from cryfs.e2etest.bench.workloads import Metadata, RandomReadWrite, Readdir, SequentialReadWrite
+from cryfs.e2etest.utils.sizes import parse_size
+
+
+def test_sequential() -> None:
+    with tempfile.TemporaryDirectory() as dir:
+        write, read = SequentialReadWrite(file_size=parse_size("100K"), block_size=parse_size("16K")).run(dir)
+        assert write.num_bytes == read.num_bytes == 100 * 1024
+        assert read.num_ops == 7
+        assert write.to_json()["name"] == "sequential_write_100K"
+        # The writes, the fsync, and open and close, all in the size bucket of the whole file
+        assert {(entry["op"], entry["size"]): entry["latency"]["count"] for entry in write.to_json()["fs_ops"]} == {
+            ("open", "64K-1M"): 1, ("write", "64K-1M"): 7, ("fsync", "64K-1M"): 1, ("close", "64K-1M"): 1}
+        assert write.latency().count == 10
+
+
+def test_random() -> None:
+    with tempfile.TemporaryDirectory() as dir:
+        write, read = RandomReadWrite(file_size=parse_size("1M"), num_ops=10).run(dir)
+        assert read.num_ops == 10
+        assert read.num_bytes == 10 * 4096
+
+
+def test_random_file_smaller_than_block() -> None:
+    with tempfile.TemporaryDirectory() as dir:
+        write, read = RandomReadWrite(file_size=1000, num_ops=10).run(dir)
+        # 10 writes and the fsync
+        assert write.num_ops == 11
+        assert write.num_bytes == read.num_bytes == 10 * 1000
+
+
+def test_metadata_and_readdir() -> None:
+    with tempfile.TemporaryDirectory() as dir:
+        results = Metadata(num_files=10).run(dir)
+        assert [result.num_ops for result in results] == [10, 10, 10]
+    with tempfile.TemporaryDirectory() as dir:
+        readdir, = Readdir(num_entries=10, repetitions=3).run(dir)
+        assert readdir.num_ops == 3
+
+
+def test_parse_size() -> None:
+    assert parse_size("4096") == 4096
+    assert parse_size("4K") == 4096
+    assert parse_size("1.5M") == 1536 * 1024
+    assert parse_size("2GiB") == 2 * 1024 ** 3
@@ -0,0 +1,21 @@
+import os
+import tempfile
+from cryfs.e2etest.compatibility_test import load_fixtures
+from cryfs.e2etest.utils.fixture_registry import FixtureRegistry, RegistryEntry
+
+
+def test_default_registry_names_fixtures_relative_to_package() -> None:
+    fixtures = load_fixtures()
+    assert fixtures[0].name() == "fixtures/scrypt_data.tar : fixtures/scrypt_cryfs0.9.6_encoded.tar"
+    assert all(os.path.exists(tar_file) for tar_file in fixtures[0].tar_files())
+
+
+def test_registry_entries_are_relative_to_registry() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        registry_dir = os.path.join(tempdir, "registry")
+        os.mkdir(registry_dir)
+        registry_path = os.path.join(registry_dir, "registry.json")
+        FixtureRegistry(entries=[RegistryEntry(data="../data/a_data.tar", encoded="a_cryfs1_encoded.tar", password="pw")]).save(registry_path)
+        fixture, = load_fixtures(registry_path)
+        assert fixture.tar_files() == [os.path.join(tempdir, "data", "a_data.tar"), os.path.join(registry_dir, "a_cryfs1_encoded.tar")]
+        assert fixture.password() == b"pw"
@@ -0,0 +1,95 @@
+from typing import Dict, List, Optional, Tuple
+from types import TracebackType
+import asyncio
+import json
+import os
+import re
+from cryfs.e2etest.fsmounter import IFsMounter
+from cryfs.e2etest.matrix_test import MatrixTests, MatrixVersion
+from cryfs.e2etest.readwrite_test import Fixture
+from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.test_framework.metrics import TestMetrics
+
+
+# Doesn't mount anything, the "mount directory" is a directory in the base directory. Like CryFS, it keeps the file owners
+# in the base directory instead of relying on the owners of the files there, which clone_tree() doesn't preserve.
+class _FakeMounterContext(object):
+    def __init__(self, basedir: str) -> None:
+        self.mountdir = os.path.join(basedir, "contents")
+        self.owners_file = os.path.join(basedir, "owners.json")
+
+    async def __aenter__(self) -> str:
+        if os.path.exists(self.owners_file):
+            with open(self.owners_file, 'r') as file:
+                for path, (uid, gid) in json.load(file).items():
+                    os.lchown(os.path.join(self.mountdir, path), uid, gid)
+        else:
+            os.mkdir(self.mountdir)
+        return self.mountdir
+
+    async def __aexit__(self, exc_type: Optional[type], exc: Optional[BaseException], tb: Optional[TracebackType]) -> None:
+        owners: Dict[str, Tuple[int, int]] = {}
+        for dirpath, dirnames, filenames in os.walk(self.mountdir):
+            for name in dirnames + filenames:
+                path = os.path.join(dirpath, name)
+                node_stat = os.lstat(path)
+                owners[os.path.relpath(path, self.mountdir)] = (node_stat.st_uid, node_stat.st_gid)
+        with open(self.owners_file, 'w') as file:
+            json.dump(owners, file)
+
+
+class _FakeMounter(IFsMounter):
+    def __init__(self) -> None:
+        self.mounted: List[str] = []
+
+    def mount(self, basedir: str, password: bytes, logger: Optional[Logger] = None,  # type: ignore
+              metrics: Optional[TestMetrics] = None) -> _FakeMounterContext:
+        self.mounted.append(basedir)
+        return _FakeMounterContext(basedir)
+
+
+def test_each_version_writes_once_and_is_read_by_itself_and_newer_versions() -> None:
+    mounters = [_FakeMounter() for _ in range(3)]
+    versions = [MatrixVersion(label="v%d" % index, executable="/bin/false", mounter=mounter) for index, mounter in enumerate(mounters)]
+    suite = MatrixTests(versions, data_fixtures=[Fixture(data="fixtures/scrypt_data.tar")])
+    cases = suite.test_cases()
+    assert sorted(case.name() for case in cases) == sorted("MatrixTest: %s -> %s: fixtures/scrypt_data.tar" % (writer, reader) for writer, reader in [
+        ("v0", "v0"), ("v0", "v1"), ("v0", "v2"), ("v1", "v1"), ("v1", "v2"), ("v2", "v2")])
+    # The first test case of each writer is scheduled first
+    assert [case.name().split(':')[1] for case in cases[:3]] == [" v0 -> v0", " v1 -> v1", " v2 -> v2"]
+
+    loggers = [Logger() for _ in cases]
+
+    async def run_all() -> None:
+        await asyncio.gather(*[case.run(logger, TestMetrics()) for case, logger in zip(cases, loggers)])
+    event_loop = asyncio.new_event_loop()
+    try:
+        event_loop.run_until_complete(run_all())
+    finally:
+        event_loop.close()
+    for logger in loggers:
+        assert not logger.contains_entry_with_level(LogLevel.ERROR)
+        assert not logger.contains_entry_with_level(LogLevel.FATAL)
+        # Every reader compared the whole fixture
+        assert any(re.match(r"Verified [1-9]\d* files", entry["message"]) for entry in logger.to_json()["entries"])
+    # v0 mounts once to write and once to read its own file system, v2 writes once and reads three file systems
+    assert [len(mounter.mounted) for mounter in mounters] == [2, 3, 4]
+
+
+def test_cleanup_removes_file_systems_of_readers_that_did_not_run() -> None:
+    mounters = [_FakeMounter() for _ in range(2)]
+    versions = [MatrixVersion(label="v%d" % index, executable="/bin/false", mounter=mounter) for index, mounter in enumerate(mounters)]
+    suite = MatrixTests(versions, data_fixtures=[Fixture(data="fixtures/scrypt_data.tar")])
+    cases = suite.test_cases()
+    # Only "v0 -> v0" runs, "v0 -> v1" is skipped (e.g. by --incremental)
+    assert cases[0].name().endswith("v0 -> v0: fixtures/scrypt_data.tar")
+    assert cases[0].group() == cases[2].group() != cases[1].group()
+    event_loop = asyncio.new_event_loop()
+    try:
+        event_loop.run_until_complete(cases[0].run(Logger(), TestMetrics()))
+        written_basedir = mounters[0].mounted[0]
+        assert os.path.isdir(written_basedir)
+        event_loop.run_until_complete(suite.cleanup())
+    finally:
+        event_loop.close()
+    assert not os.path.exists(written_basedir)
@@ -0,0 +1,55 @@
+import os
+import tempfile
+from cryfs.e2etest.test_framework import dircomp
+from cryfs.e2etest.test_framework.dircomp import expect_dir_equals
+from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+
+
+def _create_tree(root: str, file_content: bytes) -> None:
+    os.mkdir(os.path.join(root, "subdir"))
+    with open(os.path.join(root, "subdir", "file"), 'wb') as file:
+        file.write(file_content)
+    os.symlink("subdir/file", os.path.join(root, "link"))
+
+
+def test_equal_dirs() -> None:
+    with tempfile.TemporaryDirectory() as dir1, tempfile.TemporaryDirectory() as dir2:
+        _create_tree(dir1, b"content" * 1000)
+        _create_tree(dir2, b"content" * 1000)
+        logger = Logger()
+        expect_dir_equals(dir1, dir2, logger)
+        assert not logger.contains_entry_with_level(LogLevel.ERROR)
+
+
+def test_different_file_content_in_later_chunk() -> None:
+    old_chunk_size = dircomp.CHUNK_SIZE
+    dircomp.CHUNK_SIZE = 16
+    try:
+        with tempfile.TemporaryDirectory() as dir1, tempfile.TemporaryDirectory() as dir2:
+            _create_tree(dir1, b"a" * 100)
+            _create_tree(dir2, b"a" * 99 + b"b")
+            logger = Logger()
+            expect_dir_equals(dir1, dir2, logger)
+            assert logger.contains_entry_with_level(LogLevel.ERROR)
+            assert "File contents differ" in logger.to_string()
+    finally:
+        dircomp.CHUNK_SIZE = old_chunk_size
+
+
+def test_different_file_size() -> None:
+    with tempfile.TemporaryDirectory() as dir1, tempfile.TemporaryDirectory() as dir2:
+        _create_tree(dir1, b"short")
+        _create_tree(dir2, b"longer")
+        logger = Logger()
+        expect_dir_equals(dir1, dir2, logger)
+        assert "Attributes different" in logger.to_string()
+
+
+def test_different_entries() -> None:
+    with tempfile.TemporaryDirectory() as dir1, tempfile.TemporaryDirectory() as dir2:
+        _create_tree(dir1, b"content")
+        _create_tree(dir2, b"content")
+        os.mkdir(os.path.join(dir2, "additional"))
+        logger = Logger()
+        expect_dir_equals(dir1, dir2, logger)
+        assert "Different directory entries" in logger.to_string()
@@ -0,0 +1,78 @@
+import json
+from cryfs.e2etest.test_framework.limits import DaemonLimits
+from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.test_framework.metrics import Phase, TestMetrics
+from cryfs.e2etest.test_framework.result import TestResult, TestResults, TestStatus
+from cryfs.e2etest.utils.proc import ProcessUsage
+from cryfs.e2etest.utils.storage import StorageReport
+
+
+def test_spans_are_summed_per_phase() -> None:
+    metrics = TestMetrics()
+    metrics.add_span(Phase.MOUNT, start=0.0, duration=1.0)
+    metrics.add_span(Phase.MOUNT, start=0.0, duration=2.0)
+    with metrics.span(Phase.COMPARISON):
+        pass
+    assert metrics.phase_duration(Phase.MOUNT) == 3.0
+    assert metrics.phase_duration(Phase.UNMOUNT) == 0.0
+    assert len(metrics.spans) == 3
+    assert metrics.to_json()["phases"]["mount"] == 3.0
+
+
+def test_results_to_json() -> None:
+    logger = Logger()
+    metrics = TestMetrics()
+    metrics.duration = 5.0
+    metrics.add_span(Phase.WORKLOAD, start=0.0, duration=4.0)
+    results = TestResults([TestResult(test_case_name="mytest", log=logger, metrics=metrics)])
+    exported = results.to_json()
+    assert exported["status"] == "SUCCESS"
+    assert exported["results"][0]["name"] == "mytest"
+    assert exported["results"][0]["metrics"]["duration"] == 5.0
+    assert exported["results"][0]["metrics"]["phases"]["workload"] == 4.0
+
+
+def test_daemon_usage_and_limits() -> None:
+    metrics = TestMetrics()
+    assert metrics.daemon_usage() is None
+    assert DaemonLimits(max_peak_rss_bytes=1).check(metrics) == []
+    metrics.add_daemon_usage(ProcessUsage(peak_rss_bytes=100 * 1024 * 1024, user_time=1.0, system_time=0.5, write_bytes=10))
+    metrics.add_daemon_usage(ProcessUsage(peak_rss_bytes=200 * 1024 * 1024, user_time=2.0, write_bytes=20))
+    usage = metrics.daemon_usage()
+    assert usage is not None
+    assert usage.peak_rss_bytes == 200 * 1024 * 1024
+    assert usage.cpu_time() == 3.5
+    assert usage.write_bytes == 30
+    assert DaemonLimits(max_peak_rss_bytes=256 * 1024 * 1024, max_cpu_time=10.0).check(metrics) == []
+    assert len(DaemonLimits(max_peak_rss_bytes=128 * 1024 * 1024).check(metrics)) == 1
+    assert len(DaemonLimits(max_peak_rss_bytes=128 * 1024 * 1024, max_cpu_time=1.0).check(metrics)) == 2
+    assert len(metrics.to_json()["daemon"]) == 2
+
+
+def test_results_json_roundtrip() -> None:
+    logger = Logger(max_entries=2)
+    logger.log(LogLevel.ERROR, "first")
+    logger.log(LogLevel.INFO, "second")
+    logger.log(LogLevel.INFO, "third")
+    logger.log(LogLevel.INFO, "fourth")
+    metrics = TestMetrics()
+    metrics.duration = 3.0
+    metrics.add_span(Phase.MOUNT, start=0.0, duration=1.0)
+    metrics.add_daemon_usage(ProcessUsage(peak_rss_bytes=1024, user_time=0.5))
+    metrics.storage = StorageReport(num_blocks=2, plaintext_bytes=1000, block_size_histogram={32832: 2})
+    metrics.throughput["ops_per_sec.2workers"] = 150.0
+    metrics.fs_ops.record("write", "0-4K", 0.002)
+    exported = TestResults([TestResult(test_case_name="mytest", log=logger, metrics=metrics)]).to_json()
+    restored = TestResults.from_json(json.loads(json.dumps(exported)))
+    result = restored.results()[0]
+    assert result.test_case_name == "mytest"
+    # An INFO entry was dropped from memory, the ERROR entry is kept
+    assert result.status() == TestStatus.ERROR
+    assert "omitted" in result.log.to_string()
+    assert "[ERROR] first" in result.log.to_string()
+    assert result.metrics.phase_duration(Phase.MOUNT) == 1.0
+    assert result.metrics.daemon_usages[0].peak_rss_bytes == 1024
+    assert result.metrics.storage is not None and result.metrics.storage.block_size_histogram == {32832: 2}
+    assert result.metrics.throughput == {"ops_per_sec.2workers": 150.0}
+    assert result.metrics.fs_ops.histograms[("write", "0-4K")].count == 1
+    assert restored.to_json() == exported
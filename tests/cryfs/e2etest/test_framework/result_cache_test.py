@@ -0,0 +1,85 @@
+from typing import Any, Coroutine, List, TypeVar
+import asyncio
+import os
+import tempfile
+from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.test_framework.metrics import TestMetrics
+from cryfs.e2etest.test_framework.result import TestResult
+from cryfs.e2etest.test_framework.result_cache import ResultCache
+from cryfs.e2etest.test_framework.test_case import ITestCase
+
+
+class _DummyTestCase(ITestCase):
+    def __init__(self, name: str, input_files: List[str]) -> None:
+        self._name = name
+        self._input_files = input_files
+
+    async def run(self, logger: Logger, metrics: TestMetrics) -> None:
+        pass
+
+    def name(self) -> str:
+        return self._name
+
+    def input_files(self) -> List[str]:
+        return self._input_files
+
+
+T = TypeVar('T')
+
+
+def _run(coroutine: Coroutine[Any, Any, T]) -> T:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _result(name: str, level: LogLevel = LogLevel.INFO) -> TestResult:
+    logger = Logger()
+    logger.log(level, "message")
+    return TestResult(test_case_name=name, log=logger)
+
+
+def test_cached_result_depends_on_inputs() -> None:
+    with tempfile.TemporaryDirectory() as dir:
+        fixture = os.path.join(dir, "fixture.tar")
+        with open(fixture, 'wb') as file:
+            file.write(b"version 1")
+        case = _DummyTestCase("test", [fixture])
+        cache = ResultCache(os.path.join(dir, "cache"), cryfs_key="0.10.2")
+        assert _run(cache.lookup(case)) is None
+        _run(cache.store(case, _result("test")))
+        cached = _run(cache.lookup(case))
+        assert cached is not None
+        assert cached.cached
+        assert cached.test_case_name == "test"
+
+        # Other CryFS version, other test case name
+        assert _run(ResultCache(os.path.join(dir, "cache"), cryfs_key="0.10.3").lookup(case)) is None
+        assert _run(cache.lookup(_DummyTestCase("other", [fixture]))) is None
+
+        # Changed fixture
+        with open(fixture, 'wb') as file:
+            file.write(b"version 2, longer")
+        assert _run(cache.lookup(case)) is None
+
+
+def test_failed_results_are_not_cached() -> None:
+    with tempfile.TemporaryDirectory() as dir:
+        case = _DummyTestCase("test", [])
+        cache = ResultCache(dir, cryfs_key="0.10.2")
+        _run(cache.store(case, _result("test", LogLevel.ERROR)))
+        assert _run(cache.lookup(case)) is None
+
+
+def test_file_hashes_are_persisted() -> None:
+    with tempfile.TemporaryDirectory() as dir:
+        fixture = os.path.join(dir, "fixture.tar")
+        with open(fixture, 'wb') as file:
+            file.write(b"data")
+        case = _DummyTestCase("test", [fixture])
+        cache = ResultCache(os.path.join(dir, "cache"), cryfs_key="0.10.2")
+        key = _run(cache.key(case))
+        cache.save()
+        assert _run(ResultCache(os.path.join(dir, "cache"), cryfs_key="0.10.2").key(case)) == key
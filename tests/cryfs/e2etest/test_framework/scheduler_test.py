@@ -0,0 +1,97 @@
+import asyncio
+from typing import List, Optional
+from cryfs.e2etest.test_framework.logger import Logger
+from cryfs.e2etest.test_framework.metrics import TestMetrics
+from cryfs.e2etest.test_framework.result import TestResult
+from cryfs.e2etest.test_framework.scheduler import DurationHistory, TestScheduler, parse_shard, partition
+from cryfs.e2etest.test_framework.test_case import ITestCase
+
+
+class _DummyTestCase(ITestCase):
+    def __init__(self, name: str, group: Optional[str] = None) -> None:
+        self._name = name
+        self._group = group
+
+    async def run(self, logger: Logger, metrics: TestMetrics) -> None:
+        pass
+
+    def name(self) -> str:
+        return self._name
+
+    def group(self) -> Optional[str]:
+        return self._group
+
+
+def test_order_longest_first_and_unknown_first() -> None:
+    history = DurationHistory()
+    history.record("short", 1.0)
+    history.record("long", 10.0)
+    cases: List[ITestCase] = [_DummyTestCase("short"), _DummyTestCase("long"), _DummyTestCase("unknown")]
+    ordered = TestScheduler(jobs=1, history=history).order(cases)
+    assert [case.name() for case in ordered] == ["unknown", "long", "short"]
+
+
+def test_run_returns_results_in_input_order() -> None:
+    history = DurationHistory()
+    history.record("a", 1.0)
+    history.record("b", 2.0)
+    cases: List[ITestCase] = [_DummyTestCase("a"), _DummyTestCase("b")]
+    started: List[str] = []
+
+    async def run_case(case: ITestCase) -> TestResult:
+        started.append(case.name())
+        return TestResult(test_case_name=case.name(), log=Logger())
+
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(TestScheduler(jobs=1, history=history).run(cases, run_case))
+    finally:
+        loop.close()
+    assert started == ["b", "a"]
+    assert [result.test_case_name for result in results] == ["a", "b"]
+    assert history.expected_duration("a") is not None
+
+
+def test_partition_balances_durations_and_covers_all_cases() -> None:
+    history = DurationHistory()
+    for name, duration in [("a", 10.0), ("b", 6.0), ("c", 5.0), ("d", 4.0), ("e", 1.0)]:
+        history.record(name, duration)
+    cases: List[ITestCase] = [_DummyTestCase(name) for name in ["e", "d", "c", "b", "a", "new"]]
+    shards = partition(cases, 2, history)
+    names = [[case.name() for case in shard] for shard in shards]
+    assert sorted(name for shard in names for name in shard) == ["a", "b", "c", "d", "e", "new"]
+    # "new" counts with the average duration of 5.2s
+    loads = [sum(history.expected_duration(name) or 5.2 for name in shard) for shard in names]
+    assert abs(loads[0] - loads[1]) <= 1.0
+    # Deterministic, and keeps the input order within a shard
+    assert names == [[case.name() for case in shard] for shard in partition(cases, 2, history)]
+    for shard in names:
+        assert shard == [name for name in ["e", "d", "c", "b", "a", "new"] if name in shard]
+
+
+def test_partition_keeps_groups_together() -> None:
+    history = DurationHistory()
+    cases: List[ITestCase] = [_DummyTestCase("%s%d" % (group, index), group=group) for group in ["a", "b"] for index in range(3)]
+    cases += [_DummyTestCase("single1"), _DummyTestCase("single2")]
+    shards = [[case.name() for case in shard] for shard in partition(cases, 3, history)]
+    assert sorted(name for shard in shards for name in shard) == sorted(case.name() for case in cases)
+    for group in ["a", "b"]:
+        assert len([shard for shard in shards if any(name.startswith(group) for name in shard)]) == 1
+    assert ["a0", "a1", "a2"] in shards and ["b0", "b1", "b2"] in shards
+
+
+def test_partition_with_more_shards_than_cases() -> None:
+    cases: List[ITestCase] = [_DummyTestCase("a")]
+    shards = partition(cases, 3, DurationHistory())
+    assert [len(shard) for shard in shards] == [1, 0, 0]
+
+
+def test_parse_shard() -> None:
+    assert parse_shard("1/4") == (0, 4)
+    assert parse_shard("4/4") == (3, 4)
+    for invalid in ["0/4", "5/4", "1", "a/b"]:
+        try:
+            parse_shard(invalid)
+            assert False, "Expected ValueError for %s" % invalid
+        except ValueError:
+            pass
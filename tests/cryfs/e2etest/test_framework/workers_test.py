@@ -0,0 +1,7 @@
+from cryfs.e2etest.test_framework.workers import strip_options
+
+
+def test_strip_options() -> None:
+    argv = ["--cryfs-executable", "/usr/bin/cryfs", "--workers", "4", "--jobs=8", "--json-report", "out.json",
+            "--save-baseline", "--baseline-dir=baselines", "--slowest", "5"]
+    assert strip_options(argv) == ["--cryfs-executable", "/usr/bin/cryfs", "--slowest", "5"]
@@ -0,0 +1,86 @@
+from typing import List, Tuple
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+from cryfs.e2etest.utils.async_subprocess import check_call_subprocess
+from cryfs.e2etest.utils.cryfs_log import mount_phases, parse_log_lines, profile_mount, timestamped_output_lines
+
+
+def _timestamp(seconds: float) -> str:
+    return datetime.datetime.fromtimestamp(seconds).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+def _write_log(start: float, lines: str) -> str:
+    file = tempfile.NamedTemporaryFile(mode='w', suffix='.log', delete=False)
+    with file:
+        for line in lines.splitlines():
+            offset, message = line.split(' ', 1)
+            file.write("[%s] %s\n" % (_timestamp(start + float(offset)), message))
+    return file.name
+
+
+# What CryFS 0.10 prints when mounting an existing file system with CRYFS_FRONTEND=noninteractive, as (seconds after start, output)
+# chunks. Reconstructed from the CryFS sources (Cli.cpp, CryPasswordBasedKeyProvider.cpp).
+_CRYFS_0_10_OUTPUT = [
+    (0.01, b"CryFS Version 0.10.2\n\n"),
+    (0.02, b"Password: Deriving encryption key (this can take some time)..."),
+    (0.80, b"done\n"),
+    (1.10, b"\nMounting filesystem. To unmount, call:\n$ cryfs-unmount \"/tmp/mountdir\"\n\n"),
+]
+
+
+def test_parse_log_lines_skips_lines_without_timestamp() -> None:
+    with tempfile.NamedTemporaryFile(mode='w') as file:
+        file.write("[2020-01-02 03:04:05.678] [cryfs] [info] Filesystem started.\ncontinuation\n")
+        file.flush()
+        lines = list(parse_log_lines(file.name))
+    assert len(lines) == 1
+    assert lines[0].message == "[cryfs] [info] Filesystem started."
+    assert lines[0].timestamp == datetime.datetime(2020, 1, 2, 3, 4, 5, 678000).timestamp()
+
+
+def test_timestamped_output_lines() -> None:
+    lines = timestamped_output_lines([(1.0, b"Deriving encryption key (this can take some time)..."), (2.0, b"done\nMount"), (3.0, b"ing")])
+    assert [(line.timestamp, line.message) for line in lines] == [(2.0, "Deriving encryption key (this can take some time)...done"), (3.0, "Mounting")]
+
+
+def test_profile_mount() -> None:
+    start = 1600000000.0
+    # The daemon only writes this line to the log file
+    path = _write_log(start, "1.25 [cryfs] [info] Filesystem started.\n"
+                             "5.0 [cryfs] [info] Filesystem stopped.")
+    try:
+        phases = profile_mount(path, [(start + offset, data) for offset, data in _CRYFS_0_10_OUTPUT], start, start + 1.2)
+    finally:
+        os.remove(path)
+    assert abs(phases["config_load"] - 0.8) < 0.01
+    assert abs(phases["filesystem_setup"] - 0.3) < 0.01
+    assert abs(phases["other"] - 0.1) < 0.01
+    assert abs(phases["fuse_init"] - 0.05) < 0.01
+
+
+def test_mount_phases_of_cryfs_0_9() -> None:
+    lines = timestamped_output_lines([(10.5, b"Loading config file (this can take some time)...done\n"),
+                                      (11.0, b"\nMounting filesystem. To unmount, call:\n$ fusermount -u \"/tmp/mountdir\"\n\n")])
+    assert mount_phases(lines, 10.0, 11.5) == {"config_load": 0.5, "filesystem_setup": 0.5, "other": 0.5}
+
+
+def test_output_chunks_are_timestamped_on_arrival() -> None:
+    script = "printf 'Deriving encryption key (this can take some time)...'; sleep 0.3; echo done"
+    chunks: List[Tuple[float, bytes]] = []
+    loop = asyncio.new_event_loop()
+    try:
+        start = time.time()
+        output = loop.run_until_complete(check_call_subprocess("sh", "-c", script, input=b"password\n", output_chunks=chunks))
+    finally:
+        loop.close()
+    assert output.stdout == b"Deriving encryption key (this can take some time)...done\n"
+    phases = mount_phases(timestamped_output_lines(chunks), start, time.time())
+    assert phases["config_load"] >= 0.3
+
+
+def test_mount_phases_missing_milestones_count_towards_next_phase() -> None:
+    phases = mount_phases([], 10.0, 12.0)
+    assert phases == {"other": 2.0}
@@ -0,0 +1,31 @@
+import asyncio
+import os
+from cryfs.e2etest.utils.executor import AsyncTemporaryDirectory, BlockingExecutor
+
+
+def test_process_pool_runs_picklable_functions() -> None:
+    executor = BlockingExecutor(kind='process', max_workers=2)
+    event_loop = asyncio.new_event_loop()
+    try:
+        pid = event_loop.run_until_complete(executor.run(os.getpid))
+        thread_pid = event_loop.run_until_complete(executor.run_in_thread(os.getpid))
+    finally:
+        event_loop.close()
+        executor.shutdown()
+    assert pid != os.getpid()
+    assert thread_pid == os.getpid()
+
+
+def test_temporary_directory_is_removed() -> None:
+    async def run() -> str:
+        async with AsyncTemporaryDirectory() as tempdir:
+            os.makedirs(os.path.join(tempdir, "dir", "subdir"))
+            with open(os.path.join(tempdir, "dir", "file"), 'w') as file:
+                file.write("content")
+        return tempdir
+    event_loop = asyncio.new_event_loop()
+    try:
+        tempdir = event_loop.run_until_complete(run())
+    finally:
+        event_loop.close()
+    assert not os.path.exists(tempdir)
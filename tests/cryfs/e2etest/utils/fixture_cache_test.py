@@ -0,0 +1,137 @@
+import asyncio
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+from typing import Dict, List, Optional
+from cryfs.e2etest.test_framework.dircomp import expect_dir_matches_manifest
+from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.utils.fixture_cache import FixtureCache
+from cryfs.e2etest.utils.instrumented_fs import Fs, copytree
+from cryfs.e2etest.utils.manifest import create_manifest
+from cryfs.e2etest.utils.tar import TarFile, TarStats
+
+
+class _CountingTarFile(TarFile):
+    def __init__(self, tar_path: str) -> None:
+        super(_CountingTarFile, self).__init__(tar_path)
+        self.num_unpacks = 0
+
+    async def unpack(self, dest_path: str, fs: Optional[Fs] = None) -> TarStats:
+        self.num_unpacks += 1
+        return await super(_CountingTarFile, self).unpack(dest_path, fs)
+
+
+def _create_tar(tar_path: str) -> None:
+    with tempfile.TemporaryDirectory() as source:
+        with open(os.path.join(source, "file"), 'w') as file:
+            file.write("content")
+        with tarfile.open(tar_path, 'w') as tar:
+            tar.add(source, arcname='.')
+
+
+def test_concurrent_users_share_one_extraction() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        tar_file = _CountingTarFile(os.path.join(tempdir, "data.tar"))
+        _create_tar(tar_file.tar_path)
+        cache = FixtureCache()
+        paths: List[str] = []
+
+        async def use() -> None:
+            async with cache.unpack(tar_file) as path:
+                assert os.path.exists(os.path.join(path, "file"))
+                paths.append(path)
+                await asyncio.sleep(0.01)
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(asyncio.gather(use(), use(), use()))
+        finally:
+            loop.close()
+        assert tar_file.num_unpacks == 1
+        assert len(set(paths)) == 1
+        assert not os.path.exists(paths[0])
+
+
+def test_persistent_cache_survives_and_invalidates() -> None:
+    with tempfile.TemporaryDirectory() as tempdir, tempfile.TemporaryDirectory() as cachedir:
+        tar_file = _CountingTarFile(os.path.join(tempdir, "data.tar"))
+        _create_tar(tar_file.tar_path)
+
+        async def use(cache: FixtureCache) -> str:
+            async with cache.unpack(tar_file) as path:
+                return path
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            path = loop.run_until_complete(use(FixtureCache(persistent_dir=cachedir)))
+            loop.run_until_complete(use(FixtureCache(persistent_dir=cachedir)))
+            assert tar_file.num_unpacks == 1
+            assert os.path.exists(os.path.join(path, "file"))
+
+            os.utime(tar_file.tar_path, (0, 0))
+            loop.run_until_complete(use(FixtureCache(persistent_dir=cachedir)))
+            assert tar_file.num_unpacks == 2
+        finally:
+            loop.close()
+
+
+
+# Uses the fixture in a new process and prints the number of files in it
+_USE_IN_PROCESS = """
+import asyncio, os, sys
+from cryfs.e2etest.utils.fixture_cache import FixtureCache
+from cryfs.e2etest.utils.tar import TarFile
+
+async def use() -> None:
+    async with FixtureCache(persistent_dir=sys.argv[2]).unpack(TarFile(sys.argv[1])) as path:
+        print(len(os.listdir(path)))
+asyncio.get_event_loop().run_until_complete(use())
+"""
+
+
+def test_processes_share_persistent_cache() -> None:
+    with tempfile.TemporaryDirectory() as tempdir, tempfile.TemporaryDirectory() as cachedir:
+        tar_path = os.path.join(tempdir, "data.tar")
+        with tempfile.TemporaryDirectory() as source:
+            for i in range(200):
+                with open(os.path.join(source, "file%d" % i), 'wb') as file:
+                    file.write(os.urandom(10000))
+            with tarfile.open(tar_path, 'w') as tar:
+                tar.add(source, arcname='.')
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        processes = [subprocess.Popen([sys.executable, "-c", _USE_IN_PROCESS, tar_path, cachedir], stdout=subprocess.PIPE, env=env)
+                     for _ in range(4)]
+        outputs = [process.communicate(timeout=60)[0] for process in processes]
+        assert [process.returncode for process in processes] == [0] * 4
+        assert outputs == [b"200\n"] * 4
+
+
+def test_copy_of_cached_fixture_has_modes_from_tar() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        tar_path = os.path.join(tempdir, "data.tar")
+        _create_tar(tar_path)
+        manifest = create_manifest(tar_path)
+        cache = FixtureCache()
+
+        async def copy(dest: str, modes: Optional[Dict[str, int]]) -> None:
+            async with cache.unpack(TarFile(tar_path)) as path:
+                copytree(path, dest, Fs(), modes)
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(copy(os.path.join(tempdir, "with_modes"), manifest.modes()))
+            loop.run_until_complete(copy(os.path.join(tempdir, "without_modes"), None))
+        finally:
+            loop.close()
+        logger = Logger()
+        expect_dir_matches_manifest(manifest, os.path.join(tempdir, "with_modes"), logger, compare_modes=True)
+        assert not logger.contains_entry_with_level(LogLevel.ERROR)
+        # The cache directory is read-only, which a plain copy carries over
+        logger = Logger()
+        expect_dir_matches_manifest(manifest, os.path.join(tempdir, "without_modes"), logger, compare_modes=True)
+        assert "Modes different" in logger.to_string()
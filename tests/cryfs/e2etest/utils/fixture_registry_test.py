@@ -0,0 +1,54 @@
+import os
+import tempfile
+from cryfs.e2etest.utils.fixture_registry import FixtureRegistry, RegistryEntry, default_registry_path, encoded_tar_name
+from cryfs.e2etest.utils.manifest import file_sha256
+
+
+def test_encoded_tar_name() -> None:
+    assert encoded_tar_name("fixtures/scrypt_data.tar", "0.9.9") == "scrypt_cryfs0.9.9_encoded.tar"
+    assert encoded_tar_name("/tmp/mydata.tar.xz", "0.10.2", "zstd") == "mydata_cryfs0.10.2_encoded.tar.zst"
+    assert encoded_tar_name("constructed_data.tar", "0.10-m2+194.gb0077e7a", "xz") == "constructed_cryfs0.10-m2+194.gb0077e7a_encoded.tar.xz"
+
+
+def test_upsert_replaces_entry_for_same_encoded_tar() -> None:
+    registry = FixtureRegistry()
+    registry.upsert(RegistryEntry(data="a_data.tar", encoded="a_cryfs1_encoded.tar", password="pw"))
+    registry.upsert(RegistryEntry(data="b_data.tar", encoded="b_cryfs1_encoded.tar", password="pw"))
+    registry.upsert(RegistryEntry(data="a_data.tar", encoded="a_cryfs1_encoded.tar", password="pw", data_sha256="1234"))
+    assert [entry.encoded for entry in registry.entries] == ["a_cryfs1_encoded.tar", "b_cryfs1_encoded.tar"]
+    entry = registry.find("a_cryfs1_encoded.tar")
+    assert entry is not None and entry.data_sha256 == "1234"
+    assert registry.find("c_cryfs1_encoded.tar") is None
+
+
+def test_save_and_load() -> None:
+    registry = FixtureRegistry(entries=[
+        RegistryEntry(data="a_data.tar", encoded="a_cryfs1_encoded.tar", password="pw", cryfs_version="1", data_sha256="12", cryfs_sha256="34"),
+        RegistryEntry(data="a_data.tar", encoded="a_cryfs2_encoded.tar", password="pw"),
+    ])
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "registry.json")
+        registry.save(path)
+        assert FixtureRegistry.load(path) == registry
+
+
+def test_checked_in_registry_lists_existing_data_tars() -> None:
+    registry = FixtureRegistry.load(default_registry_path())
+    assert len(registry.entries) > 0
+    fixtures_dir = os.path.dirname(default_registry_path())
+    for entry in registry.entries:
+        assert os.path.exists(os.path.join(fixtures_dir, entry.data))
+        # Otherwise, cryfs-e2etest-create-encoded-tars can't tell that the encoded tar file is up to date
+        assert entry.data_sha256 == file_sha256(os.path.join(fixtures_dir, entry.data))
+
+
+def test_is_up_to_date() -> None:
+    wanted = RegistryEntry(data="a_data.tar", encoded="a_cryfs1_encoded.tar", password="pw", cryfs_version="1", data_sha256="12", cryfs_sha256="34")
+    assert wanted.is_up_to_date(wanted)
+    assert not RegistryEntry(data="a_data.tar", encoded="a_cryfs1_encoded.tar", password="pw", cryfs_version="1", data_sha256="12",
+                             cryfs_sha256="56").is_up_to_date(wanted)
+    assert not RegistryEntry(data="a_data.tar", encoded="a_cryfs1_encoded.tar", password="pw", cryfs_version="1", data_sha256="78",
+                             cryfs_sha256="34").is_up_to_date(wanted)
+    # Created before executable hashes were recorded
+    assert RegistryEntry(data="a_data.tar", encoded="a_cryfs1_encoded.tar", password="pw", cryfs_version="1", data_sha256="12").is_up_to_date(wanted)
+    assert not RegistryEntry(data="a_data.tar", encoded="a_cryfs1_encoded.tar", password="pw", cryfs_version="1").is_up_to_date(wanted)
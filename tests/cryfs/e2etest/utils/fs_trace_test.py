@@ -0,0 +1,75 @@
+import io
+import json
+import os
+import tempfile
+from cryfs.e2etest.utils.fs_trace import TraceEvent, TraceException, TracingFs, instrumented_copytree, load_trace, set_trace_dir, trace_path_for
+
+
+def _create_tree(root: str) -> None:
+    os.makedirs(os.path.join(root, "dir"))
+    with open(os.path.join(root, "dir", "file"), 'wb') as file:
+        file.write(b"x" * 3000)
+    os.symlink("dir/file", os.path.join(root, "link"))
+
+
+def test_event_json_only_has_non_defaults() -> None:
+    event = TraceEvent(op="write", time=1.5, handle=3, size=4096)
+    assert event.to_json() == {"op": "write", "time": 1.5, "handle": 3, "size": 4096}
+    assert TraceEvent.from_json(event.to_json()) == event
+
+
+def test_records_copytree() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        source = os.path.join(tempdir, "source")
+        _create_tree(source)
+        trace_path = os.path.join(tempdir, "traces", "copy.trace.jsonl")
+        stats = instrumented_copytree(source, os.path.join(tempdir, "dest"), trace_path)
+        events = load_trace(trace_path)
+        assert [event.op for event in events if event.op not in ("chmod", "utime")] == ["mkdir", "mkdir", "open", "write", "close", "symlink"]
+        open_event = [event for event in events if event.op == "open"][0]
+        write_event = [event for event in events if event.op == "write"][0]
+        assert open_event.path == os.path.join("dest", "dir", "file")
+        assert write_event.handle == open_event.handle
+        assert write_event.size == 3000
+        assert [event.target for event in events if event.op == "symlink"] == ["dir/file"]
+        assert all(later.time >= earlier.time for earlier, later in zip(events, events[1:]))
+        # Tracing doesn't stop the measurements
+        assert stats.histograms[("write", "0-4K")].count == 1
+
+
+def test_records_failures_and_skips_paths_outside_root() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        root = os.path.join(tempdir, "root")
+        os.mkdir(root)
+        file = io.StringIO()
+        fs = TracingFs(root, file)
+        assert not fs.lexists(os.path.join(root, "missing"))
+        fs.mkdir(os.path.join(tempdir, "outside"))
+        fd = fs.open(os.path.join(tempdir, "outside", "file"), os.O_WRONLY | os.O_CREAT)
+        fs.write(fd, b"data")
+        fs.close(fd)
+        lines = file.getvalue().splitlines()
+        assert json.loads(lines[0])["format"] == "cryfs-e2etest-trace"
+        events = [TraceEvent.from_json(json.loads(line)) for line in lines[1:]]
+        assert [(event.op, event.path, event.error) for event in events] == [("stat", "missing", "ENOENT")]
+
+
+def test_load_rejects_other_files() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "file")
+        with open(path, 'w') as file:
+            file.write('{"something": "else"}\n')
+        try:
+            load_trace(path)
+            assert False, "Expected exception"
+        except TraceException:
+            pass
+
+
+def test_trace_path_for() -> None:
+    try:
+        assert trace_path_for("ReadWriteTest.copy_and_read: fixtures/data.tar") is None
+        set_trace_dir("/traces")
+        assert trace_path_for("ReadWriteTest.copy_and_read: fixtures/data.tar") == "/traces/ReadWriteTest.copy_and_read_fixtures_data.tar.trace.jsonl"
+    finally:
+        set_trace_dir(None)
@@ -0,0 +1,50 @@
+import json
+import math
+import random
+from typing import List
+from cryfs.e2etest.utils.histogram import LatencyHistogram
+
+
+# Exact percentile by nearest rank, like LatencyHistogram.percentile() without the buckets
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    return sorted_values[max(1, int(math.ceil(len(sorted_values) * percentile / 100))) - 1]
+
+
+def test_percentiles_within_bucket_precision() -> None:
+    rand = random.Random(1)
+    values = [rand.lognormvariate(-9, 1.5) for _ in range(10000)]
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+    exact = sorted(values)
+    for p in [50, 90, 99, 99.9]:
+        assert abs(histogram.percentile(p) - _percentile(exact, p)) <= 0.02 * _percentile(exact, p)
+    assert histogram.count == 10000
+    assert histogram.percentile(100) == histogram.max / 1e9
+
+
+def test_small_values_are_exact() -> None:
+    histogram = LatencyHistogram()
+    for value in [3, 5, 100]:
+        histogram.record_ns(value)
+    assert histogram.percentile(0) == 3e-9
+    assert histogram.percentile(50) == 5e-9
+    assert histogram.percentile(100) == 100e-9
+
+
+def test_merge_and_json_roundtrip() -> None:
+    first = LatencyHistogram()
+    second = LatencyHistogram()
+    for i in range(1000):
+        first.record(i * 1e-6)
+        second.record(i * 1e-3)
+    merged = LatencyHistogram()
+    merged.merge(first)
+    merged.merge(second)
+    assert merged.count == 2000
+    assert merged.min == 0
+    assert merged.max == second.max
+    restored = LatencyHistogram.from_json(json.loads(json.dumps(merged.to_json())))
+    assert restored.to_json() == merged.to_json()
+    assert restored.percentile(99) == merged.percentile(99)
+    assert LatencyHistogram().summary() == {}
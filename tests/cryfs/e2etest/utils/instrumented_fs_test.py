@@ -0,0 +1,82 @@
+import os
+import tarfile
+import tempfile
+from cryfs.e2etest.test_framework.dircomp import expect_dir_equals
+from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.utils.fs_trace import instrumented_copytree
+from cryfs.e2etest.utils.instrumented_fs import FsOpStats, InstrumentedFs, copytree, size_bucket
+from cryfs.e2etest.utils.tar import TarFile
+
+
+def _create_tree(root: str) -> None:
+    os.makedirs(os.path.join(root, "dir", "subdir"))
+    with open(os.path.join(root, "small"), 'wb') as file:
+        file.write(b"x" * 100)
+    with open(os.path.join(root, "dir", "large"), 'wb') as file:
+        file.write(os.urandom(200 * 1024))
+    os.symlink("small", os.path.join(root, "link"))
+
+
+def test_size_buckets() -> None:
+    assert size_bucket(0) == "0-4K"
+    assert size_bucket(4096) == "0-4K"
+    assert size_bucket(4097) == "4K-64K"
+    assert size_bucket(100 * 1024 * 1024) == ">16M"
+
+
+def test_copytree_records_operations() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        source = os.path.join(tempdir, "source")
+        _create_tree(source)
+        dest = os.path.join(tempdir, "dest")
+        stats = instrumented_copytree(source, dest)
+        logger = Logger()
+        expect_dir_equals(source, dest, logger)
+        assert not logger.contains_entry_with_level(LogLevel.ERROR)
+        assert os.readlink(os.path.join(dest, "link")) == "small"
+        assert stats.histograms[("open", "0-4K")].count == 1
+        assert stats.histograms[("write", "64K-1M")].count == 1
+        assert stats.histograms[("close", "64K-1M")].count == 1
+        assert stats.histograms[("mkdir", "-")].count == 3
+        assert stats.histograms[("symlink", "-")].count == 1
+        assert "write" in stats.to_string()
+
+
+def test_metadata_operations() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        fs = InstrumentedFs()
+        path = os.path.join(tempdir, "file")
+        fd = fs.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+        fs.write(fd, b"data")
+        fs.fsync(fd)
+        fs.close(fd)
+        assert fs.stat(path).st_size == 4
+        fs.rename(path, path + "2")
+        assert fs.listdir(tempdir) == ["file2"]
+        fs.unlink(path + "2")
+        assert sorted(fs.stats.histograms.keys()) == sorted([
+            ("open", "0-4K"), ("write", "0-4K"), ("fsync", "0-4K"), ("close", "0-4K"), ("stat", "0-4K"),
+            ("rename", "-"), ("readdir", "-"), ("unlink", "-")])
+        assert FsOpStats.from_json(fs.stats.to_json()).to_json() == fs.stats.to_json()
+
+
+def test_untar_through_instrumented_fs() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        source = os.path.join(tempdir, "source")
+        _create_tree(source)
+        tar_path = os.path.join(tempdir, "data.tar")
+        with tarfile.open(tar_path, 'w') as tar:
+            tar.add(source, arcname='.')
+        dest = os.path.join(tempdir, "dest")
+        os.mkdir(dest)
+        fs = InstrumentedFs()
+        TarFile(tar_path).unpack_blocking(dest, fs)
+        logger = Logger()
+        expect_dir_equals(source, dest, logger)
+        assert not logger.contains_entry_with_level(LogLevel.ERROR)
+        assert fs.stats.histograms[("write", "64K-1M")].count == 200 // 64 + 1
+        assert fs.stats.histograms[("setattr", "-")].count > 0
+
+        copy = os.path.join(tempdir, "copy")
+        copytree(dest, copy, InstrumentedFs(fs.stats))
+        assert fs.stats.histograms[("write", "64K-1M")].count == 200 // 64 + 2
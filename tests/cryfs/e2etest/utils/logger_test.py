@@ -1,3 +1,5 @@
+import os
+import tempfile
 from cryfs.e2etest.test_framework.logger import Logger, LogLevel
 
 
@@ -6,3 +8,46 @@ def test_logger() -> None:
     logger.log(LogLevel.INFO, "Message 1")
     logger.log(LogLevel.ERROR, "Message 2")
     assert logger.to_string() == "[INFO] Message 1\n[ERROR] Message 2\n"
+
+
+def test_logger_keeps_counts_when_entries_are_dropped() -> None:
+    logger = Logger(max_entries=2)
+    logger.log(LogLevel.INFO, "Message 1")
+    logger.log(LogLevel.INFO, "Message 2")
+    logger.log(LogLevel.INFO, "Message 3")
+    assert logger.count_entries_with_level(LogLevel.INFO) == 3
+    assert logger.to_string() == "[... 1 earlier entries omitted]\n[INFO] Message 2\n[INFO] Message 3\n"
+
+
+def test_logger_never_drops_warnings_and_errors() -> None:
+    logger = Logger(max_entries=2)
+    logger.log(LogLevel.INFO, "Message 1")
+    logger.log(LogLevel.ERROR, "Message 2")
+    for i in range(3, 6):
+        logger.log(LogLevel.INFO, "Message %d" % i)
+    logger.log(LogLevel.WARNING, "Message 6")
+    logger.log(LogLevel.INFO, "Message 7")
+    assert logger.to_string() == "[... 3 earlier entries omitted]\n[ERROR] Message 2\n[INFO] Message 5\n[WARNING] Message 6\n[INFO] Message 7\n"
+    assert Logger.from_json(logger.to_json()).to_string() == logger.to_string()
+
+
+def test_logger_streams_large_payloads_to_file() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        log_file = os.path.join(tempdir, "test.log")
+        payload_file = os.path.join(tempdir, "payload")
+        with open(payload_file, 'w') as file:
+            file.write("x" * 100)
+        logger = Logger(log_file=log_file, max_payload_size=10)
+        logger.log(LogLevel.INFO, "Message 1")
+        logger.log_file_contents(LogLevel.INFO, "Payload", payload_file)
+        logger.close()
+        assert "x" * 100 not in logger.to_string()
+        with open(log_file, 'r') as file:
+            content = file.read()
+        assert "[INFO] Message 1\n" in content
+        assert "x" * 100 in content
+        # Logging after close() appends to the file again
+        logger.log(LogLevel.INFO, "Message 2")
+        logger.close()
+        with open(log_file, 'r') as file:
+            assert file.read() == content + "[INFO] Message 2\n"
@@ -0,0 +1,26 @@
+import asyncio
+import time
+from cryfs.e2etest.utils.loop_lag import LoopLag, LoopLagMonitor
+
+
+def test_measures_blocked_event_loop() -> None:
+    async def run() -> LoopLag:
+        monitor = LoopLagMonitor(interval=0.005)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        start = time.perf_counter()
+        # Blocks the event loop
+        time.sleep(0.1)
+        await asyncio.sleep(0.05)
+        end = time.perf_counter()
+        await monitor.stop()
+        assert monitor.lag_between(end + 1, end + 2) == LoopLag()
+        return monitor.lag_between(start, end)
+    event_loop = asyncio.new_event_loop()
+    try:
+        lag = event_loop.run_until_complete(run())
+    finally:
+        event_loop.close()
+    assert lag.max_lag >= 0.09
+    assert lag.total_lag >= 0.09
+    assert lag.num_samples > 1
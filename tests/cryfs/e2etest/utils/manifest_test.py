@@ -0,0 +1,86 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import shutil
+import tarfile
+import tempfile
+from cryfs.e2etest.test_framework.dircomp import expect_dir_matches_manifest
+from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.utils.manifest import Manifest, create_manifest, load_or_create_manifest, manifest_path_for
+
+
+def _create_tar(tar_path: str) -> None:
+    with tempfile.TemporaryDirectory() as source:
+        os.mkdir(os.path.join(source, "dir"))
+        with open(os.path.join(source, "dir", "file"), 'wb') as file:
+            file.write(b"file content")
+        os.symlink("dir/file", os.path.join(source, "link"))
+        with tarfile.open(tar_path, 'w') as tar:
+            tar.add(source, arcname='.')
+
+
+def test_manifest_entries() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        tar_path = os.path.join(tempdir, "data.tar")
+        _create_tar(tar_path)
+        manifest = create_manifest(tar_path)
+        entries = {entry.path: entry for entry in manifest.entries}
+        assert sorted(entries.keys()) == ['', 'dir', 'dir/file', 'link']
+        assert entries['dir/file'].type == 'file'
+        assert entries['dir/file'].size == len(b"file content")
+        assert entries['link'].symlink_target == "dir/file"
+        assert manifest.total_file_size() == len(b"file content")
+        assert Manifest.from_json(manifest.to_json()) == manifest
+
+
+def test_extracted_tar_matches_manifest() -> None:
+    with tempfile.TemporaryDirectory() as tempdir, tempfile.TemporaryDirectory() as extracted:
+        tar_path = os.path.join(tempdir, "data.tar")
+        _create_tar(tar_path)
+        manifest = create_manifest(tar_path)
+        with tarfile.open(tar_path, 'r') as tar:
+            tar.extractall(extracted)
+
+        logger = Logger()
+        expect_dir_matches_manifest(manifest, extracted, logger)
+        assert not logger.contains_entry_with_level(LogLevel.ERROR)
+
+        with open(os.path.join(extracted, "dir", "file"), 'wb') as file:
+            file.write(b"file CONTENT")
+        logger = Logger()
+        expect_dir_matches_manifest(manifest, extracted, logger)
+        assert "File contents differ" in logger.to_string()
+
+
+def test_concurrent_saves() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        tar_path = os.path.join(tempdir, "data.tar")
+        _create_tar(tar_path)
+        manifest = create_manifest(tar_path)
+        manifest_path = os.path.join(tempdir, "data.tar.manifest.json")
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for _ in executor.map(lambda _: manifest.save(manifest_path), range(32)):
+                pass
+        assert Manifest.load(manifest_path) == manifest
+        assert sorted(os.listdir(tempdir)) == ["data.tar", "data.tar.manifest.json"]
+
+
+def test_created_manifest_is_cached_outside_the_fixture_directory() -> None:
+    with tempfile.TemporaryDirectory() as fixtures, tempfile.TemporaryDirectory() as cache_home:
+        tar_path = os.path.join(fixtures, "data.tar")
+        _create_tar(tar_path)
+        previous = os.environ.get("XDG_CACHE_HOME")
+        os.environ["XDG_CACHE_HOME"] = cache_home
+        try:
+            manifest = load_or_create_manifest(tar_path)
+            assert os.listdir(fixtures) == ["data.tar"]
+            assert os.listdir(os.path.join(cache_home, "cryfs-e2etest", "manifests")) != []
+            # A manifest next to the tar file is used, too
+            manifest.save(manifest_path_for(tar_path))
+            shutil.rmtree(cache_home)
+            assert load_or_create_manifest(tar_path) == manifest
+            assert not os.path.exists(cache_home)
+        finally:
+            if previous is None:
+                del os.environ["XDG_CACHE_HOME"]
+            else:
+                os.environ["XDG_CACHE_HOME"] = previous
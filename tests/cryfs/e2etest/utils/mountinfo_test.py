@@ -0,0 +1,7 @@
+from cryfs.e2etest.utils.mountinfo import parse_mount_points
+
+
+def test_parse_mount_points() -> None:
+    mountinfo = "22 1 8:1 / / rw,relatime shared:1 - ext4 /dev/sda1 rw\n" \
+                "97 22 0:45 / /tmp/my\\040mount rw,nosuid,nodev,relatime shared:50 - fuse.cryfs cryfs@/tmp/base rw,user_id=1000\n"
+    assert parse_mount_points(mountinfo) == ["/", "/tmp/my mount"]
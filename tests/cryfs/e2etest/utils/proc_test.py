@@ -0,0 +1,95 @@
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+from cryfs.e2etest.utils.proc import ProcessMonitor, read_process_usage, wait_for_process_exit
+from cryfs.e2etest.utils.subreaper import release_daemon, subreaper_command
+
+
+def test_read_process_usage_of_own_process() -> None:
+    usage = read_process_usage(os.getpid())
+    assert usage is not None
+    assert usage.peak_rss_bytes > 0
+    assert usage.cpu_time() > 0
+    assert usage.num_samples == 1
+
+
+def test_read_process_usage_of_nonexisting_process() -> None:
+    assert read_process_usage(2 ** 22 + 1) is None
+
+
+def test_process_monitor_keeps_last_usage_after_exit() -> None:
+    process = subprocess.Popen([sys.executable, "-c", "data = bytearray(32 * 1024 * 1024); import time; time.sleep(0.3)"])
+    loop = asyncio.new_event_loop()
+    try:
+        async def monitor_until_exit() -> None:
+            monitor = ProcessMonitor(process.pid, interval=0.01)
+            monitor.start()
+            await loop.run_in_executor(None, process.wait)
+            usage = await monitor.stop()
+            assert usage is not None
+            assert usage.num_samples > 1
+            assert usage.peak_rss_bytes >= 32 * 1024 * 1024
+        loop.run_until_complete(monitor_until_exit())
+    finally:
+        loop.close()
+
+
+# The child writes and burns CPU right before exiting, long after the first sample and before the next one would be taken
+_WRITE_AT_EXIT = """
+import os, sys, tempfile, time
+sys.stdin.read()
+with tempfile.TemporaryFile(dir=sys.argv[1]) as file:
+    file.write(os.urandom(4 * 1024 * 1024))
+    file.flush()
+    os.fsync(file.fileno())
+end = time.process_time() + 0.3
+while time.process_time() < end:
+    pass
+with open("/proc/self/io") as io:
+    print([line.split()[1] for line in io if line.startswith("write_bytes:")][0])
+"""
+
+
+def test_process_monitor_counts_final_writes_of_exited_child() -> None:
+    with tempfile.TemporaryDirectory() as dir:
+        process = subprocess.Popen([sys.executable, "-c", _WRITE_AT_EXIT, dir], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        loop = asyncio.new_event_loop()
+        try:
+            async def monitor_until_exit() -> None:
+                monitor = ProcessMonitor(process.pid, interval=60)
+                monitor.start()
+                assert process.stdin is not None and process.stdout is not None
+                process.stdin.close()
+                await wait_for_process_exit(process.pid)
+                # Not reaped yet, so the last sample sees everything the child did
+                usage = await monitor.stop()
+                assert usage is not None
+                assert usage.num_samples == 2
+                assert usage.cpu_time() >= 0.25
+                assert usage.write_bytes >= int(process.stdout.read())
+            loop.run_until_complete(monitor_until_exit())
+        finally:
+            loop.close()
+            process.wait()
+
+
+def test_daemon_stays_zombie_until_released() -> None:
+    # Like the CryFS daemon: the process that started it exits, and it keeps running in the background
+    command, env = subreaper_command(["sh", "-c", "sleep 0.2 & echo $!"], {"PATH": os.environ["PATH"]})
+    output = subprocess.run(command, env=env, stdout=subprocess.PIPE, check=True, timeout=10).stdout
+    daemon_pid = int(output)
+    with open("/proc/%d/stat" % daemon_pid) as file:
+        helper_pid = int(file.read().rsplit(')', 1)[1].split()[1])
+    # The helper adopted it, not the test process
+    assert helper_pid != os.getpid()
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(wait_for_process_exit(daemon_pid))
+        assert read_process_usage(daemon_pid) is not None
+        release_daemon(daemon_pid)
+        loop.run_until_complete(wait_for_process_exit(helper_pid))
+    finally:
+        loop.close()
+    assert read_process_usage(daemon_pid) is None
@@ -0,0 +1,25 @@
+import os
+import tempfile
+from cryfs.e2etest.utils.snapshot import clone_tree
+
+
+def test_clone_tree() -> None:
+    with tempfile.TemporaryDirectory() as source, tempfile.TemporaryDirectory() as tempdir:
+        os.mkdir(os.path.join(source, "dir"))
+        for i in range(10):
+            with open(os.path.join(source, "dir", "file%d" % i), 'wb') as file:
+                file.write(b"content %d" % i)
+        os.symlink("dir/file0", os.path.join(source, "link"))
+
+        dest = os.path.join(tempdir, "snapshot")
+        clone_tree(source, dest, num_threads=4)
+
+        assert os.readlink(os.path.join(dest, "link")) == "dir/file0"
+        for i in range(10):
+            with open(os.path.join(dest, "dir", "file%d" % i), 'rb') as file:
+                assert file.read() == b"content %d" % i
+        # Modifying the snapshot doesn't modify the source
+        with open(os.path.join(dest, "dir", "file0"), 'wb') as file:
+            file.write(b"modified")
+        with open(os.path.join(source, "dir", "file0"), 'rb') as file:
+            assert file.read() == b"content 0"
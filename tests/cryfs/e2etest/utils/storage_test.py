@@ -0,0 +1,45 @@
+import os
+import tempfile
+from cryfs.e2etest.utils.storage import scan_basedir
+
+
+def _write(path: str, size: int) -> None:
+    with open(path, 'wb') as file:
+        file.write(b'x' * size)
+
+
+def test_scan_basedir_counts_blocks_but_not_config() -> None:
+    with tempfile.TemporaryDirectory() as basedir:
+        _write(os.path.join(basedir, "cryfs.config"), 500)
+        os.mkdir(os.path.join(basedir, "ABC"))
+        _write(os.path.join(basedir, "ABC", "0001"), 32832)
+        _write(os.path.join(basedir, "ABC", "0002"), 32832)
+        _write(os.path.join(basedir, "ABC", "0003"), 100)
+        report = scan_basedir(basedir, plaintext_bytes=40000, daemon_write_bytes=80000)
+    assert report.num_blocks == 3
+    assert report.block_bytes == 2 * 32832 + 100
+    assert report.block_size_histogram == {32832: 2, 100: 1}
+    assert report.bytes_on_disk >= report.block_bytes
+    assert report.overhead_ratio() == report.bytes_on_disk / 40000
+    assert report.write_amplification() == 2.0
+    assert report.to_json()["block_size_histogram"] == {"100": 1, "32832": 2}
+    assert report.to_json()["write_amplification"] == 2.0
+    assert "3 blocks" in report.to_string()
+
+
+def test_scan_basedir_without_daemon_io() -> None:
+    with tempfile.TemporaryDirectory() as basedir:
+        report = scan_basedir(basedir, plaintext_bytes=0)
+    assert report.num_blocks == 0
+    assert report.write_amplification() is None
+
+
+def test_scan_basedir_drops_incomplete_daemon_io() -> None:
+    with tempfile.TemporaryDirectory() as basedir:
+        _write(os.path.join(basedir, "0001"), 32832)
+        # Less than the blocks in the basedir, e.g. on tmpfs without IO accounting
+        report = scan_basedir(basedir, plaintext_bytes=30000, daemon_write_bytes=0)
+    assert report.daemon_write_bytes is None
+    assert report.write_amplification() is None
+    assert "write_amplification" not in report.to_json()
+    assert "write amplification" not in report.to_string()
@@ -0,0 +1,64 @@
+import asyncio
+import os
+import tempfile
+from cryfs.e2etest.stress_test import NUM_SLOTS, _run_workers
+from cryfs.e2etest.test_framework.logger import Logger
+from cryfs.e2etest.utils.stress import (RECORD_SIZE, SHARED_DIR, SHARED_LOG, SHARED_SLOTS, RoundStats, format_scaling, make_record,
+                                        parse_record, prepare_round, round_stats, run_worker, verify_round)
+
+
+def test_record_roundtrip() -> None:
+    record = make_record(3, 1234)
+    assert len(record) == RECORD_SIZE
+    assert parse_record(record) == (3, 1234)
+    assert parse_record(record[:-1] + b"x") is None
+    assert parse_record(bytes(RECORD_SIZE)) is None
+
+
+def test_single_worker_verifies() -> None:
+    with tempfile.TemporaryDirectory() as root:
+        prepare_round(root, NUM_SLOTS)
+        records, errors = run_worker(root, worker=0, num_ops=300, seed=1, num_slots=NUM_SLOTS)
+        assert errors == []
+        assert len(records) == 300
+        assert set(record.op for record in records) >= {"create", "append", "overwrite", "rename", "shared_append", "shared_write"}
+        assert verify_round(root, records, num_workers=1, num_slots=NUM_SLOTS) == []
+
+
+def test_concurrent_workers_verify() -> None:
+    with tempfile.TemporaryDirectory() as root:
+        prepare_round(root, NUM_SLOTS)
+        logger = Logger()
+        records = asyncio.new_event_loop().run_until_complete(_run_workers(root, 3, 200, 5, logger))
+        assert logger.to_string() == ""
+        assert len(records) == 3 * 200
+        assert verify_round(root, records, num_workers=3, num_slots=NUM_SLOTS) == []
+        assert round_stats(records, 3).num_ops == 600
+
+
+def test_detects_corruption() -> None:
+    with tempfile.TemporaryDirectory() as root:
+        prepare_round(root, NUM_SLOTS)
+        records, _ = run_worker(root, worker=0, num_ops=300, seed=2, num_slots=NUM_SLOTS)
+        shared = os.path.join(root, SHARED_DIR)
+
+        # A lost append
+        with open(os.path.join(shared, SHARED_LOG), 'r+b') as file:
+            file.truncate(os.path.getsize(os.path.join(shared, SHARED_LOG)) - RECORD_SIZE)
+        assert len(verify_round(root, records, num_workers=1, num_slots=NUM_SLOTS)) == 1
+
+        # A torn slot
+        with open(os.path.join(shared, SHARED_SLOTS), 'r+b') as file:
+            file.seek(RECORD_SIZE + 10)
+            file.write(b"xxxx")
+        assert any("torn" in error for error in verify_round(root, records, num_workers=1, num_slots=NUM_SLOTS))
+
+        # A lost private write
+        private = [record for record in records if record.op == "append"][-1]
+        del records[records.index(private)]
+        assert any("content" in error or "files" in error for error in verify_round(root, records, num_workers=1, num_slots=NUM_SLOTS))
+
+
+def test_format_scaling() -> None:
+    table = format_scaling([RoundStats(num_workers=1, num_ops=100, duration=1.0), RoundStats(num_workers=2, num_ops=200, duration=1.0)])
+    assert "2.00x" in table
@@ -0,0 +1,70 @@
+from typing import Set
+import os
+import tempfile
+from cryfs.e2etest.utils.synthetic import DatasetShape, SizeDistribution, SyntheticDatasetException, generate_entries, verify_dataset, write_dataset
+
+
+def test_shape_roundtrip() -> None:
+    shape = DatasetShape.parse("files=50,depth=3,fanout=2,sizes=uniform:0:64K,symlinks=0.2,seed=7")
+    assert shape.num_files == 50
+    assert shape.tree_size() == 1 + 2 + 4 + 8
+    assert DatasetShape.parse(shape.to_string()) == shape
+    assert DatasetShape.parse("") == DatasetShape()
+
+
+def test_invalid_shape() -> None:
+    for invalid in ["files", "unknown=1", "files=abc", "sizes=normal:1", "sizes=fixed:1:2", "symlinks=2", "fanout=0"]:
+        try:
+            DatasetShape.parse(invalid)
+            assert False, "Expected exception for %s" % invalid
+        except SyntheticDatasetException:
+            pass
+
+
+def test_generation_is_deterministic() -> None:
+    shape = DatasetShape.parse("files=100,depth=2,fanout=3,symlinks=0.3,seed=1")
+    assert list(generate_entries(shape)) == list(generate_entries(shape))
+    assert list(generate_entries(shape)) != list(generate_entries(DatasetShape.parse("files=100,depth=2,fanout=3,symlinks=0.3,seed=2")))
+
+
+def test_write_and_verify() -> None:
+    shape = DatasetShape(num_files=60, depth=2, fanout=3, sizes=SizeDistribution.parse("lognormal:8K:2:3M"), symlink_ratio=0.2, seed=3)
+    with tempfile.TemporaryDirectory() as dir:
+        stats = write_dataset(shape, dir)
+        assert 0 < stats.num_dirs < shape.tree_size()
+        assert stats.num_files + stats.num_symlinks == 60
+        assert stats.num_symlinks > 0
+        assert verify_dataset(shape, dir) == []
+
+        file = [entry for entry in generate_entries(shape) if entry.type == 'file' and entry.size > 0][0]
+        path = os.path.join(dir, *file.path.split('/'))
+        with open(path, 'r+b') as f:
+            f.seek(file.size - 1)
+            last = f.read(1)
+            f.seek(file.size - 1)
+            f.write(b'\0' if last != b'\0' else b'\1')
+        with open(os.path.join(dir, "extra"), 'wb'):
+            pass
+        errors = verify_dataset(shape, dir)
+        assert len(errors) == 2
+        assert file.path in errors[0] and "differs" in errors[0]
+
+
+def test_only_creates_directories_containing_files() -> None:
+    # The full tree would have 10^8 leaf directories
+    shape = DatasetShape.parse("files=10,depth=8,fanout=10,sizes=fixed:10,seed=5")
+    entries = list(generate_entries(shape))
+    dirs = {entry.path for entry in entries if entry.type == 'dir'}
+    files = [entry.path for entry in entries if entry.type == 'file']
+    assert len(files) == 10
+    assert 0 < len(dirs) <= 10 * 8
+    created: Set[str] = set()
+    for entry in entries:
+        parent = entry.path.rpartition('/')[0]
+        assert parent == '' or parent in created, "%s comes before its parent" % entry.path
+        created.add(entry.path)
+    # Every directory is on the path of a file
+    assert all(any(file.startswith(dir + '/') for file in files) for dir in dirs)
+    with tempfile.TemporaryDirectory() as dir:
+        write_dataset(shape, dir)
+        assert verify_dataset(shape, dir) == []
@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+from cryfs.e2etest.readwrite_test import Fixture, largest_subdirectory
+from cryfs.e2etest.test_framework.dircomp import expect_dir_matches_manifest
+from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.utils.manifest import create_manifest
+from cryfs.e2etest.utils.tar import TarException, TarFile
+from cryfs.e2etest.utils.tar_index import TarIndex, create_tar_index, load_or_create_tar_index, tar_index_path_for
+
+
+def _create_tree(root: str) -> None:
+    os.makedirs(os.path.join(root, "dir", "subdir"))
+    with open(os.path.join(root, "dir", "file"), 'wb') as file:
+        file.write(b"a" * 100000)
+    with open(os.path.join(root, "dir", "subdir", "file"), 'wb') as file:
+        file.write(b"subdir file")
+    with open(os.path.join(root, "other"), 'wb') as file:
+        file.write(b"other file")
+    os.symlink("dir/file", os.path.join(root, "link"))
+    os.link(os.path.join(root, "other"), os.path.join(root, "hardlink"))
+
+
+def _pack(tempdir: str, compress: bool = False) -> TarFile:
+    source = os.path.join(tempdir, "source")
+    os.mkdir(source)
+    _create_tree(source)
+    tar_file = TarFile(os.path.join(tempdir, "data.tar"), parallel_xz=False)
+    tar_file.pack_blocking(source, compress=compress)
+    return tar_file
+
+
+def test_index_lists_members_with_offsets() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        tar_file = _pack(tempdir)
+        index = create_tar_index(tar_file.tar_path)
+        entry = index.find("dir/subdir/file")
+        assert entry is not None and entry.type == 'file' and entry.size == len(b"subdir file")
+        with open(tar_file.tar_path, 'rb') as file:
+            file.seek(entry.offset_data)
+            assert file.read(entry.size) == b"subdir file"
+        assert [e.name for e in index.select(["dir/subdir"])] == [".", "./dir", "./dir/subdir", "./dir/subdir/file"]
+
+
+def test_index_is_cached_outside_the_fixture_directory_and_reused() -> None:
+    with tempfile.TemporaryDirectory() as tempdir, tempfile.TemporaryDirectory() as cache_home:
+        tar_file = _pack(tempdir)
+        previous = os.environ.get("XDG_CACHE_HOME")
+        os.environ["XDG_CACHE_HOME"] = cache_home
+        try:
+            index = load_or_create_tar_index(tar_file.tar_path)
+            assert not os.path.exists(tar_index_path_for(tar_file.tar_path))
+            cached, = os.listdir(os.path.join(cache_home, "cryfs-e2etest", "tar_indices"))
+            assert TarIndex.load(os.path.join(cache_home, "cryfs-e2etest", "tar_indices", cached)) == index
+            assert load_or_create_tar_index(tar_file.tar_path) == index
+        finally:
+            if previous is None:
+                del os.environ["XDG_CACHE_HOME"]
+            else:
+                os.environ["XDG_CACHE_HOME"] = previous
+
+
+def test_unpack_members_only_extracts_selected_members() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        for compress in [False, True]:
+            workdir = os.path.join(tempdir, str(compress))
+            os.mkdir(workdir)
+            tar_file = _pack(workdir, compress)
+            assert (tar_file.index() is None) == compress
+            dest = os.path.join(workdir, "dest")
+            os.mkdir(dest)
+            stats = tar_file.unpack_members_blocking(dest, ["dir/subdir", "link"])
+            # including the parent directories "." and "dir"
+            assert stats.num_members == 5
+            assert sorted(os.listdir(dest)) == ["dir", "link"]
+            assert os.listdir(os.path.join(dest, "dir")) == ["subdir"]
+            with open(os.path.join(dest, "dir", "subdir", "file"), 'rb') as file:
+                assert file.read() == b"subdir file"
+            assert os.readlink(os.path.join(dest, "link")) == "dir/file"
+
+
+def test_unpack_hardlink_without_its_target() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        tar_file = _pack(tempdir)
+        dest = os.path.join(tempdir, "dest")
+        os.mkdir(dest)
+        # "other" is stored as a hardlink to "hardlink", because that one comes first
+        tar_file.unpack_members_blocking(dest, ["other"])
+        assert os.listdir(dest) == ["other"]
+        with open(os.path.join(dest, "other"), 'rb') as file:
+            assert file.read() == b"other file"
+
+
+def test_stale_index_is_detected() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        tar_file = _pack(tempdir)
+        index = create_tar_index(tar_file.tar_path)
+        entry = index.find("dir/subdir/file")
+        assert entry is not None
+        entry.offset_data += 512
+        stat = os.stat(tar_file.tar_path)
+        index.save(tar_index_path_for(tar_file.tar_path))
+        os.utime(tar_file.tar_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        dest = os.path.join(tempdir, "dest")
+        os.mkdir(dest)
+        try:
+            tar_file.unpack_members_blocking(dest, ["dir/subdir/file"])
+            assert False, "Expected TarException"
+        except TarException:
+            pass
+
+
+def test_unpacked_members_match_selected_manifest_entries() -> None:
+    fixture = Fixture(data="fixtures/constructed_data.tar").tar_files()[0]
+    with tempfile.TemporaryDirectory() as tempdir:
+        # Copy the fixture, so its index isn't written to the source tree
+        tar_file = TarFile(os.path.join(tempdir, "data.tar"))
+        shutil.copyfile(fixture, tar_file.tar_path)
+        manifest = create_manifest(tar_file.tar_path)
+        paths = [largest_subdirectory(manifest)]
+        assert paths != [""]
+        dest = os.path.join(tempdir, "dest")
+        os.mkdir(dest)
+        stats = tar_file.unpack_members_blocking(dest, paths)
+        selected = manifest.select(paths)
+        assert 1 < len(selected.entries) < len(manifest.entries)
+        logger = Logger()
+        expect_dir_matches_manifest(selected, dest, logger, compare_modes=True)
+        assert not logger.contains_entry_with_level(LogLevel.ERROR)
+        assert stats.num_bytes == selected.total_file_size()
@@ -0,0 +1,68 @@
+import io
+import os
+import tarfile
+import tempfile
+from cryfs.e2etest.test_framework.dircomp import expect_dir_equals, expect_dir_matches_manifest
+from cryfs.e2etest.test_framework.logger import Logger, LogLevel
+from cryfs.e2etest.utils.manifest import create_manifest
+from cryfs.e2etest.utils.tar import TarFile
+
+
+def _create_tree(root: str) -> None:
+    os.mkdir(os.path.join(root, "dir"))
+    with open(os.path.join(root, "dir", "file"), 'wb') as file:
+        file.write(os.urandom(100000))
+    with open(os.path.join(root, "empty"), 'wb'):
+        pass
+    os.symlink("dir/file", os.path.join(root, "link"))
+    os.chmod(os.path.join(root, "empty"), 0o640)
+
+
+def _roundtrip(compress: bool, parallel_xz: bool, compression: str = 'xz') -> None:
+    with tempfile.TemporaryDirectory() as source, tempfile.TemporaryDirectory() as tempdir, tempfile.TemporaryDirectory() as dest:
+        _create_tree(source)
+        tar_file = TarFile(os.path.join(tempdir, "data.tar"), write_block_size=4096, parallel_xz=parallel_xz)
+        pack_stats = tar_file.pack_blocking(source, compress=compress, compression=compression)
+        unpack_stats = tar_file.unpack_blocking(dest)
+        assert pack_stats.num_bytes == 100000
+        assert unpack_stats.num_bytes == 100000
+        assert unpack_stats.num_members == pack_stats.num_members == 5
+        assert os.stat(os.path.join(dest, "empty")).st_mode & 0o777 == 0o640
+        logger = Logger()
+        expect_dir_equals(source, dest, logger)
+        assert not logger.contains_entry_with_level(LogLevel.ERROR)
+
+
+def test_roundtrip_uncompressed() -> None:
+    _roundtrip(compress=False, parallel_xz=False)
+
+
+def test_roundtrip_compressed() -> None:
+    _roundtrip(compress=True, parallel_xz=False)
+
+
+def test_roundtrip_compressed_with_xz_binary() -> None:
+    _roundtrip(compress=True, parallel_xz=True)
+
+
+def test_roundtrip_compressed_with_zstd() -> None:
+    _roundtrip(compress=True, parallel_xz=False, compression='zstd')
+
+
+def test_owners_are_restored_by_numeric_id() -> None:
+    if os.geteuid() != 0:
+        # Owners are only restored as root
+        return
+    with tempfile.TemporaryDirectory() as tempdir, tempfile.TemporaryDirectory() as dest:
+        tar_path = os.path.join(tempdir, "data.tar")
+        with tarfile.open(tar_path, 'w') as tar:
+            # The names exist on every host, but with other ids
+            member = tarfile.TarInfo("file")
+            member.uid, member.gid, member.uname, member.gname = 1234, 2345, "root", "root"
+            tar.addfile(member, io.BytesIO(b""))
+        TarFile(tar_path).unpack_blocking(dest)
+        file_stat = os.stat(os.path.join(dest, "file"))
+        assert (file_stat.st_uid, file_stat.st_gid) == (1234, 2345)
+        logger = Logger()
+        expect_dir_matches_manifest(create_manifest(tar_path), dest, logger)
+        assert not logger.contains_entry_with_level(LogLevel.ERROR)